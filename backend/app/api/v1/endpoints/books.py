@@ -1,68 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Response,
+    UploadFile,
+    File,
+)
 from pydantic import BaseModel
 from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from app.api.deps import get_current_user
 from app.core.database import get_session
 from app.models.book import Book
 from app.models.user import UserPreference
 from app.services.scoring import calculate_book_score
-from app.services.book_enrichment import get_book_details_hybrid
+from app.services.book_enrichment import get_user_ai_params
+from app.services.enrichment_worker import (
+    ENRICHMENT_PENDING,
+    enrich_book,
+    needs_enrichment,
+    retry_if_stale,
+)
+from app.services.similar_books import (
+    K_INDEX,
+    get_similarity_index,
+    rank_similar,
+    refresh_similarity_index,
+)
+from app.services.text_vectors import get_text_index
 import csv
 import io
+import json
 import time
 from datetime import datetime
 
 router = APIRouter()
 
 
-def _get_ai_params(session: Session, user_id: str):
-    """Helper: Retorna configurações de AI do usuário desserializadas."""
-    from app.core.security import decrypt_value
-
-    pref = session.get(UserPreference, user_id)
-    if not pref:
-        return {}, None, None
-
-    api_keys = {}
-    if pref.openai_key:
-        api_keys["openai_key"] = decrypt_value(pref.openai_key)
-    if pref.gemini_key:
-        api_keys["gemini_key"] = decrypt_value(pref.gemini_key)
-    if pref.groq_key:
-        api_keys["groq_key"] = decrypt_value(pref.groq_key)
-
-    if pref.preferred_provider:
-        api_keys["ai_provider"] = pref.preferred_provider
-
-    return api_keys, pref.custom_prompts, pref.class_categories
-
-
-def _apply_enrichment(book: Book, enrichment: dict):
-    """Helper: Aplica dados da IA no livro se os campos estiverem vazios."""
-    if not enrichment:
-        return
-
-    if not book.author and enrichment.get("author"):
-        book.author = enrichment.get("author")
-    if not book.year and enrichment.get("year"):
-        book.year = enrichment.get("year")
-
-    # Map cover_image (from AI) to cover_image (Book Model)
-    cover_candidate = enrichment.get("cover_image")
-    if not book.cover_image and cover_candidate:
-        book.cover_image = cover_candidate
-
-    if not book.book_class and enrichment.get("book_class"):
-        book.book_class = enrichment.get("book_class")
-    if not book.category and enrichment.get("category"):
-        book.category = enrichment.get("category")
-    if not book.motivation and enrichment.get("motivation"):
-        book.motivation = enrichment.get("motivation")
-    if not book.original_title and enrichment.get("original_title"):
-        book.original_title = enrichment.get("original_title")
-
-
 def _reorder_delete(session: Session, user_id: str, deleted_order: int):
     """Decrementa ordem de todos os livros do USUÁRIO após o deletado."""
     if not deleted_order:
@@ -194,21 +170,17 @@ def get_books(
 @router.post("/", response_model=Book)
 def create_book(
     book: Book,
+    response: Response,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
     user: dict = Depends(get_current_user),
 ):
     user_id = user["id"]
     book.user_id = user_id
 
-    # Populate AI fields if classification not provided
-    if book.title and (not book.book_class or not book.category):
-        api_keys, custom_prompts, class_categories = _get_ai_params(session, user_id)
-
-        enrichment = get_book_details_hybrid(
-            book.title, api_keys, custom_prompts, class_categories
-        )
-
-        _apply_enrichment(book, enrichment)
+    # AI fields are filled in the background when classification is missing
+    pending = needs_enrichment(book)
+    book.enrichment_status = ENRICHMENT_PENDING if pending else None
 
     # Get formula config
     pref = session.get(UserPreference, user_id)
@@ -237,6 +209,12 @@ def create_book(
     session.add(book)
     session.commit()
     session.refresh(book)
+
+    if pending:
+        background_tasks.add_task(enrich_book, book.id, user_id)
+        response.status_code = 202
+    background_tasks.add_task(refresh_similarity_index, user_id)
+
     return book
 
 
@@ -244,6 +222,7 @@ def create_book(
 def update_book(
     book_id: int,
     book_data: Book,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
     user: dict = Depends(get_current_user),
 ):
@@ -291,12 +270,14 @@ def update_book(
     session.add(book)
     session.commit()
     session.refresh(book)
+    background_tasks.add_task(refresh_similarity_index, user_id)
     return book
 
 
 @router.delete("/{book_id}")
 def delete_book(
     book_id: int,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
     user: dict = Depends(get_current_user),
 ):
@@ -307,11 +288,15 @@ def delete_book(
     if book.user_id != user_id:
         raise HTTPException(status_code=403, detail="Acesso negado")
 
+    from app.services.cover_store import detach_cover
+
     deleted_order = book.order
+    detach_cover(session, book_id)
     session.delete(book)
     _reorder_delete(session, user_id, deleted_order)
 
     session.commit()
+    background_tasks.add_task(refresh_similarity_index, user_id)
     return {"ok": True}
 
 
@@ -427,6 +412,52 @@ def export_books_csv(
     )
 
 
+class BulkEnrichRequest(BaseModel):
+    fields: Optional[List[str]] = None
+    workers: Optional[int] = None
+
+
+@router.post("/enrich/bulk")
+def start_bulk_enrichment(
+    request: BulkEnrichRequest,
+    session: Session = Depends(get_session),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Inicia (ou retoma) o backfill de capa, ano, rating e classificação dos
+    livros do usuário que estão com esses campos vazios.
+    """
+    from app.services.bulk_enrichment import (
+        create_or_resume_job,
+        job_progress,
+        start_job_thread,
+    )
+
+    workers = max(1, min(request.workers, 16)) if request.workers else None
+    job = create_or_resume_job(session, user["id"], request.fields, workers)
+    start_job_thread(job.id)
+    return job_progress(job)
+
+
+@router.get("/enrich/bulk")
+def get_bulk_enrichment_status(
+    session: Session = Depends(get_session),
+    user: dict = Depends(get_current_user),
+):
+    """Progresso do último job de backfill (vazão e ETA quando em andamento)."""
+    from app.models.job import EnrichmentJob
+    from app.services.bulk_enrichment import job_progress
+
+    job = session.exec(
+        select(EnrichmentJob)
+        .where(EnrichmentJob.user_id == user["id"])
+        .order_by(EnrichmentJob.id.desc())
+    ).first()
+    if not job:
+        return {"status": "none"}
+    return job_progress(job)
+
+
 class SuggestRequest(BaseModel):
     title: str
     author: Optional[str] = None
@@ -443,7 +474,7 @@ def suggest_book(
     Retorna o objeto com dados preenchidos para o frontend usar.
     """
     user_id = user["id"]
-    api_keys, custom_prompts, class_categories = _get_ai_params(session, user_id)
+    api_keys, custom_prompts, class_categories = get_user_ai_params(session, user_id)
     from app.services.agent import get_book_details_langgraph
 
     enrichment = get_book_details_langgraph(
@@ -462,25 +493,136 @@ def suggest_book(
     return enrichment
 
 
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post("/suggest/stream")
+def suggest_book_stream(
+    request: SuggestRequest,
+    session: Session = Depends(get_session),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Variante em Server-Sent Events de /books/suggest: emite um evento por nó
+    do grafo (fetch_book_data, fetch_ratings, impute_classification,
+    write_motivation) com o delta do estado e um evento final `done`.
+    """
+    from fastapi.responses import StreamingResponse
+    from app.services.agent import stream_book_details_langgraph
+
+    api_keys, custom_prompts, class_categories = get_user_ai_params(
+        session, user["id"]
+    )
+
+    def event_stream():
+        try:
+            for event, data in stream_book_details_langgraph(
+                request.title,
+                request.author,
+                api_keys,
+                custom_prompts,
+                class_categories,
+            ):
+                yield _sse_event(event, data)
+        except Exception as e:
+            yield _sse_event("done", {"error": f"Erro no streaming: {e}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{book_id}/enrichment")
+def get_enrichment_status(
+    book_id: int,
+    session: Session = Depends(get_session),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Status do enriquecimento em background (pending, done, failed) + livro
+    atual. Se o "pending" está parado (background task perdida), roda o
+    enriquecimento nesta requisição.
+    """
+    book = session.get(Book, book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="Livro não encontrado")
+    if book.user_id != user["id"]:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    retry_if_stale(session, book)
+    return {"status": book.enrichment_status, "book": book}
+
+
+@router.get("/{book_id}/similar")
+def get_similar_books(
+    book_id: int,
+    k: int = 10,
+    session: Session = Depends(get_session),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Livros mais parecidos com este na biblioteca do usuário (classe,
+    categoria, tipo, score e ano), lidos do índice kNN por usuário e
+    misturados com o cosseno TF-IDF de título + motivação.
+    """
+    book = session.get(Book, book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="Livro não encontrado")
+    if book.user_id != user["id"]:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    index = get_similarity_index(session, user["id"])
+    text_index = get_text_index(session, user["id"])
+    neighbors = rank_similar(index, book_id, max(1, min(k, K_INDEX)), text_index)
+    if not neighbors:
+        return []
+
+    by_id = {
+        b.id: b
+        for b in session.exec(
+            select(Book).where(Book.id.in_([n[0] for n in neighbors]))
+        ).all()
+    }
+    results = []
+    for neighbor_id, similarity, dist, text_sim in neighbors:
+        neighbor = by_id.get(neighbor_id)
+        if neighbor is None:
+            continue
+        item = neighbor.model_dump()
+        item["similarity"] = round(similarity * 100)
+        item["_distance"] = round(dist, 4)
+        if text_sim is not None:
+            item["_sim_text"] = round(text_sim * 100)
+        results.append(item)
+    return results
+
+
 @router.post("/cover/test")
 async def test_cover_upload(
     file: UploadFile = File(...),
     session: Session = Depends(get_session),
     user: dict = Depends(get_current_user),
 ):
-    from app.core.storage import upload_file_to_bucket
+    from app.core.storage import upload_file_to_bucket_async
+    from app.services.cover_upload import CoverUploadError, hash_upload
 
     try:
         file_ext = (file.filename or "bin").split(".")[-1]
         filename = f"test/{user['id']}/test-{int(time.time())}.{file_ext}"
-        file_content = await file.read()
-        public_url = upload_file_to_bucket(
+        fileobj, _digest = await hash_upload(file)
+        file_content = await run_in_threadpool(fileobj.read)
+        public_url = await upload_file_to_bucket_async(
             "book-covers",
             filename,
             file_content,
             file.content_type or "application/octet-stream",
         )
         return {"ok": True, "public_url": public_url}
+    except CoverUploadError as e:
+        return {"ok": False, "detail": str(e)}
     except Exception as e:
         print(f"Cover test upload error: {e}")
         return {"ok": False, "detail": str(e)}
@@ -493,36 +635,128 @@ async def upload_book_cover(
     session: Session = Depends(get_session),
     user: dict = Depends(get_current_user),
 ):
-    from app.core.storage import upload_file_to_bucket
+    from app.services.cover_store import attach_cover, store_cover_upload
+    from app.services.cover_upload import CoverTooLargeError, CoverUploadError
 
-    book = session.get(Book, book_id)
+    # Endpoint async: a Session é síncrona, então toda consulta vai ao threadpool
+    book = await run_in_threadpool(session.get, Book, book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     if book.user_id != user["id"]:
         raise HTTPException(status_code=403, detail="Acesso negado")
 
     try:
-        file_ext = file.filename.split(".")[-1]
-        filename = f"{user['id']}/{book_id}_{int(time.time())}.{file_ext}"
-        file_content = await file.read()
-
-        # Upload using helper (handles bucket creation)
-        public_url = upload_file_to_bucket(
-            "book-covers",
-            filename,
-            file_content,
-            file.content_type or "application/octet-stream",
-        )
+        # Hash do conteúdo: capa já conhecida não é reprocessada nem reenviada
+        blob = await store_cover_upload(session, file)
+    except CoverTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except CoverUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Upload Error: {e}")
+        return {"ok": False, "detail": str(e)}
 
-        book.cover_image = public_url
-        session.add(book)
+    def _attach() -> Book:
+        attach_cover(session, book, blob)
         session.commit()
         session.refresh(book)
         return book
 
-    except Exception as e:
-        print(f"Upload Error: {e}")
-        return {"ok": False, "detail": str(e)}
+    return await run_in_threadpool(_attach)
+
+
+@router.get("/sprite")
+def get_cover_sprite_manifest(
+    size: int = 120,
+    status: Optional[str] = None,
+    session: Session = Depends(get_session),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Atlas das capas da estante: `image` aponta para um único WebP e `items`
+    traz a posição de cada livro ({x, y, w, h}). Reconstrói só o que mudou.
+    """
+    from app.services.cover_sprites import get_cover_sprite
+
+    query = select(Book).where(Book.user_id == user["id"])
+    if status:
+        query = query.where(Book.status == status)
+    books = session.exec(query.order_by(Book.order)).all()
+
+    manifest = get_cover_sprite(user["id"], size, books, status)
+    return {**manifest, "image": f"/books/sprite/{manifest['version']}.webp"}
+
+
+@router.get("/sprite/{version}.webp")
+def get_cover_sprite_image(version: str):
+    """Imagem do atlas. A versão é um hash do conteúdo: cache imutável."""
+    from fastapi.responses import FileResponse
+    from app.services.cover_cache import get_cover_cache
+    from app.services.cover_sprites import sprite_image_key
+
+    entry = get_cover_cache().lookup(sprite_image_key(version))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Sprite não encontrado")
+    return FileResponse(
+        entry.path,
+        media_type="image/webp",
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{version}"',
+        },
+    )
+
+
+@router.get("/shelf.{fmt}")
+async def get_shelf_image(
+    fmt: str,
+    years: Optional[str] = None,
+    book_class: Optional[str] = None,
+    scale: int = 2,
+    session: Session = Depends(get_session),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Imagem da estante (livros lidos) renderizada no servidor, com os mesmos
+    filtros do exportador: `years=2023,2024` e `book_class=...`.
+    """
+    from fastapi.responses import FileResponse
+    from app.services.shelf_render import FORMATS, get_shelf_image as render
+
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=404, detail="Formato não suportado")
+    try:
+        year_list = [int(y) for y in years.split(",") if y.strip()] if years else []
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Anos inválidos")
+
+    def _read_books() -> list[Book]:
+        return session.exec(
+            select(Book).where(Book.user_id == user["id"], Book.status == "Lido")
+        ).all()
+
+    # Session é síncrona: a consulta não roda no event loop
+    books = await run_in_threadpool(_read_books)
+    if year_list:
+        books = [
+            b
+            for b in books
+            if b.date_read
+            and b.date_read[:4].isdigit()
+            and int(b.date_read[:4]) in year_list
+        ]
+    if book_class and book_class != "all":
+        books = [b for b in books if b.book_class == book_class]
+    # Mais recentes primeiro (sem data de leitura no fim), como na Home
+    books.sort(key=lambda b: b.date_read or "", reverse=True)
+
+    entry = await render(books, fmt, max(1, min(scale, 2)), year_list, book_class)
+    return FileResponse(
+        entry.path,
+        media_type=entry.content_type,
+        filename=f"bookstack-estante.{fmt}",
+        headers={"Cache-Control": "private, max-age=300", "ETag": f'"{entry.etag}"'},
+    )
 
 
 @router.get("/stats/toread")
@@ -655,28 +889,49 @@ def fix_order_consistency(
 def get_recommendations(
     top_n: int = 10,
     min_rating: int = 4,
+    algo: str = "knn",
     session: Session = Depends(get_session),
     current_user=Depends(get_current_user),
 ):
     """
     Retorna até `top_n` livros da fila 'A Ler' ordenados por similaridade
-    com o perfil do usuário (KNN com decaimento temporal).
+    com o perfil do usuário (distância aos perfis, com decaimento temporal).
 
     Parâmetros de query:
     - top_n      (int, padrão 10): número de recomendações
     - min_rating (int, padrão 4) : nota mínima dos lidos usados no perfil
+    - algo       (str, padrão "knn"): "rf" usa o Random Forest por usuário
+      (cai no padrão se ainda não há lidos positivos e negativos suficientes
+      ou enquanto o primeiro modelo treina em background)
     """
-    from app.services.recommendation import get_recommendations as _knn_recommend
+    from app.services.collaborative import get_cf_candidates
+    from app.services.recommendation import recommend_from_state
+    from app.services.recommendation_state import get_recommendation_state
 
-    user_id = current_user.id if hasattr(current_user, "id") else str(current_user)
+    user_id = current_user["id"]
 
-    all_books = session.exec(select(Book).where(Book.user_id == user_id)).all()
+    if algo == "rf":
+        from app.services.recommendation_rf import get_rf_recommendations
 
-    books_dicts = [b.model_dump() for b in all_books]
-
-    try:
-        results = _knn_recommend(books_dicts, top_n=top_n, min_rating=min_rating)
-    except RuntimeError as exc:
-        raise HTTPException(status_code=503, detail=str(exc)) from exc
-
-    return results
+        books = session.exec(select(Book).where(Book.user_id == user_id)).all()
+        try:
+            results = get_rf_recommendations(
+                user_id, [b.model_dump() for b in books], top_n, min_rating
+            )
+        except RuntimeError as exc:
+            raise HTTPException(status_code=503, detail=str(exc)) from exc
+        if results is not None:
+            return results
+    elif algo != "knn":
+        raise HTTPException(status_code=400, detail="algo deve ser 'knn' ou 'rf'")
+
+    # Encoders/matriz/perfis vêm do cache enquanto a biblioteca não mudar
+    state = get_recommendation_state(session, user_id, min_rating)
+    text_index = get_text_index(session, user_id) if state.ready else None
+
+    return recommend_from_state(
+        state,
+        top_n=top_n,
+        text_index=text_index,
+        cf_candidates=get_cf_candidates(user_id),
+    )
@@ -27,6 +27,8 @@ def _update_api_keys(pref: UserPreference, pref_data: UserPreferenceUpdate):
         pref.groq_key = encrypt_value(pref_data.groq_key)
     if pref_data.preferred_provider is not None:
         pref.preferred_provider = pref_data.preferred_provider
+    if pref_data.ai_cache_enabled is not None:
+        pref.ai_cache_enabled = pref_data.ai_cache_enabled
 
 
 def _update_avatar_settings(pref: UserPreference, pref_data: UserPreferenceUpdate):
@@ -141,6 +143,7 @@ def get_preferences(
         avatar_color=pref.avatar_color,
         avatar_bg=pref.avatar_bg,
         preferred_provider=pref.preferred_provider,
+        ai_cache_enabled=pref.ai_cache_enabled,
     )
 
 
@@ -1,90 +1,134 @@
-from fastapi import APIRouter, HTTPException, Response
-from pathlib import Path
-import tempfile
-import hashlib
-import requests
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.services.cover_cache import CacheEntry, get_cover_cache
+from app.services.cover_fetch import ImageFetchError, get_original, get_variant
+from app.services.image_variants import (
+    InvalidVariantError,
+    UnsupportedImageError,
+    normalize_variant,
+)
 
 router = APIRouter()
 
-CACHE_DIR = Path(tempfile.gettempdir()) / "image_cache"
-try:
-    CACHE_DIR.mkdir(exist_ok=True)
-except Exception:
-    pass
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+}
+CHUNK_SIZE = 64 * 1024
+# Até esse tamanho a resposta sai da memória; acima, do descritor já aberto
+INLINE_MAX_BYTES = 1024 * 1024
+# O LRU pode apagar o arquivo entre o lookup e a leitura: busca de novo
+FETCH_ATTEMPTS = 2
+VARIANT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Originais são cacheados por URL: a origem pode trocar a capa, então TTL menor
+ORIGINAL_CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=604800"
+
+
+def _open_entry(entry: CacheEntry) -> tuple:
+    """
+    Abre o arquivo do cache e devolve (bytes, None) para objetos pequenos ou
+    (None, arquivo aberto) para os grandes. Depois de aberto, o descarte pelo
+    LRU (unlink) não afeta a leitura.
+    """
+    fh = open(entry.path, "rb")
+    if entry.size > INLINE_MAX_BYTES:
+        return None, fh
+    with fh:
+        return fh.read(), None
+
+
+def _iter_file(fh):
+    with fh:
+        yield from iter(lambda: fh.read(CHUNK_SIZE), b"")
+
+
+def _cache_headers(entry: CacheEntry, immutable: bool) -> dict:
+    headers = dict(CORS_HEADERS)
+    headers["ETag"] = f'"{entry.etag}"'
+    headers["Last-Modified"] = formatdate(entry.created_at, usegmt=True)
+    headers["Cache-Control"] = (
+        VARIANT_CACHE_CONTROL if immutable else ORIGINAL_CACHE_CONTROL
+    )
+    return headers
 
 
-def _get_cached_image(cache_path: Path, url: str):
-    try:
-        if cache_path.exists():
-            content_type = "image/jpeg"
-            if url.lower().endswith(".png"):
-                content_type = "image/png"
-            elif url.lower().endswith(".webp"):
-                content_type = "image/webp"
-            return Response(content=cache_path.read_bytes(), media_type=content_type)
-    except Exception:
-        pass
-    return None
-
-
-def _fetch_and_cache_image(url: str, cache_path: Path):
-    try:
-        response = requests.get(url, stream=True, timeout=10)
-        if response.status_code != 200:
-            return None, "Failed to fetch image"
+def _is_not_modified(request: Request, entry: CacheEntry) -> bool:
+    """If-None-Match tem precedência; If-Modified-Since só vale sem ele."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {t.strip().removeprefix("W/").strip('"') for t in if_none_match.split(",")}
+        return entry.etag in tags
 
-        content = response.content
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
         try:
-            cache_path.write_bytes(content)
-        except Exception:
-            pass  # ignore cache write errors
-
-        return (
-            Response(
-                content=content,
-                media_type=response.headers.get("Content-Type", "image/jpeg"),
-            ),
-            None,
-        )
-    except Exception as e:
-        return None, str(e)
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(entry.created_at) <= since
+    return False
 
 
 @router.get("/proxy/image")
-async def proxy_image(url: str):
+async def proxy_image(
+    request: Request,
+    url: str,
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    fmt: Optional[str] = None,
+):
     if not url:
         raise HTTPException(status_code=400, detail="URL is required")
 
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    cache_path = CACHE_DIR / url_hash
-
-    # 1. Tenta Cache
-    cached = _get_cached_image(cache_path, url)
-    if cached:
-        cached.headers["Access-Control-Allow-Origin"] = "*"
-        cached.headers["Access-Control-Allow-Methods"] = "GET, OPTIONS"
-        cached.headers["Access-Control-Allow-Headers"] = "*"
-        return cached
+    try:
+        variant = normalize_variant(w, h, fmt)
+    except InvalidVariantError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 2. Busca
-    response, error = _fetch_and_cache_image(url, cache_path)
-    if response:
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Methods"] = "GET, OPTIONS"
-        response.headers["Access-Control-Allow-Headers"] = "*"
-        return response
+    for attempt in range(FETCH_ATTEMPTS):
+        try:
+            # Cache primeiro; na falta, busca (deduplicada) e/ou gera o derivado
+            if variant is None:
+                entry = await get_original(url)
+            else:
+                entry = await get_variant(url, variant)
+
+            # Derivados têm chave própria (url + tamanho + formato): nunca mudam
+            headers = _cache_headers(entry, immutable=variant is not None)
+            if _is_not_modified(request, entry):
+                return Response(status_code=304, headers=headers)
+            content, fh = await run_in_threadpool(_open_entry, entry)
+            break
+        except FileNotFoundError as e:
+            # Descartado pelo LRU no meio do caminho: o próximo lookup falha
+            # e o objeto é baixado/gerado de novo
+            if attempt + 1 == FETCH_ATTEMPTS:
+                raise HTTPException(status_code=502, detail=f"Image cache error: {e}")
+        except UnsupportedImageError as e:
+            raise HTTPException(status_code=415, detail=f"Unsupported image: {e}")
+        except ImageFetchError as e:
+            raise HTTPException(status_code=502, detail=f"Failed to fetch image: {e}")
+        except OSError as e:
+            raise HTTPException(status_code=502, detail=f"Image cache error: {e}")
+
+    if fh is not None:
+        return StreamingResponse(
+            _iter_file(fh), media_type=entry.content_type, headers=headers
+        )
+    return Response(content=content, media_type=entry.content_type, headers=headers)
 
 
 @router.options("/proxy/image")
 async def proxy_image_options():
-    return Response(
-        status_code=200,
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-        },
-    )
+    return Response(status_code=200, headers=CORS_HEADERS)
 
 
 @router.get("/health")
@@ -94,6 +138,9 @@ def health_check():
     from sqlmodel import Session, select
     import os
 
+    from app.services.singleflight import enrichment_flight
+    from app.core.circuit_breaker import breakers
+
     status = {"status": "ok", "database": "unknown", "env_vars": {}}
 
     # 1. Check Database
@@ -126,4 +173,17 @@ def health_check():
                 status["status"] = "error"
         status["env_vars"][var] = masked
 
+    # 3. Enrichment dedup metrics
+    status["singleflight"] = enrichment_flight.stats()
+
+    # 4. Circuit breakers (open = failing fast to cached/partial data),
+    # one combined state per dependency; no per-key detail on a public route
+    status["circuit_breakers"] = breakers.snapshot()
+
+    # 5. Image proxy disk cache (hits/misses/evictions)
+    try:
+        status["image_cache"] = get_cover_cache().stats()
+    except Exception as e:
+        status["image_cache"] = f"error: {str(e)}"
+
     return status
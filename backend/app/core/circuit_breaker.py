@@ -0,0 +1,242 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Estado agregado de uma dependência = o pior entre seus breakers
+_SEVERITY = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """A dependência está com o circuito aberto: falha rápida sem chamar."""
+
+
+def key_fingerprint(secret: Optional[str]) -> str:
+    """Identificador curto e não reversível de uma chave de API."""
+    if not secret:
+        return "nokey"
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:12]
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    Só timeouts, erros de conexão e 5xx indicam dependência degradada.
+    401/403/429 e demais 4xx dizem respeito à chave ou à consulta.
+    """
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None and isinstance(getattr(exc, "code", None), int):
+        status = exc.code  # google.api_core
+    if isinstance(status, int):
+        return status >= 500 or status == 408
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    name = type(exc).__name__.lower()
+    return "timeout" in name or "connection" in name or "deadline" in name
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por dependência (closed → open → half_open → closed).
+
+    - closed: chamadas passam; `failure_threshold` falhas seguidas abrem o circuito.
+    - open: chamadas falham na hora até passar `recovery_timeout` segundos.
+    - half_open: deixa passar até `half_open_max_calls` chamadas de teste;
+      sucesso fecha o circuito, falha reabre.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        dependency: Optional[str] = None,
+    ):
+        self.name = name
+        self.dependency = dependency or name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if (
+            self._state == OPEN
+            and time.monotonic() - self._opened_at >= self.recovery_timeout
+        ):
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+
+    def allow(self) -> bool:
+        """Reserva uma chamada; False significa falhar rápido."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if (
+                self._state == HALF_OPEN
+                and self._half_open_calls < self.half_open_max_calls
+            ):
+                self._half_open_calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open()
+                return
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        """Devolve a reserva de `allow()` sem registrar sucesso nem falha."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def check(self):
+        """Levanta CircuitOpenError se a chamada não for permitida."""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuito aberto para {self.name}")
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._half_open_calls = 0
+            self.rejected = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._maybe_half_open()
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = max(
+                    0.0, self.recovery_timeout - (time.monotonic() - self._opened_at)
+                )
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "rejected": self.rejected,
+                "retry_in_seconds": round(retry_in, 1) if retry_in is not None else None,
+            }
+
+
+class BreakerRegistry:
+    """
+    Breakers por nome, num LRU de até `max_breakers` (há um por chave de API
+    de usuário). Ao passar do limite sai o menos usado que esteja fechado e
+    sem falhas; um circuito aberto só é descartado se não houver outro.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        max_breakers: int = 1024,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_breakers = max_breakers
+        self._breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str, dependency: Optional[str] = None) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is not None:
+                self._breakers.move_to_end(name)
+                return breaker
+            breaker = CircuitBreaker(
+                name,
+                self.failure_threshold,
+                self.recovery_timeout,
+                dependency=dependency,
+            )
+            self._breakers[name] = breaker
+            while len(self._breakers) > self.max_breakers:
+                self._evict_one()
+            return breaker
+
+    def _evict_one(self):
+        for name, breaker in self._breakers.items():
+            snap = breaker.snapshot()
+            if snap["state"] == CLOSED and not snap["consecutive_failures"]:
+                del self._breakers[name]
+                return
+        self._breakers.popitem(last=False)
+
+    def for_key(self, name: str, secret: Optional[str]) -> CircuitBreaker:
+        """Breaker por dependência + chave: uma chave ruim não derruba as outras."""
+        return self.get(f"{name}:{key_fingerprint(secret)}", dependency=name)
+
+    def snapshot(self) -> dict:
+        """
+        Um estado por dependência (o pior entre as chaves), sem expor
+        fingerprints de chave: vai para o /health, que é público.
+        """
+        with self._lock:
+            breakers = list(self._breakers.values())
+        summary: dict[str, dict] = {}
+        for breaker in breakers:
+            snap = breaker.snapshot()
+            dep = summary.setdefault(
+                breaker.dependency,
+                {
+                    "state": CLOSED,
+                    "breakers": 0,
+                    "open": 0,
+                    "rejected": 0,
+                    "retry_in_seconds": None,
+                },
+            )
+            dep["breakers"] += 1
+            dep["rejected"] += snap["rejected"]
+            if _SEVERITY[snap["state"]] > _SEVERITY[dep["state"]]:
+                dep["state"] = snap["state"]
+            if snap["state"] == OPEN:
+                dep["open"] += 1
+                soonest = dep["retry_in_seconds"]
+                if soonest is None or snap["retry_in_seconds"] < soonest:
+                    dep["retry_in_seconds"] = snap["retry_in_seconds"]
+        return summary
+
+
+breakers = BreakerRegistry(
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    recovery_timeout=settings.CIRCUIT_RECOVERY_TIMEOUT,
+    max_breakers=settings.CIRCUIT_MAX_BREAKERS,
+)
@@ -16,8 +16,61 @@ class Settings:
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
     GROQ_API_KEY: str = os.getenv("GROQ_API_KEY")
 
+    # LLM response cache (0 entries disables it)
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2000))
+    LLM_CACHE_TTL_SECONDS: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+
+    # AI provider routing (hedged requests)
+    AI_HEDGE_ENABLED: bool = os.getenv("AI_HEDGE_ENABLED", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    AI_HEDGE_PERCENTILE: float = float(os.getenv("AI_HEDGE_PERCENTILE", 0.9))
+    AI_HEDGE_MIN_DELAY: float = float(os.getenv("AI_HEDGE_MIN_DELAY", 1.5))
+    # Per-call timeout (s) for the AI SDK clients and concurrent calls per provider
+    AI_REQUEST_TIMEOUT: float = float(os.getenv("AI_REQUEST_TIMEOUT", 30))
+    AI_MAX_INFLIGHT_PER_PROVIDER: int = int(
+        os.getenv("AI_MAX_INFLIGHT_PER_PROVIDER", 4)
+    )
+
     # External APIs
     GOOGLE_BOOKS_API_KEY: str = os.getenv("GOOGLE_BOOKS_API_KEY")
+    # Requests per second per host (0 disables the limit)
+    GOOGLE_BOOKS_RATE_LIMIT: float = float(os.getenv("GOOGLE_BOOKS_RATE_LIMIT", 10))
+    OPENLIBRARY_RATE_LIMIT: float = float(os.getenv("OPENLIBRARY_RATE_LIMIT", 3))
+
+    # Base URLs (overridable to point at local stand-in servers)
+    GOOGLE_BOOKS_API_URL: str = os.getenv(
+        "GOOGLE_BOOKS_API_URL", "https://www.googleapis.com/books/v1/volumes"
+    )
+    OPENLIBRARY_API_URL: str = os.getenv(
+        "OPENLIBRARY_API_URL", "https://openlibrary.org/search.json"
+    )
+
+    # Local book catalog (SQLite built by `python -m app.services.catalog ingest`)
+    LOCAL_CATALOG_PATH: str = os.getenv("LOCAL_CATALOG_PATH")
+
+    # Circuit breakers (external metadata + LLM providers)
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+    CIRCUIT_RECOVERY_TIMEOUT: float = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", 30))
+    # Per-API-key breakers kept in memory (least recently used idle ones go first)
+    CIRCUIT_MAX_BREAKERS: int = int(os.getenv("CIRCUIT_MAX_BREAKERS", 1024))
+
+    # Bulk enrichment job
+    BULK_ENRICHMENT_WORKERS: int = int(os.getenv("BULK_ENRICHMENT_WORKERS", 4))
+
+    # Image proxy disk cache (defaults to <tmp>/image_cache, 512 MB)
+    IMAGE_CACHE_DIR: str = os.getenv("IMAGE_CACHE_DIR")
+    IMAGE_CACHE_MAX_BYTES: int = int(
+        os.getenv("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+    )
+
+    # Server-side shelf image rendering (process pool)
+    SHELF_RENDER_WORKERS: int = int(os.getenv("SHELF_RENDER_WORKERS", 2))
+
+    # Random Forest recommender models (defaults to a private <tmp>/rf_models-<uid>)
+    RECOMMENDER_MODEL_DIR: str = os.getenv("RECOMMENDER_MODEL_DIR")
 
     # Email
     SMTP_HOST: str = os.getenv("SMTP_HOST")
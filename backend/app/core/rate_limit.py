@@ -0,0 +1,69 @@
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+from app.core.config import settings
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate` tokens/s com rajada de até `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Bloqueia até haver tokens. Retorna False se estourar o `timeout`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """Um TokenBucket por host; hosts sem configuração não são limitados."""
+
+    def __init__(self):
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host: str, rate: float, capacity: Optional[float] = None):
+        with self._lock:
+            if rate and rate > 0:
+                self._buckets[host] = TokenBucket(rate, capacity)
+            else:
+                self._buckets.pop(host, None)
+
+    def acquire(self, url_or_host: str, timeout: Optional[float] = None) -> bool:
+        host = urlparse(url_or_host).netloc or url_or_host
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            return True
+        return bucket.acquire(timeout=timeout)
+
+
+rate_limiter = HostRateLimiter()
+rate_limiter.configure(
+    urlparse(settings.GOOGLE_BOOKS_API_URL).netloc, settings.GOOGLE_BOOKS_RATE_LIMIT
+)
+rate_limiter.configure(
+    urlparse(settings.OPENLIBRARY_API_URL).netloc, settings.OPENLIBRARY_RATE_LIMIT
+)
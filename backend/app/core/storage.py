@@ -1,3 +1,4 @@
+import httpx
 import requests
 from app.core.config import settings
 
@@ -32,6 +33,60 @@ class SupabaseStorageClient:
                 f"Supabase Storage upload failed: {response.status_code} {response.text}"
             )
 
+        return self.public_url(bucket_name, file_path)
+
+    async def upload_async(
+        self,
+        bucket_name: str,
+        file_path: str,
+        file_content: bytes,
+        content_type: str,
+        upsert: bool = False,
+    ) -> str:
+        """Mesmo upload de `upload`, sem bloquear o event loop."""
+        if not self.is_configured():
+            raise Exception("Supabase Storage not configured")
+
+        async with httpx.AsyncClient(timeout=60) as client:
+            response = await client.post(
+                f"{self.url}/storage/v1/object/{bucket_name}/{file_path}",
+                content=file_content,
+                headers={
+                    "Authorization": f"Bearer {self.key}",
+                    "apikey": self.key,
+                    "Content-Type": content_type,
+                    "Cache-Control": "max-age=31536000",
+                    "x-upsert": "true" if upsert else "false",
+                },
+            )
+
+        if response.status_code >= 400:
+            raise Exception(
+                f"Supabase Storage upload failed: {response.status_code} {response.text}"
+            )
+
+        return self.public_url(bucket_name, file_path)
+
+    def delete(self, bucket_name: str, file_paths: list[str]):
+        if not self.is_configured():
+            raise Exception("Supabase Storage not configured")
+
+        response = requests.delete(
+            f"{self.url}/storage/v1/object/{bucket_name}",
+            json={"prefixes": file_paths},
+            headers={
+                "Authorization": f"Bearer {self.key}",
+                "apikey": self.key,
+            },
+            timeout=60,
+        )
+
+        if response.status_code >= 400:
+            raise Exception(
+                f"Supabase Storage delete failed: {response.status_code} {response.text}"
+            )
+
+    def public_url(self, bucket_name: str, file_path: str) -> str:
         return f"{self.url}/storage/v1/object/public/{bucket_name}/{file_path}"
 
 
@@ -54,3 +109,24 @@ def upload_file_to_bucket(
         raise Exception(
             f"Supabase error: {e} | Key ends with: {storage_client.key[-10:] if storage_client.key else 'None'}"
         )
+
+
+async def upload_file_to_bucket_async(
+    bucket_name: str,
+    file_path: str,
+    file_content: bytes,
+    content_type: str,
+    upsert: bool = False,
+) -> str:
+    """Versão assíncrona de `upload_file_to_bucket` (para rotas `async def`)."""
+    if not storage_client.is_configured():
+        raise Exception("Supabase Storage not configured")
+
+    try:
+        return await storage_client.upload_async(
+            bucket_name, file_path, file_content, content_type, upsert=upsert
+        )
+    except Exception as e:
+        raise Exception(
+            f"Supabase error: {e} | Key ends with: {storage_client.key[-10:] if storage_client.key else 'None'}"
+        )
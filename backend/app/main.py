@@ -47,6 +47,23 @@ def on_startup():
     create_db_and_tables()
     sync_sequences()
 
+    from app.services.bulk_enrichment import resume_interrupted_jobs
+    from app.services.enrichment_worker import resume_stale_enrichments
+    from app.services.recommendation_rf import preload_rf_models
+
+    resume_interrupted_jobs()
+    resume_stale_enrichments()
+    preload_rf_models()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    from app.services.cover_fetch import close_http_client
+    from app.services.shelf_render import shutdown_render_pool
+
+    await close_http_client()
+    shutdown_render_pool()
+
 
 @app.get("/")
 def read_root():
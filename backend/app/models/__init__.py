@@ -1,2 +1,4 @@
 from .book import Book
 from .user import UserPreference, UserPreferenceUpdate, Profile
+from .job import EnrichmentJob
+from .cover import CoverBlob, BookCover
@@ -36,6 +36,7 @@ class Book(SQLModel, table=True):
     score: Optional[float] = 0.0
     motivation: Optional[str] = None
     cover_image: Optional[str] = None
+    enrichment_status: Optional[str] = None  # pending | done | failed
     user_id: Optional[str] = Field(default=None, index=True)
     created_at: DatetimeField = Field(default_factory=datetime.utcnow)
     updated_at: DatetimeField = Field(default_factory=datetime.utcnow)
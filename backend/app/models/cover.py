@@ -0,0 +1,26 @@
+from typing import Dict, Optional
+from sqlmodel import Field, SQLModel, JSON
+from datetime import datetime
+
+
+class CoverBlob(SQLModel, table=True):
+    """Capa armazenada uma única vez, endereçada pelo SHA-256 do arquivo enviado."""
+
+    __tablename__ = "cover_blobs"
+
+    digest: str = Field(primary_key=True, max_length=64)
+    # Tamanho → URL pública ({"l": ..., "m": ..., "s": ...})
+    urls: Dict[str, str] = Field(default={}, sa_type=JSON)
+    size_bytes: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BookCover(SQLModel, table=True):
+    """Referência livro → blob; blobs sem referência são removidos pelo GC."""
+
+    __tablename__ = "book_covers"
+
+    book_id: int = Field(primary_key=True)
+    blob_digest: str = Field(index=True, max_length=64)
+    user_id: str = Field(index=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,28 @@
+from typing import Optional, List
+from sqlmodel import Field, SQLModel, JSON
+from datetime import datetime
+
+
+class EnrichmentJob(SQLModel, table=True):
+    __tablename__ = "enrichment_jobs"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: str = Field(index=True)
+    status: str = Field(default="running")  # running | completed | failed
+    fields: List[str] = Field(default=[], sa_type=JSON)
+    workers: int = Field(default=4)
+
+    total: int = Field(default=0)
+    processed: int = Field(default=0)
+    updated_books: int = Field(default=0)
+    failed: int = Field(default=0)
+    # Checkpoint: ids já processados (retomada após crash)
+    processed_ids: List[int] = Field(default=[], sa_type=JSON)
+    last_error: Optional[str] = None
+    # Lease: instância que está executando o job e até quando vale a posse
+    owner: Optional[str] = None
+    lease_until: Optional[datetime] = None
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
@@ -11,6 +11,7 @@ class UserPreference(SQLModel, table=True):
     gemini_key: Optional[str] = None
     groq_key: Optional[str] = None
     preferred_provider: str = Field(default="groq")
+    ai_cache_enabled: bool = Field(default=True)
     yearly_goal: int = Field(default=20)
     custom_prompts: Dict[str, Any] = Field(default={}, sa_type=JSON)
     formula_config: Dict[str, Any] = Field(default={}, sa_type=JSON)
@@ -40,6 +41,7 @@ class UserPreferenceUpdate(SQLModel):
     gemini_key: Optional[str] = None
     groq_key: Optional[str] = None
     preferred_provider: Optional[str] = None
+    ai_cache_enabled: Optional[bool] = None
     yearly_goal: Optional[int] = None
     custom_prompts: Optional[Dict[str, Any]] = None
     formula_config: Optional[Dict[str, Any]] = None
@@ -2,10 +2,16 @@ import os
 import json
 from typing import TypedDict, Optional
 from langgraph.graph import StateGraph, START, END
-from langchain_groq import ChatGroq
 from langchain_core.prompts import PromptTemplate
 from app.services.metadata import get_google_books_data, get_hybrid_rating, get_openlibrary_data
 from app.services.scoring import CLASS_CATEGORIES
+from app.services.llm_cache import llm_cache, is_cache_enabled
+from app.services.ai_clients import client_registry
+from app.services.singleflight import enrichment_flight, enrichment_key
+from app.core.circuit_breaker import breakers, is_transient_error
+
+CLASSIFICATION_MODEL = "llama-3.3-70b-versatile"
+MOTIVATION_MODEL = "llama-3.1-8b-instant"
 
 class BookGraphState(TypedDict):
     title: str
@@ -41,7 +47,7 @@ def fetch_book_data(state: BookGraphState) -> dict:
         "author": google_data.get("author") or author,
         "year": openlib_data.get("year") or google_data.get("year"),
         "abstract": google_data.get("description", ""),
-        "cover_image": google_data.get("cover_image"),
+        "cover_image": google_data.get("cover_image") or openlib_data.get("cover_image"),
         "original_title": openlib_data.get("original_title") or google_data.get("subtitle", "") or google_data.get("original_title", "") or title,
     }
 
@@ -56,6 +62,14 @@ def fetch_ratings(state: BookGraphState) -> dict:
     return {}
 
 
+def _record_error(breaker, exc: Exception):
+    """Só erros transitórios contam para o circuito; 401/403/429 só liberam a vaga."""
+    if is_transient_error(exc):
+        breaker.record_failure()
+    else:
+        breaker.release()
+
+
 def impute_classification(state: BookGraphState) -> dict:
     if state.get("error"):
         return {}
@@ -65,29 +79,49 @@ def impute_classification(state: BookGraphState) -> dict:
         return {"error": "GROQ_API_KEY não configurada"}
 
     current_mapping = state.get("class_categories") or CLASS_CATEGORIES
+    use_cache = is_cache_enabled(state.get("api_keys"))
+    cache_key = llm_cache.make_key(
+        "agent_classification",
+        state["title"],
+        state.get("abstract"),
+        current_mapping,
+        None,
+        CLASSIFICATION_MODEL,
+    )
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached:
+            return cached
+
     class_categories_str = "\n".join(
         [f"- {cls}: {', '.join(cats)}" for cls, cats in current_mapping.items()]
     )
     valid_classes_str = "\n".join([f"   - {cls}" for cls in current_mapping.keys()])
 
-    llm = ChatGroq(
-        temperature=0.2, groq_api_key=groq_key, model_name="llama-3.3-70b-versatile"
-    ).bind(response_format={"type": "json_object"})
-
-    prompt = PromptTemplate.from_template(
-        "Você é um assistente literário especializado.\n"
-        "LIVRO A ANALISAR:\n"
-        'Título: "{title}"\n'
-        'Resumo: "{abstract}"\n\n'
-        "INSTRUÇÕES OBRIGATÓRIAS:\n"
-        "1. 'book_class': Escolha UMA das classes:\n{valid_classes}\n"
-        "2. 'category': Escolha UMA subcategoria válida para a classe selecionada:\n{class_categories}\n"
-        "3. 'type': 'Técnico' ou 'Não Técnico'\n\n"
-        "Responda APENAS um JSON válido contendo as chaves 'book_class', 'category' e 'type'."
-    )
+    breaker = breakers.for_key("llm_groq", groq_key)
+    if not breaker.allow():
+        return {"error": "Groq indisponível no momento (circuito aberto)"}
 
-    chain = prompt | llm
+    # Tudo depois do allow() fica no try: uma exceção sem record_*/release
+    # deixaria a vaga de teste do half-open reservada para sempre.
     try:
+        llm = client_registry.get(
+            "chat_groq", groq_key, model_name=CLASSIFICATION_MODEL, temperature=0.2
+        ).bind(response_format={"type": "json_object"})
+
+        prompt = PromptTemplate.from_template(
+            "Você é um assistente literário especializado.\n"
+            "LIVRO A ANALISAR:\n"
+            'Título: "{title}"\n'
+            'Resumo: "{abstract}"\n\n'
+            "INSTRUÇÕES OBRIGATÓRIAS:\n"
+            "1. 'book_class': Escolha UMA das classes:\n{valid_classes}\n"
+            "2. 'category': Escolha UMA subcategoria válida para a classe selecionada:\n{class_categories}\n"
+            "3. 'type': 'Técnico' ou 'Não Técnico'\n\n"
+            "Responda APENAS um JSON válido contendo as chaves 'book_class', 'category' e 'type'."
+        )
+
+        chain = prompt | llm
         response = chain.invoke(
             {
                 "title": state["title"],
@@ -97,12 +131,17 @@ def impute_classification(state: BookGraphState) -> dict:
             }
         )
         parsed = json.loads(response.content)
-        return {
+        result = {
             "book_class": parsed.get("book_class"),
             "category": parsed.get("category"),
             "type": parsed.get("type"),
         }
+        breaker.record_success()
+        if use_cache:
+            llm_cache.set(cache_key, result)
+        return result
     except Exception as e:
+        _record_error(breaker, e)
         return {"error": f"Erro de classificação IA: {str(e)}"}
 
 
@@ -114,39 +153,67 @@ def write_motivation(state: BookGraphState) -> dict:
     if not groq_key:
         return {}
 
-    llm = ChatGroq(
-        temperature=0.7, groq_api_key=groq_key, model_name="llama-3.1-8b-instant"
-    ).bind(response_format={"type": "json_object"})
-
-    prompt = PromptTemplate.from_template(
-        "Você é um assistente literário.\n"
-        "LIVRO A ANALISAR:\n"
-        'Título: "{title}"\n'
-        'Resumo: "{abstract}"\n\n'
-        "Escreva 2 a 3 frases diretas e específicas explicando por que ler ESTE livro. "
-        "O que ele ensina de concreto? Foque no diferencial único.\n"
-        "REGRAS VITAIS:\n"
-        "- NÃO repita o nome do livro na resposta.\n"
-        "- NÃO use aspas, nem inicie com 'Este livro...'.\n"
-        "- Escreva em prosa corrida e vá direto ao ponto e ao argumento.\n"
-        "Retorne APENAS um JSON com a chave 'motivation' contendo a sua resposta."
+    use_cache = is_cache_enabled(state.get("api_keys"))
+    cache_key = llm_cache.make_key(
+        "agent_motivation",
+        state["title"],
+        state.get("abstract"),
+        None,
+        None,
+        MOTIVATION_MODEL,
     )
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached:
+            return cached
+
+    breaker = breakers.for_key("llm_groq", groq_key)
+    if not breaker.allow():
+        return {}
 
-    chain = prompt | llm
     try:
+        llm = client_registry.get(
+            "chat_groq", groq_key, model_name=MOTIVATION_MODEL, temperature=0.7
+        ).bind(response_format={"type": "json_object"})
+
+        prompt = PromptTemplate.from_template(
+            "Você é um assistente literário.\n"
+            "LIVRO A ANALISAR:\n"
+            'Título: "{title}"\n'
+            'Resumo: "{abstract}"\n\n'
+            "Escreva 2 a 3 frases diretas e específicas explicando por que ler ESTE livro. "
+            "O que ele ensina de concreto? Foque no diferencial único.\n"
+            "REGRAS VITAIS:\n"
+            "- NÃO repita o nome do livro na resposta.\n"
+            "- NÃO use aspas, nem inicie com 'Este livro...'.\n"
+            "- Escreva em prosa corrida e vá direto ao ponto e ao argumento.\n"
+            "Retorne APENAS um JSON com a chave 'motivation' contendo a sua resposta."
+        )
+
+        chain = prompt | llm
         response = chain.invoke(
             {"title": state["title"], "abstract": str(state.get("abstract", ""))[:1500]}
         )
         parsed = json.loads(response.content)
-        return {"motivation": parsed.get("motivation")}
-    except Exception:
+        result = {"motivation": parsed.get("motivation")}
+        breaker.record_success()
+        if use_cache and result["motivation"]:
+            llm_cache.set(cache_key, result)
+        return result
+    except Exception as e:
+        _record_error(breaker, e)
         return {}
 
 
+# Ramos independentes: dependem apenas de title/abstract vindos de fetch_book_data
+# e rodam em paralelo (fan-out), juntando-se no END.
+PARALLEL_NODES = ["fetch_ratings", "impute_classification", "write_motivation"]
+
+
 def should_continue(state: BookGraphState):
     if state.get("error"):
         return END
-    return "fetch_ratings"
+    return PARALLEL_NODES
 
 
 def build_graph():
@@ -157,23 +224,23 @@ def build_graph():
     builder.add_node("write_motivation", write_motivation)
 
     builder.add_edge(START, "fetch_book_data")
-    builder.add_conditional_edges("fetch_book_data", should_continue)
-    builder.add_edge("fetch_ratings", "impute_classification")
-    builder.add_edge("impute_classification", "write_motivation")
-    builder.add_edge("write_motivation", END)
+    builder.add_conditional_edges(
+        "fetch_book_data", should_continue, PARALLEL_NODES + [END]
+    )
+    for node in PARALLEL_NODES:
+        builder.add_edge(node, END)
 
     return builder.compile()
 
 
-def get_book_details_langgraph(
+def _initial_state(
     title: str,
     author: str = None,
     api_keys: dict = None,
     custom_prompts: dict = None,
     class_categories: dict = None,
 ) -> dict:
-    graph = build_graph()
-    initial_state = {
+    return {
         "title": title,
         "author": author,
         "api_keys": api_keys or {},
@@ -181,8 +248,9 @@ def get_book_details_langgraph(
         "class_categories": class_categories or {},
     }
 
-    result = graph.invoke(initial_state)
 
+def _build_result(result: dict) -> dict:
+    """Converte o estado final do grafo na resposta de /books/suggest."""
     if result.get("error") and not result.get("abstract"):
         return {"error": result["error"]}
 
@@ -203,3 +271,65 @@ def get_book_details_langgraph(
         return {"error": result["error"], "partial_result": ret}
 
     return ret
+
+
+def get_book_details_langgraph(
+    title: str,
+    author: str = None,
+    api_keys: dict = None,
+    custom_prompts: dict = None,
+    class_categories: dict = None,
+) -> dict:
+    key = enrichment_key(
+        "langgraph", title, author, class_categories, custom_prompts, api_keys
+    )
+    return enrichment_flight.do(
+        key,
+        _run_book_details_langgraph,
+        title,
+        author,
+        api_keys,
+        custom_prompts,
+        class_categories,
+    )
+
+
+def _run_book_details_langgraph(
+    title: str,
+    author: str = None,
+    api_keys: dict = None,
+    custom_prompts: dict = None,
+    class_categories: dict = None,
+) -> dict:
+    graph = build_graph()
+    initial_state = _initial_state(
+        title, author, api_keys, custom_prompts, class_categories
+    )
+    result = graph.invoke(initial_state)
+    return _build_result(result)
+
+
+def stream_book_details_langgraph(
+    title: str,
+    author: str = None,
+    api_keys: dict = None,
+    custom_prompts: dict = None,
+    class_categories: dict = None,
+):
+    """
+    Gera (nó, delta) à medida que cada nó do grafo termina e, por último,
+    ("done", resultado final no mesmo formato de get_book_details_langgraph).
+    """
+    graph = build_graph()
+    state = _initial_state(title, author, api_keys, custom_prompts, class_categories)
+
+    for update in graph.stream(state, stream_mode="updates"):
+        for node, delta in update.items():
+            delta = delta or {}
+            state.update(delta)
+            if "abstract" in delta:
+                # O resumo é insumo interno da IA; não precisa ir ao cliente
+                delta = {k: v for k, v in delta.items() if k != "abstract"}
+            yield node, delta
+
+    yield "done", _build_result(state)
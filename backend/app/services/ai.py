@@ -1,40 +1,49 @@
 import json
 import os
 from .scoring import CLASS_CATEGORIES
+from .llm_cache import llm_cache, is_cache_enabled
+from .provider_router import provider_router
+from .ai_clients import REQUEST_TIMEOUT, client_registry
+from app.core.circuit_breaker import is_transient_error
+
+PROVIDER_MODELS = {
+    "groq": "llama-3.3-70b-versatile",
+    "gemini": "gemini-1.5-flash",
+    "openai": "gpt-4o-mini",
+}
 
 
 def get_gemini_classification(prompt, system_prompt, api_keys=None):
     try:
-        import google.generativeai as genai
-
         api_key = (api_keys or {}).get("gemini_key") or os.getenv("GEMINI_API_KEY")
         if not api_key:
             return {"error": "GEMINI_API_KEY não configurada"}
 
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(
-            "gemini-1.5-flash",
+        model = client_registry.get(
+            "gemini",
+            api_key,
+            model_name=PROVIDER_MODELS["gemini"],
             generation_config={"response_mime_type": "application/json"},
         )
 
         full_prompt = f"{system_prompt}\n\nUSER PROMPT:\n{prompt}"
-        response = model.generate_content(full_prompt)
+        response = model.generate_content(
+            full_prompt, request_options={"timeout": REQUEST_TIMEOUT}
+        )
         return json.loads(response.text)
     except Exception as e:
-        return {"error": f"Erro Gemini: {str(e)}"}
+        return {"error": f"Erro Gemini: {str(e)}", "transient": is_transient_error(e)}
 
 
 def get_openai_classification(prompt, system_prompt, api_keys=None):
     try:
-        from openai import OpenAI
-
         api_key = (api_keys or {}).get("openai_key") or os.getenv("OPENAI_API_KEY")
         if not api_key:
             return {"error": "OPENAI_API_KEY não configurada"}
 
-        client = OpenAI(api_key=api_key)
+        client = client_registry.get("openai", api_key)
         response = client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=PROVIDER_MODELS["openai"],
             messages=[
                 {
                     "role": "system",
@@ -47,7 +56,7 @@ def get_openai_classification(prompt, system_prompt, api_keys=None):
         )
         return json.loads(response.choices[0].message.content)
     except Exception as e:
-        return {"error": f"Erro OpenAI: {str(e)}"}
+        return {"error": f"Erro OpenAI: {str(e)}", "transient": is_transient_error(e)}
 
 
 def get_groq_classification(prompt, system_prompt, api_keys=None):
@@ -56,11 +65,9 @@ def get_groq_classification(prompt, system_prompt, api_keys=None):
         return {"error": "GROQ_API_KEY não configurada"}
 
     try:
-        from groq import Groq
-
-        client = Groq(api_key=api_key)
+        client = client_registry.get("groq", api_key)
         response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+            model=PROVIDER_MODELS["groq"],
             messages=[
                 {
                     "role": "system",
@@ -73,7 +80,77 @@ def get_groq_classification(prompt, system_prompt, api_keys=None):
         )
         return json.loads(response.choices[0].message.content)
     except Exception as e:
-        return {"error": f"Erro Groq: {str(e)}"}
+        return {"error": f"Erro Groq: {str(e)}", "transient": is_transient_error(e)}
+
+
+PROVIDER_FUNCS = {
+    "groq": get_groq_classification,
+    "gemini": get_gemini_classification,
+    "openai": get_openai_classification,
+}
+
+PROVIDER_ENV_KEYS = {
+    "groq": ("groq_key", "GROQ_API_KEY"),
+    "gemini": ("gemini_key", "GEMINI_API_KEY"),
+    "openai": ("openai_key", "OPENAI_API_KEY"),
+}
+
+
+def _get_provider_key(name: str, api_keys: dict = None):
+    """
+    Chave do usuário para o provedor, com fallback para a variável global.
+    None para provedores fora do registro (ex.: um provedor falso em testes).
+    """
+    if name not in PROVIDER_ENV_KEYS:
+        return None
+    user_field, env_var = PROVIDER_ENV_KEYS[name]
+    return (api_keys or {}).get(user_field) or os.getenv(env_var)
+
+
+def _cache_model(provider: str) -> str:
+    """Slot `model` da chave de cache: provedor + modelo que respondeu."""
+    return f"{provider}:{PROVIDER_MODELS.get(provider, '?')}"
+
+
+def _provider_keys(providers, api_keys: dict = None) -> dict:
+    """Chave efetiva de cada provedor da cadeia (escopo de breaker e estatísticas)."""
+    return {name: _get_provider_key(name, api_keys) for name, _ in providers}
+
+
+def _resolve_preferred_provider(api_keys: dict = None) -> str:
+    preferred_provider = (api_keys or {}).get("ai_provider", "groq").lower()
+    if preferred_provider not in ["openai", "gemini", "groq"]:
+        preferred_provider = os.getenv("AI_PROVIDER", "groq").lower()
+    return preferred_provider
+
+
+def _build_provider_chain(preferred_provider: str, api_keys: dict = None):
+    """Retorna ([(nome, função)], erros) apenas com provedores que têm chave."""
+    # Ordem de fallback por provedor preferido; o router reordena por saúde
+    p_map = {
+        "gemini": ["gemini", "groq", "openai"],
+        "openai": ["openai", "gemini", "groq"],
+        "groq": ["groq", "gemini", "openai"],
+    }
+    names = p_map.get(preferred_provider, p_map["groq"])
+
+    errors = []
+    providers = []
+    for name in names:
+        if _get_provider_key(name, api_keys):
+            providers.append((name, PROVIDER_FUNCS[name]))
+        else:
+            errors.append(f"{name}: {name.upper()}_API_KEY não configurada")
+    return providers, errors
+
+
+def _format_taxonomy(mapping: dict):
+    """Retorna (lista de classes válidas, classes com suas categorias) para prompts."""
+    valid_classes_str = "\n".join([f"   - {cls}" for cls in mapping.keys()])
+    class_categories_str = "\n".join(
+        [f"- {cls}: {', '.join(cats)}" for cls, cats in mapping.items()]
+    )
+    return valid_classes_str, class_categories_str
 
 
 def get_ai_classification(
@@ -89,10 +166,27 @@ def get_ai_classification(
         else CLASS_CATEGORIES
     )
 
-    class_categories_str = "\n".join(
-        [f"- {cls}: {', '.join(cats)}" for cls, cats in current_mapping.items()]
-    )
-    valid_classes_str = "\n".join([f"   - {cls}" for cls in current_mapping.keys()])
+    preferred_provider = _resolve_preferred_provider(api_keys)
+
+    use_cache = is_cache_enabled(api_keys)
+
+    def cache_key(provider: str) -> str:
+        return llm_cache.make_key(
+            "classification",
+            title,
+            description,
+            current_mapping,
+            custom_prompts,
+            _cache_model(provider),
+        )
+
+    if use_cache:
+        cached = llm_cache.get(cache_key(preferred_provider))
+        if cached:
+            print(f"Classificação em cache para '{title}'")
+            return cached
+
+    valid_classes_str, class_categories_str = _format_taxonomy(current_mapping)
 
     system_prompt = (custom_prompts or {}).get(
         "system_prompt"
@@ -150,44 +244,26 @@ Responda APENAS com um JSON válido:
 }}
 """
 
-    preferred_provider = (api_keys or {}).get("ai_provider", "groq").lower()
-    if preferred_provider not in ["openai", "gemini", "groq"]:
-        preferred_provider = os.getenv("AI_PROVIDER", "groq").lower()
+    providers, errors = _build_provider_chain(preferred_provider, api_keys)
+    if not providers:
+        return {"error": f"Falha em todas as IAs. {' | '.join(errors)}"}
 
-    providers = []
-    # Simplified priority list
-    p_map = {
-        "gemini": [
-            get_gemini_classification,
-            get_groq_classification,
-            get_openai_classification,
-        ],
-        "openai": [
-            get_openai_classification,
-            get_gemini_classification,
-            get_groq_classification,
-        ],
-        "groq": [
-            get_groq_classification,
-            get_gemini_classification,
-            get_openai_classification,
-        ],
-    }
-    providers = p_map.get(preferred_provider, p_map["groq"])
-
-    errors = []
     print(f"Tentando classificar com {preferred_provider.upper()}...")
-
-    for provider_func in providers:
-        res = provider_func(prompt, system_prompt, api_keys)
-        if isinstance(res, dict) and "error" in res:
-            errors.append(f"{provider_func.__name__}: {res['error']}")
-            continue
-        if not res:
-            errors.append(f"{provider_func.__name__}: Retorno vazio")
-            continue
-
-        print(f"Sucesso com {provider_func.__name__}")
-        return res
+    routed = provider_router.route(
+        providers,
+        prompt,
+        system_prompt,
+        api_keys,
+        provider_keys=_provider_keys(providers, api_keys),
+    )
+    errors.extend(routed.errors)
+
+    if routed.ok:
+        print(f"Sucesso com {routed.provider} ({routed.reason})")
+        if use_cache:
+            # Resposta de fallback fica na chave de quem respondeu: não é
+            # servida como se fosse do provedor preferido
+            llm_cache.set(cache_key(routed.provider), routed.result)
+        return routed.result
 
     return {"error": f"Falha em todas as IAs. {' | '.join(errors)}"}
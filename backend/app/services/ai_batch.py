@@ -0,0 +1,224 @@
+"""
+ai_batch.py — Classificação de vários livros em um único prompt.
+
+Empacota N títulos (com resumos cortados) em um prompt estruturado, limitado
+por um orçamento aproximado de tokens, e espera uma lista JSON com uma
+entrada por livro. Cada entrada é validada contra `class_categories`; só as
+que falharem (ausentes ou inválidas) são reenviadas na próxima rodada.
+
+`providers` pode ser passado explicitamente (ex.: um provedor falso e
+determinístico); por padrão usa a mesma cadeia de get_ai_classification, mas
+pelo `batch_router` (sem hedge, estatísticas separadas).
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Optional
+
+from .ai import (
+    _build_provider_chain,
+    _cache_model,
+    _format_taxonomy,
+    _provider_keys,
+    _resolve_preferred_provider,
+)
+from .llm_cache import is_cache_enabled, llm_cache
+from .provider_router import batch_router
+from .scoring import CLASS_CATEGORIES
+
+VALID_TYPES = ("Técnico", "Não Técnico")
+ABSTRACT_CHARS = 400
+CHARS_PER_TOKEN = 4  # estimativa grosseira, suficiente para dividir lotes
+DEFAULT_TOKEN_BUDGET = 6000
+MAX_BOOKS_PER_BATCH = 40
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _book_line(idx: int, book: dict) -> str:
+    abstract = " ".join(str(book.get("description") or "").split())[:ABSTRACT_CHARS]
+    entry = {"id": idx, "title": book.get("title")}
+    if book.get("author"):
+        entry["author"] = book["author"]
+    if abstract:
+        entry["abstract"] = abstract
+    return json.dumps(entry, ensure_ascii=False)
+
+
+def _build_batch_prompt(lines: list[str], mapping: dict) -> str:
+    valid_classes_str, class_categories_str = _format_taxonomy(mapping)
+    books_block = "\n".join(lines)
+    return (
+        "Classifique CADA livro da lista abaixo (um objeto JSON por linha).\n\n"
+        f'1. "book_class": Escolha UMA das classes:\n{valid_classes_str}\n\n'
+        f'2. "category": Escolha UMA categoria válida para a classe:\n{class_categories_str}\n\n'
+        '3. "type": "Técnico" ou "Não Técnico"\n\n'
+        f"LIVROS:\n{books_block}\n\n"
+        'Responda APENAS com um JSON no formato {"results": [{"id": <id>, '
+        '"book_class": "...", "category": "...", "type": "..."}, ...]} '
+        "com exatamente uma entrada por id recebido."
+    )
+
+
+def _pack_batches(
+    pending: list[int], lines: dict[int, str], mapping: dict, token_budget: int
+) -> list[list[int]]:
+    """Agrupa ids em lotes cujo prompt cabe em `token_budget`."""
+    base_tokens = _estimate_tokens(_build_batch_prompt([], mapping))
+    batches: list[list[int]] = []
+    current: list[int] = []
+    used = base_tokens
+    for idx in pending:
+        # entrada + ~20 tokens de resposta por livro
+        cost = _estimate_tokens(lines[idx]) + 20
+        if current and (
+            used + cost > token_budget or len(current) >= MAX_BOOKS_PER_BATCH
+        ):
+            batches.append(current)
+            current, used = [], base_tokens
+        current.append(idx)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _parse_entries(res) -> list:
+    """Aceita uma lista JSON ou um objeto com a lista em "results"/"books"."""
+    if isinstance(res, str):
+        try:
+            res = json.loads(res)
+        except ValueError:
+            return []
+    if isinstance(res, list):
+        return res
+    if isinstance(res, dict):
+        for key in ("results", "books", "items"):
+            if isinstance(res.get(key), list):
+                return res[key]
+    return []
+
+
+def _validate_entry(entry: dict, mapping: dict) -> Optional[dict]:
+    if not isinstance(entry, dict):
+        return None
+    book_class = entry.get("book_class")
+    category = entry.get("category")
+    if book_class not in mapping or category not in mapping[book_class]:
+        return None
+    book_type = entry.get("type")
+    if book_type not in VALID_TYPES:
+        book_type = "Não Técnico"
+    return {"book_class": book_class, "category": category, "type": book_type}
+
+
+def get_ai_batch_classification(
+    books: list[dict],
+    api_keys: dict = None,
+    class_categories: dict = None,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    max_retries: int = 1,
+    providers: list = None,
+) -> list[dict]:
+    """
+    Classifica `books` (dicts com title, author opcional e description) em
+    lotes. Retorna uma lista na mesma ordem: cada item tem book_class,
+    category e type, ou {"error": ...} se não foi possível classificá-lo.
+    """
+    mapping = (
+        class_categories
+        if class_categories and len(class_categories) > 0
+        else CLASS_CATEGORIES
+    )
+    results: list[Optional[dict]] = [None] * len(books)
+    errors: dict[int, str] = {}
+
+    preferred_provider = _resolve_preferred_provider(api_keys)
+    use_cache = is_cache_enabled(api_keys)
+
+    def cache_key(idx: int, provider: str) -> str:
+        # Chave pelo provedor/modelo: fallback não vale pelo preferido
+        return llm_cache.make_key(
+            "batch_classification",
+            books[idx].get("title"),
+            books[idx].get("description"),
+            mapping,
+            None,
+            _cache_model(provider),
+        )
+
+    pending = []
+    for idx, book in enumerate(books):
+        if not book.get("title"):
+            errors[idx] = "Título ausente"
+            continue
+        cached = (
+            llm_cache.get(cache_key(idx, preferred_provider)) if use_cache else None
+        )
+        if cached:
+            results[idx] = cached
+        else:
+            pending.append(idx)
+
+    if providers is None:
+        providers, chain_errors = _build_provider_chain(preferred_provider, api_keys)
+        if not providers:
+            for idx in pending:
+                errors[idx] = " | ".join(chain_errors)
+            pending = []
+
+    system_prompt = "Você é um assistente literário especializado."
+    lines = {idx: _book_line(idx, books[idx]) for idx in pending}
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        failed: list[int] = []
+        for batch in _pack_batches(pending, lines, mapping, token_budget):
+            prompt = _build_batch_prompt([lines[i] for i in batch], mapping)
+            routed = batch_router.route(
+                providers,
+                prompt,
+                system_prompt,
+                api_keys,
+                provider_keys=_provider_keys(providers, api_keys),
+            )
+            if not routed.ok:
+                for idx in batch:
+                    errors[idx] = " | ".join(routed.errors)
+                failed.extend(batch)
+                continue
+
+            expected = set(batch)
+            for entry in _parse_entries(routed.result):
+                idx = entry.get("id") if isinstance(entry, dict) else None
+                if isinstance(idx, str) and idx.isdigit():
+                    idx = int(idx)
+                if idx not in expected:
+                    continue
+                valid = _validate_entry(entry, mapping)
+                if valid:
+                    results[idx] = valid
+                    errors.pop(idx, None)
+                    if use_cache:
+                        llm_cache.set(cache_key(idx, routed.provider), valid)
+                    expected.discard(idx)
+                else:
+                    errors[idx] = "Classe/categoria inválida"
+            for idx in expected:
+                errors.setdefault(idx, "Livro ausente na resposta")
+            failed.extend(expected)
+
+        print(
+            f"Classificação em lote: rodada {attempt + 1}, "
+            f"{len(pending) - len(failed)}/{len(pending)} ok"
+        )
+        pending = failed
+
+    return [
+        res if res is not None else {"error": errors.get(idx, "Não classificado")}
+        for idx, res in enumerate(results)
+    ]
@@ -0,0 +1,109 @@
+"""
+ai_clients.py — Registro de clientes dos SDKs de IA.
+
+Cada SDK (groq, openai, google-generativeai, langchain-groq) é importado só
+no primeiro uso e os clientes são reaproveitados por chave de API
+(já descriptografada), num LRU de até MAX_CLIENTS. O lock cobre só o
+dicionário (consulta/recência e criação), nunca a chamada ao provedor.
+
+Todo cliente sai com timeout explícito (AI_REQUEST_TIMEOUT): o padrão dos
+SDKs chega a 10 min, e uma chamada travada prende uma thread do router. O
+Gemini recebe o timeout por chamada (`request_options`), via
+`REQUEST_TIMEOUT`.
+
+O `genai.configure` do Gemini altera estado global, por isso a configuração
+e a criação do modelo acontecem juntas sob lock e o cliente é fixado no
+modelo no momento da criação.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from app.core.config import settings
+
+MAX_CLIENTS = 256
+REQUEST_TIMEOUT = settings.AI_REQUEST_TIMEOUT
+
+
+def _build_groq(api_key: str, **_opts) -> Any:
+    groq = importlib.import_module("groq")
+    return groq.Groq(api_key=api_key, timeout=REQUEST_TIMEOUT)
+
+
+def _build_openai(api_key: str, **_opts) -> Any:
+    openai = importlib.import_module("openai")
+    return openai.OpenAI(api_key=api_key, timeout=REQUEST_TIMEOUT)
+
+
+def _build_gemini(api_key: str, model_name: str, generation_config: dict = None) -> Any:
+    genai = importlib.import_module("google.generativeai")
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel(model_name, generation_config=generation_config)
+    # Fixa o cliente configurado para esta chave antes que outra requisição
+    # chame `configure` com outra chave.
+    from google.generativeai import client as genai_client
+
+    model._client = genai_client.get_default_generative_client()
+    return model
+
+
+def _build_chat_groq(api_key: str, model_name: str, temperature: float = 0.7) -> Any:
+    langchain_groq = importlib.import_module("langchain_groq")
+    return langchain_groq.ChatGroq(
+        temperature=temperature,
+        groq_api_key=api_key,
+        model_name=model_name,
+        timeout=REQUEST_TIMEOUT,
+    )
+
+
+class ProviderClientRegistry:
+    def __init__(self, max_clients: int = MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._factories: dict[str, Callable[..., Any]] = {
+            "groq": _build_groq,
+            "openai": _build_openai,
+            "gemini": _build_gemini,
+            "chat_groq": _build_chat_groq,
+        }
+        self._clients: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, provider: str, factory: Callable[..., Any]) -> None:
+        """Registra (ou substitui) a fábrica de um provedor."""
+        with self._lock:
+            self._factories[provider] = factory
+            for key in [k for k in self._clients if k[0] == provider]:
+                del self._clients[key]
+
+    @staticmethod
+    def _cache_key(provider: str, api_key: str, opts: dict) -> tuple:
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        return (provider, key_hash, repr(sorted(opts.items())))
+
+    def get(self, provider: str, api_key: str, **opts) -> Any:
+        cache_key = self._cache_key(provider, api_key, opts)
+
+        with self._lock:
+            client = self._clients.get(cache_key)
+            if client is not None:
+                # Usado agora: vai para o fim e não é o próximo a sair
+                self._clients.move_to_end(cache_key)
+            else:
+                client = self._factories[provider](api_key, **opts)
+                self._clients[cache_key] = client
+                while len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            return client
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+
+client_registry = ProviderClientRegistry()
@@ -1,5 +1,74 @@
+from sqlmodel import Session
+from app.models.book import Book
+from app.models.user import UserPreference
 from .metadata import get_google_books_data, get_hybrid_rating
 from .ai import get_ai_classification
+from .singleflight import enrichment_flight, enrichment_key
+
+
+def get_user_ai_params(session: Session, user_id: str):
+    """Retorna (api_keys, custom_prompts, class_categories) do usuário, desserializados."""
+    from app.core.security import decrypt_value
+
+    pref = session.get(UserPreference, user_id)
+    if not pref:
+        return {}, None, None
+
+    api_keys = {}
+    if pref.openai_key:
+        api_keys["openai_key"] = decrypt_value(pref.openai_key)
+    if pref.gemini_key:
+        api_keys["gemini_key"] = decrypt_value(pref.gemini_key)
+    if pref.groq_key:
+        api_keys["groq_key"] = decrypt_value(pref.groq_key)
+
+    if pref.preferred_provider:
+        api_keys["ai_provider"] = pref.preferred_provider
+    if pref.ai_cache_enabled is False:
+        api_keys["ai_cache"] = False
+
+    return api_keys, pref.custom_prompts, pref.class_categories
+
+
+def apply_classification(book: Book, classification: dict) -> bool:
+    """
+    Preenche classe/categoria vazias. `type` sempre tem valor (default do
+    modelo), então acompanha a classificação: só é aplicado quando ela é.
+    """
+    filled = False
+    if not book.book_class and classification.get("book_class"):
+        book.book_class = classification.get("book_class")
+        filled = True
+    if not book.category and classification.get("category"):
+        book.category = classification.get("category")
+        filled = True
+    if filled and classification.get("type"):
+        book.type = classification.get("type")
+    return filled
+
+
+def apply_enrichment(book: Book, enrichment: dict):
+    """Aplica dados da IA no livro apenas nos campos que estiverem vazios."""
+    if not enrichment:
+        return
+
+    if not book.author and enrichment.get("author"):
+        book.author = enrichment.get("author")
+    if not book.year and enrichment.get("year"):
+        book.year = enrichment.get("year")
+
+    # Map cover_image (from AI) to cover_image (Book Model)
+    cover_candidate = enrichment.get("cover_image")
+    if not book.cover_image and cover_candidate:
+        book.cover_image = cover_candidate
+
+    apply_classification(book, enrichment)
+    if not book.motivation and enrichment.get("motivation"):
+        book.motivation = enrichment.get("motivation")
+    if not book.original_title and enrichment.get("original_title"):
+        book.original_title = enrichment.get("original_title")
+    if not book.google_rating and enrichment.get("google_rating"):
+        book.google_rating = enrichment.get("google_rating")
 
 
 def _apply_google_data(result: dict, google_data: dict) -> str:
@@ -35,7 +104,9 @@ def _fill_cover_fallback(result: dict, title: str, google_data: dict) -> None:
         f"Cover not found for '{title}', "
         f"retrying with original title: '{result['original_title']}'"
     )
-    orig_data = get_google_books_data(result["original_title"], result.get("author"))
+    orig_data = get_google_books_data(
+        result["original_title"], result.get("author"), fields=("cover_image",)
+    )
     if not orig_data or not orig_data.get("cover_image"):
         return
 
@@ -49,8 +120,30 @@ def get_book_details_hybrid(
     api_keys: dict = None,
     custom_prompts: dict = None,
     class_categories: dict = None,
+    author: str = None,
 ) -> dict:
     """Solução híbrida: Google Books API + Open Library + Groq AI."""
+    key = enrichment_key(
+        "hybrid", title, author, class_categories, custom_prompts, api_keys
+    )
+    return enrichment_flight.do(
+        key,
+        _run_book_details_hybrid,
+        title,
+        api_keys,
+        custom_prompts,
+        class_categories,
+        author,
+    )
+
+
+def _run_book_details_hybrid(
+    title: str,
+    api_keys: dict = None,
+    custom_prompts: dict = None,
+    class_categories: dict = None,
+    author: str = None,
+) -> dict:
     result = {
         "author": None,
         "year": None,
@@ -64,11 +157,11 @@ def get_book_details_hybrid(
     }
 
     # 1. Fact Data
-    google_data = get_google_books_data(title)
+    google_data = get_google_books_data(title, author)
     description = _apply_google_data(result, google_data) if google_data else ""
 
     # 2. Rating
-    rating_data = get_hybrid_rating(title, result.get("author"))
+    rating_data = get_hybrid_rating(title, author or result.get("author"))
     if rating_data:
         result["google_rating"] = rating_data["average_rating"]
         result["google_ratings_count"] = rating_data.get("ratings_count", 0)
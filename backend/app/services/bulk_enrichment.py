@@ -0,0 +1,376 @@
+"""
+bulk_enrichment.py — Backfill de metadados da biblioteca inteira.
+
+Seleciona os livros do usuário com campos faltando (capa, ano, rating do
+Google, classificação) e os processa em blocos:
+1. Consultas ao Google Books / Open Library em um pool de `workers` threads
+   (o limite por host fica no token bucket de app.core.rate_limit).
+2. Os livros do bloco ainda sem classificação vão em um único prompt
+   (get_ai_batch_classification).
+3. O bloco é salvo e os ids que deram certo entram no checkpoint do job
+   (`EnrichmentJob.processed_ids`); se o processo cair, `resume_interrupted_jobs`
+   continua a partir daí — e os que falharam são tentados de novo.
+
+Cada job tem um lease (`owner` + `lease_until`) tomado por UPDATE condicional
+antes de rodar e renovado a cada bloco: com várias instâncias subindo ao
+mesmo tempo, só uma executa o job; se ela morrer, o lease expira e outra
+retoma.
+
+O progresso (livros/s e ETA) é calculado em `job_progress`.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import update
+from sqlmodel import Session, or_, select
+
+from app.core.config import settings
+from app.core.database import engine
+from app.models.book import Book
+from app.models.job import EnrichmentJob
+from app.models.user import UserPreference
+from .ai_batch import get_ai_batch_classification
+from .book_enrichment import apply_classification, get_user_ai_params
+from .metadata import get_google_books_data, get_openlibrary_data
+from .scoring import calculate_book_score
+
+ENRICHABLE_FIELDS = ["cover_image", "year", "google_rating", "classification"]
+CHUNK_SIZE = 20
+
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# Renovado a cada bloco; precisa ser bem maior que o tempo de um bloco
+JOB_LEASE_SECONDS = 300
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Velocidade da execução atual (não persiste entre reinícios)
+_run_stats: dict[int, dict] = {}
+_run_lock = threading.Lock()
+
+
+def _missing_filter(fields: list[str]):
+    conditions = []
+    if "cover_image" in fields:
+        conditions.append(or_(Book.cover_image.is_(None), Book.cover_image == ""))
+    if "year" in fields:
+        conditions.append(Book.year.is_(None))
+    if "google_rating" in fields:
+        conditions.append(Book.google_rating.is_(None))
+    if "classification" in fields:
+        conditions.append(
+            or_(
+                Book.book_class.is_(None),
+                Book.book_class == "",
+                Book.category.is_(None),
+                Book.category == "",
+            )
+        )
+    return or_(*conditions)
+
+
+def _select_candidate_ids(session: Session, job: EnrichmentJob) -> list[int]:
+    fields = job.fields or ENRICHABLE_FIELDS
+    ids = session.exec(
+        select(Book.id)
+        .where(Book.user_id == job.user_id, _missing_filter(fields))
+        .order_by(Book.id)
+    ).all()
+    done = set(job.processed_ids or [])
+    return [i for i in ids if i not in done]
+
+
+def _lookup_metadata(
+    title: str, author: Optional[str], with_description: bool = True
+) -> dict:
+    """
+    Consulta catálogo local/Google Books e, se faltar ano/rating, Open Library.
+    Sem `with_description` (livro não vai para a IA), um hit completo no
+    catálogo dispensa o Google.
+    """
+    found = {}
+    google_fields = ("author", "year", "cover_image", "average_rating")
+    if with_description:
+        google_fields += ("description",)
+    google_data = get_google_books_data(title, author, google_fields) or {}
+    if google_data:
+        found = {
+            "author": google_data.get("author"),
+            "year": google_data.get("year"),
+            "cover_image": google_data.get("cover_image"),
+            "google_rating": google_data.get("average_rating"),
+            "description": google_data.get("description", ""),
+        }
+    if not found.get("year") or not found.get("google_rating"):
+        openlib_data = get_openlibrary_data(title, author) or {}
+        found["year"] = openlib_data.get("year") or found.get("year")
+        found["google_rating"] = found.get("google_rating") or openlib_data.get(
+            "average_rating"
+        )
+    return found
+
+
+def _apply_metadata(book: Book, found: dict, fields: list[str]) -> bool:
+    changed = False
+    for field in ("cover_image", "year", "google_rating"):
+        if field in fields and not getattr(book, field) and found.get(field):
+            setattr(book, field, found[field])
+            changed = True
+    if not book.author and found.get("author"):
+        book.author = found["author"]
+        changed = True
+    return changed
+
+
+def _needs_classification(book: Book, fields: list[str]) -> bool:
+    return "classification" in fields and not (book.book_class and book.category)
+
+
+def _process_chunk(
+    session: Session,
+    job: EnrichmentJob,
+    ids: list[int],
+    pool: ThreadPoolExecutor,
+    ai_params: tuple,
+    config: Optional[dict],
+) -> None:
+    fields = job.fields or ENRICHABLE_FIELDS
+    books = [session.get(Book, i) for i in ids]
+    books = [b for b in books if b and b.user_id == job.user_id]
+
+    futures = {
+        b.id: pool.submit(
+            _lookup_metadata, b.title, b.author, _needs_classification(b, fields)
+        )
+        for b in books
+    }
+
+    changed_ids = set()
+    failed_ids = set()
+    to_classify = []
+    for book in books:
+        try:
+            found = futures[book.id].result()
+        except Exception as e:
+            job.failed += 1
+            job.last_error = f"{book.title}: {e}"
+            failed_ids.add(book.id)
+            continue
+        if _apply_metadata(book, found, fields):
+            changed_ids.add(book.id)
+        if _needs_classification(book, fields):
+            to_classify.append((book, found.get("description", "")))
+
+    if to_classify:
+        api_keys, _custom_prompts, class_categories = ai_params
+        results = get_ai_batch_classification(
+            [
+                {"title": b.title, "author": b.author, "description": desc}
+                for b, desc in to_classify
+            ],
+            api_keys,
+            class_categories,
+        )
+        for (book, _desc), res in zip(to_classify, results):
+            if res.get("error"):
+                job.failed += 1
+                job.last_error = f"{book.title}: {res['error']}"
+                failed_ids.add(book.id)
+                continue
+            if apply_classification(book, res):
+                changed_ids.add(book.id)
+
+    now = datetime.utcnow()
+    for book in books:
+        if book.id in changed_ids:
+            book.score = calculate_book_score(book, config)
+            book.updated_at = now
+            session.add(book)
+
+    job.processed += len(ids)
+    job.updated_books += len(changed_ids)
+    # Falhas ficam fora do checkpoint: a retomada tenta de novo
+    job.processed_ids = list(job.processed_ids or []) + [
+        i for i in ids if i not in failed_ids
+    ]
+    job.updated_at = now
+    session.add(job)
+    session.commit()
+
+
+def claim_job(session: Session, job_id: int) -> bool:
+    """
+    Toma (ou renova) o lease do job para esta instância. O UPDATE condicional
+    é atômico: só passa se o lease é nosso, não existe ou já expirou.
+    """
+    now = datetime.utcnow()
+    result = session.exec(
+        update(EnrichmentJob)
+        .where(
+            EnrichmentJob.id == job_id,
+            EnrichmentJob.status == JOB_RUNNING,
+            or_(
+                EnrichmentJob.owner == INSTANCE_ID,
+                EnrichmentJob.lease_until.is_(None),
+                EnrichmentJob.lease_until < now,
+            ),
+        )
+        .values(
+            owner=INSTANCE_ID,
+            lease_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+        )
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def run_bulk_enrichment(job_id: int) -> None:
+    """Executa (ou retoma) um job. Feito para rodar em thread separada."""
+    with _run_lock:
+        if job_id in _run_stats:
+            return  # já está rodando neste processo
+        _run_stats[job_id] = {"started": time.monotonic(), "done": 0}
+
+    try:
+        _run_job(job_id)
+    finally:
+        with _run_lock:
+            _run_stats.pop(job_id, None)
+
+
+def _run_job(job_id: int) -> None:
+    with Session(engine) as session:
+        if not claim_job(session, job_id):
+            return  # outra instância está com o job
+        job = session.get(EnrichmentJob, job_id)
+
+        pending = _select_candidate_ids(session, job)
+        job.total = len(job.processed_ids or []) + len(pending)
+        # Falhas anteriores voltam em `pending`: contadores recomeçam do checkpoint
+        job.processed = len(job.processed_ids or [])
+        job.failed = 0
+        session.add(job)
+        session.commit()
+
+        ai_params = get_user_ai_params(session, job.user_id)
+        pref = session.get(UserPreference, job.user_id)
+        config = pref.formula_config if pref else None
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=max(1, job.workers), thread_name_prefix="bulk-enrich"
+            ) as pool:
+                for start in range(0, len(pending), CHUNK_SIZE):
+                    if not claim_job(session, job_id):
+                        print(f"Bulk enrichment job {job_id}: lease perdido")
+                        return
+                    chunk = pending[start : start + CHUNK_SIZE]
+                    _process_chunk(session, job, chunk, pool, ai_params, config)
+                    with _run_lock:
+                        _run_stats[job_id]["done"] += len(chunk)
+            job.status = JOB_COMPLETED
+        except Exception as e:
+            session.rollback()
+            job = session.get(EnrichmentJob, job_id)
+            job.status = JOB_FAILED
+            job.last_error = str(e)
+            print(f"Bulk enrichment job {job_id} falhou: {e}")
+
+        job.finished_at = datetime.utcnow()
+        job.updated_at = job.finished_at
+        job.owner = None
+        job.lease_until = None
+        session.add(job)
+        session.commit()
+
+
+def start_job_thread(job_id: int) -> threading.Thread:
+    thread = threading.Thread(
+        target=run_bulk_enrichment, args=(job_id,), daemon=True, name=f"job-{job_id}"
+    )
+    thread.start()
+    return thread
+
+
+def create_or_resume_job(
+    session: Session,
+    user_id: str,
+    fields: Optional[list[str]] = None,
+    workers: Optional[int] = None,
+) -> EnrichmentJob:
+    """Retorna o job em andamento do usuário ou cria um novo."""
+    job = session.exec(
+        select(EnrichmentJob).where(
+            EnrichmentJob.user_id == user_id, EnrichmentJob.status == JOB_RUNNING
+        )
+    ).first()
+    if job:
+        return job
+
+    valid_fields = [f for f in (fields or ENRICHABLE_FIELDS) if f in ENRICHABLE_FIELDS]
+    job = EnrichmentJob(
+        user_id=user_id,
+        fields=valid_fields or ENRICHABLE_FIELDS,
+        workers=workers or settings.BULK_ENRICHMENT_WORKERS,
+    )
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def resume_interrupted_jobs() -> None:
+    """
+    Retoma jobs que ficaram 'running' quando o processo caiu. Só os que esta
+    instância conseguir reivindicar (lease vencido ou inexistente).
+    """
+    try:
+        with Session(engine) as session:
+            ids = session.exec(
+                select(EnrichmentJob.id).where(EnrichmentJob.status == JOB_RUNNING)
+            ).all()
+            claimed = [job_id for job_id in ids if claim_job(session, job_id)]
+        for job_id in claimed:
+            print(f"Retomando bulk enrichment job {job_id}")
+            start_job_thread(job_id)
+    except Exception as e:
+        print(f"Aviso: Falha ao retomar jobs de enriquecimento: {e}")
+
+
+def job_progress(job: EnrichmentJob) -> dict:
+    """Resumo do job com vazão (livros/s) e ETA (s) da execução atual."""
+    throughput = None
+    eta_seconds = None
+    with _run_lock:
+        run = _run_stats.get(job.id)
+    if run and run["done"]:
+        elapsed = time.monotonic() - run["started"]
+        throughput = run["done"] / elapsed if elapsed > 0 else None
+        remaining = max(0, job.total - job.processed)
+        if throughput:
+            eta_seconds = round(remaining / throughput)
+
+    return {
+        "id": job.id,
+        "status": job.status,
+        "fields": job.fields,
+        "workers": job.workers,
+        "total": job.total,
+        "processed": job.processed,
+        "updated_books": job.updated_books,
+        "failed": job.failed,
+        "percent": round(100 * job.processed / job.total, 1) if job.total else 100.0,
+        "throughput_per_sec": round(throughput, 2) if throughput else None,
+        "eta_seconds": eta_seconds,
+        "last_error": job.last_error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
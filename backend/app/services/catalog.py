@@ -0,0 +1,441 @@
+"""
+catalog.py — Catálogo local de livros (SQLite) para enriquecer sem rede.
+
+Ingestão de um dump da Open Library (works/editions dump, formato
+`type \\t key \\t revision \\t last_modified \\t json`) ou de qualquer catálogo
+TSV (com cabeçalho) / JSONL com as colunas:
+    title, author, year, original_title, cover_id, rating, ratings_count
+
+Works e editions da Open Library só trazem `authors[].key`; os nomes vêm dos
+registros `/type/author` (no próprio dump ou no authors dump, via --authors),
+carregados antes numa tabela `authors`. Sem nome resolvido, a chave do autor
+entra no lugar para que obras homônimas não sejam fundidas.
+
+As entradas são indexadas por título/autor normalizados (sem acento,
+minúsculas), então a consulta é uma busca em índice B-tree. Quando o SQLite
+tem FTS5, uma tabela auxiliar permite achar títulos por tokens se o match
+exato falhar.
+
+Uso:
+    python -m app.services.catalog ingest caminho/do/dump.txt [--db catalog.db]
+        [--authors ol_dump_authors.txt.gz]
+
+`metadata.py` consulta o catálogo (se LOCAL_CATALOG_PATH estiver definido)
+antes de ir à Open Library.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+from app.core.config import settings
+from .llm_cache import normalize_text
+
+BATCH_SIZE = 10_000
+MAX_EXTRA_TOKENS = 1  # tolerância do match por tokens (FTS5)
+OPENLIBRARY_COVER_URL = "https://covers.openlibrary.org/b/id/{cover_id}-L.jpg"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS works (
+    id INTEGER PRIMARY KEY,
+    norm_title TEXT NOT NULL,
+    norm_author TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL,
+    author TEXT,
+    year INTEGER,
+    original_title TEXT,
+    cover_id INTEGER,
+    rating REAL,
+    ratings_count INTEGER,
+    UNIQUE (norm_title, norm_author)
+);
+CREATE TABLE IF NOT EXISTS authors (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS works_fts USING fts5(
+    norm_title, norm_author, content='works', content_rowid='id'
+);
+"""
+
+
+def _has_fts5(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS _fts_probe USING fts5(x)")
+        conn.execute("DROP TABLE _fts_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+_YEAR_RE = re.compile(r"(?<!\d)(\d{4})(?!\d)")
+
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(float(str(value).strip())) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def _to_year(value) -> Optional[int]:
+    """Primeiro ano de 4 dígitos ("c1965", "March 1965", "[1965?]")."""
+    match = _YEAR_RE.search(str(value)) if value not in (None, "") else None
+    return int(match.group(1)) if match else None
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+# ── Leitura dos formatos de entrada ───────────────────────────────────────────
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _iter_openlibrary_docs(path: str, types: tuple) -> Iterator[tuple]:
+    with _open_text(path) as fh:
+        for line in fh:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 5 or parts[0] not in types:
+                continue
+            try:
+                yield parts[1], json.loads(parts[4])
+            except ValueError:
+                continue
+
+
+def _author_keys(doc: dict) -> list[str]:
+    """Works: authors[].author.key; editions: authors[].key."""
+    keys = []
+    for entry in doc.get("authors") or []:
+        if not isinstance(entry, dict):
+            continue
+        ref = entry.get("author", entry)
+        key = ref.get("key") if isinstance(ref, dict) else None
+        if isinstance(key, str) and key:
+            keys.append(key)
+    return keys
+
+
+def _iter_openlibrary_dump(path: str) -> Iterator[dict]:
+    for _key, doc in _iter_openlibrary_docs(path, ("/type/work", "/type/edition")):
+        covers = [c for c in doc.get("covers", []) if isinstance(c, int) and c > 0]
+        yield {
+            "title": doc.get("title"),
+            "author_keys": _author_keys(doc),
+            "year": _to_year(doc.get("first_publish_date") or doc.get("publish_date")),
+            "original_title": doc.get("title"),
+            "cover_id": covers[0] if covers else None,
+        }
+
+
+def load_openlibrary_authors(conn: sqlite3.Connection, path: str) -> int:
+    """Grava chave → nome dos registros `/type/author` do arquivo."""
+    total = 0
+    batch: list[tuple] = []
+    sql = "INSERT OR REPLACE INTO authors (key, name) VALUES (?, ?)"
+    for key, doc in _iter_openlibrary_docs(path, ("/type/author",)):
+        name = (doc.get("name") or "").strip()
+        if not name:
+            continue
+        batch.append((key, name))
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        total += len(batch)
+    conn.commit()
+    return total
+
+
+def _author_resolver(conn: sqlite3.Connection) -> Callable[[list[str]], tuple]:
+    """(autor, autor para o índice) a partir das chaves da Open Library."""
+
+    def resolve(keys: list[str]) -> tuple:
+        names = []
+        for key in keys:
+            row = conn.execute(
+                "SELECT name FROM authors WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[0] not in names:
+                names.append(row[0])
+        if names:
+            author = ", ".join(names)
+            return author, author
+        # Sem nome: a chave separa obras homônimas, mas não casa com consultas
+        return None, " ".join(keys)
+
+    return resolve
+
+
+def _iter_jsonl(path: str) -> Iterator[dict]:
+    with _open_text(path) as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def _iter_tsv(path: str) -> Iterator[dict]:
+    with _open_text(path) as fh:
+        yield from csv.DictReader(fh, delimiter="\t")
+
+
+def _detect_format(path: str) -> str:
+    with _open_text(path) as fh:
+        first = fh.readline()
+    if first.startswith("/type/"):
+        return "openlibrary"
+    if first.lstrip().startswith("{"):
+        return "jsonl"
+    return "tsv"
+
+
+def iter_catalog_records(path: str, fmt: Optional[str] = None) -> Iterator[dict]:
+    fmt = fmt or _detect_format(path)
+    readers = {
+        "openlibrary": _iter_openlibrary_dump,
+        "jsonl": _iter_jsonl,
+        "tsv": _iter_tsv,
+    }
+    return readers[fmt](path)
+
+
+# ── Ingestão ──────────────────────────────────────────────────────────────────
+def _record_row(rec: dict, resolve_authors: Callable = None) -> Optional[tuple]:
+    title = (rec.get("title") or "").strip()
+    if not title:
+        return None
+    author = (rec.get("author") or "").strip() or None
+    index_author = author
+    if not author and rec.get("author_keys") and resolve_authors:
+        author, index_author = resolve_authors(rec["author_keys"])
+    return (
+        normalize_text(title),
+        normalize_text(index_author),
+        title,
+        author,
+        _to_year(rec.get("year")),
+        (rec.get("original_title") or "").strip() or None,
+        _to_int(rec.get("cover_id")) if rec.get("cover_id") else None,
+        _to_float(rec.get("rating")),
+        _to_int(rec.get("ratings_count")) if rec.get("ratings_count") else None,
+    )
+
+
+def ingest(
+    path: str,
+    db_path: str,
+    fmt: Optional[str] = None,
+    authors_path: Optional[str] = None,
+) -> int:
+    """Carrega o arquivo no catálogo (upsert por título/autor). Retorna o total."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(SCHEMA)
+    fts = _has_fts5(conn)
+
+    fmt = fmt or _detect_format(path)
+    resolve_authors = None
+    if fmt == "openlibrary":
+        # 1ª passada: nomes dos autores (authors dump e/ou o próprio arquivo)
+        for source in filter(None, [authors_path, path]):
+            loaded = load_openlibrary_authors(conn, source)
+            print(f"Catálogo: {loaded} autores de {source}")
+        resolve_authors = _author_resolver(conn)
+
+    insert_sql = """
+        INSERT INTO works (norm_title, norm_author, title, author, year,
+                           original_title, cover_id, rating, ratings_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (norm_title, norm_author) DO UPDATE SET
+            year = COALESCE(excluded.year, works.year),
+            original_title = COALESCE(excluded.original_title, works.original_title),
+            cover_id = COALESCE(excluded.cover_id, works.cover_id),
+            rating = COALESCE(excluded.rating, works.rating),
+            ratings_count = COALESCE(excluded.ratings_count, works.ratings_count)
+    """
+
+    total = 0
+    started = time.perf_counter()
+    batch: list[tuple] = []
+    for rec in iter_catalog_records(path, fmt):
+        row = _record_row(rec, resolve_authors)
+        if row is None:
+            continue
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(insert_sql, batch)
+            conn.commit()
+            total += len(batch)
+            batch = []
+            print(f"Catálogo: {total} registros ({time.perf_counter() - started:.0f}s)")
+    if batch:
+        conn.executemany(insert_sql, batch)
+        total += len(batch)
+
+    if fts:
+        conn.executescript(FTS_SCHEMA)
+        conn.execute("INSERT INTO works_fts(works_fts) VALUES ('rebuild')")
+    conn.commit()
+    conn.close()
+    print(f"Catálogo pronto: {total} registros em {time.perf_counter() - started:.1f}s")
+    return total
+
+
+# ── Consulta ──────────────────────────────────────────────────────────────────
+class LocalCatalog:
+    """Leitura somente do catálogo; uma conexão SQLite por thread."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._fts: Optional[bool] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _fts_available(self, conn: sqlite3.Connection) -> bool:
+        if self._fts is None:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'works_fts'"
+            ).fetchone()
+            self._fts = row is not None
+        return self._fts
+
+    def lookup(self, title: str, author: str = None) -> Optional[dict]:
+        norm_title = normalize_text(title)
+        if not norm_title:
+            return None
+        norm_author = normalize_text(author)
+        conn = self._conn()
+
+        rows = conn.execute(
+            "SELECT * FROM works WHERE norm_title = ? LIMIT 20", (norm_title,)
+        ).fetchall()
+
+        if not rows and self._fts_available(conn):
+            tokens = norm_title.split()
+            query = " ".join('"' + t.replace('"', '""') + '"' for t in tokens)
+            candidates = conn.execute(
+                "SELECT w.* FROM works_fts f JOIN works w ON w.id = f.rowid "
+                "WHERE works_fts MATCH ? ORDER BY rank LIMIT 20",
+                (f"norm_title : ({query})",),
+            ).fetchall()
+            # Só aceita títulos quase iguais (ex.: artigo a mais), não qualquer
+            # título que contenha as mesmas palavras.
+            rows = [
+                r
+                for r in candidates
+                if len(r["norm_title"].split()) - len(tokens) <= MAX_EXTRA_TOKENS
+            ]
+
+        if norm_author:
+            # Autor informado e diferente: é outra obra com o mesmo título
+            rows = [
+                r
+                for r in rows
+                if r["norm_author"]
+                and (norm_author in r["norm_author"] or r["norm_author"] in norm_author)
+            ]
+        if not rows:
+            return None
+
+        def _rank(row) -> tuple:
+            return (row["ratings_count"] or 0, row["year"] is not None)
+
+        best = max(rows, key=_rank)
+        return self._to_result(best)
+
+    @staticmethod
+    def _to_result(row) -> dict:
+        result = {"source": "Catálogo local"}
+        if row["year"]:
+            result["year"] = row["year"]
+        if row["original_title"]:
+            result["original_title"] = row["original_title"]
+        if row["author"]:
+            result["author"] = row["author"]
+        if row["cover_id"]:
+            result["cover_image"] = OPENLIBRARY_COVER_URL.format(cover_id=row["cover_id"])
+        if row["rating"] and row["rating"] > 0:
+            result["average_rating"] = round(row["rating"], 2)
+            result["ratings_count"] = row["ratings_count"] or 0
+        return result
+
+
+_catalog: Optional[LocalCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_local_catalog() -> Optional[LocalCatalog]:
+    """Catálogo configurado em LOCAL_CATALOG_PATH, ou None se não houver."""
+    global _catalog
+    path = settings.LOCAL_CATALOG_PATH
+    if not path or not os.path.exists(path):
+        return None
+    with _catalog_lock:
+        if _catalog is None or _catalog.db_path != path:
+            _catalog = LocalCatalog(path)
+        return _catalog
+
+
+def lookup_local_catalog(title: str, author: str = None) -> Optional[dict]:
+    catalog = get_local_catalog()
+    if catalog is None:
+        return None
+    try:
+        return catalog.lookup(title, author)
+    except sqlite3.Error as e:
+        print(f"Erro ao consultar catálogo local: {e}")
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Catálogo local de livros")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest_cmd = sub.add_parser("ingest", help="Importa um dump/TSV/JSONL")
+    ingest_cmd.add_argument("path")
+    ingest_cmd.add_argument("--db", default=settings.LOCAL_CATALOG_PATH or "catalog.db")
+    ingest_cmd.add_argument("--format", choices=["openlibrary", "jsonl", "tsv"])
+    ingest_cmd.add_argument(
+        "--authors", help="Authors dump da Open Library (nomes dos autores)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        ingest(args.path, args.db, args.format, args.authors)
+
+
+if __name__ == "__main__":
+    main()
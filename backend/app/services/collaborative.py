@@ -0,0 +1,442 @@
+"""
+collaborative.py — Filtragem colaborativa entre usuários (job em lote, ALS).
+
+Todo o resto da recomendação é por usuário (conteúdo). Aqui o sinal vem das
+notas de todos os usuários para as mesmas obras:
+
+1. Título → `work_id` (int64): título normalizado (sem acentos, sem
+   subtítulo/pontuação/artigo inicial) com hash blake2b. Edições diferentes
+   do mesmo livro em bibliotecas diferentes caem na mesma obra.
+2. Matriz esparsa usuário × obra (CSR, scipy) com as notas; obras com menos
+   de MIN_WORK_USERS leitores não dizem nada entre usuários e saem.
+3. ALS implícito (Hu, Koren & Volinsky): preferência 1 para nota >=
+   min_rating (0 abaixo), confiança 1 + α·nota/5. Cada meia-iteração resolve
+   os sistemas f×f exatos em blocos de linhas de tamanho parecido (matmul em
+   lote + `np.linalg.solve` em lote), com os blocos distribuídos num
+   ThreadPoolExecutor — o NumPy/BLAS/LAPACK libera o GIL. Linhas muito densas
+   (obra popular) são resolvidas sozinhas com um único produto Wᵀ·W.
+4. Para cada usuário, as TOP_N obras de maior score que ele ainda não avaliou
+   vão para um arquivo compacto (`cf_candidates.npz`: usuários ordenados +
+   indptr + work_ids int64 + scores float32).
+
+`get_recommendations` / `recommend_from_state` misturam esses scores nos
+livros da fila cuja obra está na lista do usuário (ver `get_cf_candidates`).
+
+Uso:
+    python -m app.services.collaborative train [--factors 32] [--iterations 12]
+        [--reg 0.1] [--alpha 20] [--top-n 200] [--workers 4] [--output PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .llm_cache import normalize_text
+
+FACTORS = 32
+ITERATIONS = 12
+REGULARIZATION = 0.1
+ALPHA = 20.0
+TOP_N = 200
+MIN_RATING = 4
+MIN_WORK_USERS = 2  # obra lida por um só usuário não liga ninguém a ninguém
+CHUNK_CELLS = 65536  # linhas × maior linha por bloco (memória ≈ CELLS × f × 4 bytes)
+SCORE_CELLS = 32_000_000  # usuários × obras por bloco no cálculo do top-N
+CANDIDATES_FILE = "cf_candidates.npz"
+
+_SUBTITLE_RE = re.compile(r"\s*[:(\[].*$")
+_NON_WORD_RE = re.compile(r"[^a-z0-9 ]+")
+_LEADING_ARTICLES = ("o ", "a ", "os ", "as ", "the ", "um ", "uma ")
+
+
+# ── Obras ─────────────────────────────────────────────────────────────────────
+def work_key(title: Optional[str]) -> str:
+    """Título canônico: 'O Hobbit: Lá e de Volta Outra Vez' → 'hobbit'."""
+    text = _SUBTITLE_RE.sub("", normalize_text(title))
+    text = " ".join(_NON_WORD_RE.sub(" ", text).split())
+    for article in _LEADING_ARTICLES:
+        if text.startswith(article) and len(text) > len(article):
+            return text[len(article) :]
+    return text
+
+
+@lru_cache(maxsize=200_000)
+def work_id(title: Optional[str]) -> int:
+    """Id compartilhado da obra (int64 estável entre processos); 0 = sem título."""
+    key = work_key(title)
+    if not key:
+        return 0
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True) or 1
+
+
+@dataclass
+class RatingMatrix:
+    users: np.ndarray  # user_id (str) por linha, ordenados
+    works: np.ndarray  # work_id (int64) por coluna
+    ratings: csr_matrix  # float32 usuários × obras (notas 1–5)
+
+
+def build_rating_matrix(
+    rows: Iterable[tuple], min_work_users: int = MIN_WORK_USERS
+) -> RatingMatrix:
+    """(user_id, título, nota) → matriz esparsa. Duplicatas ficam com a maior nota."""
+    user_col, work_col, rating_col = [], [], []
+    for user_id, title, rating in rows:
+        wid = work_id(title)
+        if wid and rating:
+            user_col.append(user_id)
+            work_col.append(wid)
+            rating_col.append(rating)
+
+    users, u_idx = np.unique(np.array(user_col, dtype=str), return_inverse=True)
+    works, w_idx = np.unique(np.array(work_col, dtype=np.int64), return_inverse=True)
+    ratings = np.clip(np.array(rating_col, dtype=np.float32), 1, 5)
+
+    # Mesma obra duas vezes na biblioteca: ordena por nota e fica a maior
+    order = np.lexsort((-ratings, w_idx, u_idx))
+    u_idx, w_idx, ratings = u_idx[order], w_idx[order], ratings[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (u_idx[1:] != u_idx[:-1]) | (w_idx[1:] != w_idx[:-1])
+    u_idx, w_idx, ratings = u_idx[first], w_idx[first], ratings[first]
+
+    # Só obras com leitores suficientes; depois, só usuários que sobraram
+    readers = np.bincount(w_idx, minlength=len(works))
+    keep = readers[w_idx] >= min_work_users
+    u_idx, w_idx, ratings = u_idx[keep], w_idx[keep], ratings[keep]
+    used_users, u_idx = np.unique(u_idx, return_inverse=True)
+    used_works, w_idx = np.unique(w_idx, return_inverse=True)
+
+    matrix = csr_matrix(
+        (ratings, (u_idx, w_idx)),
+        shape=(len(used_users), len(used_works)),
+        dtype=np.float32,
+    )
+    return RatingMatrix(users=users[used_users], works=works[used_works], ratings=matrix)
+
+
+# ── ALS ───────────────────────────────────────────────────────────────────────
+def plan_chunks(indptr: np.ndarray, max_cells: int = CHUNK_CELLS) -> list[np.ndarray]:
+    """
+    Blocos de linhas para os solves. As linhas vão ordenadas pelo número de
+    avaliações, então cada bloco tem tamanhos parecidos e o preenchimento
+    (linhas × maior linha ≤ max_cells) quase não desperdiça memória. Linha
+    densa demais (obra popular) vira um bloco sozinha.
+    """
+    counts = np.diff(indptr)
+    order = np.argsort(counts, kind="stable")
+    chunks, start = [], 0
+    for end in range(1, len(order) + 1):
+        if end - start > 1 and (end - start) * counts[order[end - 1]] > max_cells:
+            chunks.append(order[start : end - 1])
+            start = end - 1
+    if start < len(order):
+        chunks.append(order[start:])
+    return chunks
+
+
+def _solve_chunk(
+    matrix: csr_matrix,
+    other: np.ndarray,
+    base: np.ndarray,
+    out: np.ndarray,
+    rows: np.ndarray,
+    alpha: float,
+    min_rating: float,
+):
+    """
+    Fatores exatos das linhas `rows`:
+    (YᵀY + Yᵀ(Cᵤ − I)Y + λI) xᵤ = YᵀCᵤpᵤ, com Cᵤ − I = α·nota/5 nas avaliadas.
+    Os Yᵀ(Cᵤ − I)Y saem de um único matmul em lote sobre as linhas preenchidas.
+    """
+    starts = matrix.indptr[rows]
+    counts = matrix.indptr[rows + 1] - starts
+    offsets = np.cumsum(counts) - counts
+    pos = np.arange(counts.sum()) - np.repeat(offsets, counts)
+    flat = np.repeat(starts, counts) + pos
+
+    ratings = matrix.data[flat]
+    Y = other[matrix.indices[flat]]
+    extra = alpha * ratings / 5.0  # confiança − 1
+    pref = (ratings >= min_rating).astype(np.float32)
+    W = Y * np.sqrt(extra)[:, None]
+    rhs_terms = Y * ((1.0 + extra) * pref)[:, None]
+
+    if len(rows) == 1:
+        A = (base + W.T @ W)[None]
+        b = rhs_terms.sum(axis=0)[None]
+    else:
+        row_of = np.repeat(np.arange(len(rows)), counts)
+        padded = np.zeros((len(rows), counts.max(), other.shape[1]), dtype=np.float32)
+        padded[row_of, pos] = W
+        A = np.matmul(padded.transpose(0, 2, 1), padded) + base
+        b = np.add.reduceat(rhs_terms, offsets, axis=0)
+    out[rows] = np.linalg.solve(A, b[..., None])[..., 0]
+
+
+def _als_step(
+    matrix: csr_matrix,
+    chunks: list[np.ndarray],
+    other: np.ndarray,
+    out: np.ndarray,
+    pool: ThreadPoolExecutor,
+    reg: float,
+    alpha: float,
+    min_rating: float,
+):
+    base = other.T @ other + reg * np.eye(other.shape[1], dtype=np.float32)
+    futures = [
+        pool.submit(_solve_chunk, matrix, other, base, out, rows, alpha, min_rating)
+        for rows in chunks
+    ]
+    for future in futures:
+        future.result()
+
+
+def train_als(
+    ratings: csr_matrix,
+    factors: int = FACTORS,
+    iterations: int = ITERATIONS,
+    reg: float = REGULARIZATION,
+    alpha: float = ALPHA,
+    min_rating: float = MIN_RATING,
+    workers: Optional[int] = None,
+    seed: int = 42,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Fatores (usuários, obras) em float32. Sem linhas/colunas vazias na matriz."""
+    rng = np.random.default_rng(seed)
+    n_users, n_works = ratings.shape
+    user_factors = np.zeros((n_users, factors), dtype=np.float32)
+    work_factors = (rng.standard_normal((n_works, factors)) * 0.01).astype(np.float32)
+    by_work = ratings.T.tocsr()
+    user_chunks = plan_chunks(ratings.indptr)
+    work_chunks = plan_chunks(by_work.indptr)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for iteration in range(iterations):
+            started = time.perf_counter()
+            _als_step(
+                ratings,
+                user_chunks,
+                work_factors,
+                user_factors,
+                pool,
+                reg,
+                alpha,
+                min_rating,
+            )
+            _als_step(
+                by_work,
+                work_chunks,
+                user_factors,
+                work_factors,
+                pool,
+                reg,
+                alpha,
+                min_rating,
+            )
+            print(
+                f"ALS: iteração {iteration + 1}/{iterations} "
+                f"em {time.perf_counter() - started:.1f}s"
+            )
+    return user_factors, work_factors
+
+
+def top_candidates(
+    ratings: csr_matrix,
+    user_factors: np.ndarray,
+    work_factors: np.ndarray,
+    top_n: int = TOP_N,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(indptr, colunas, scores) das top_n obras não avaliadas de cada usuário."""
+    n_users, n_works = ratings.shape
+    k = min(top_n, n_works)
+    rows_per_block = max(1, SCORE_CELLS // max(n_works, 1))
+    cols = np.empty((n_users, k), dtype=np.int64)
+    scores = np.empty((n_users, k), dtype=np.float32)
+
+    for start in range(0, n_users, rows_per_block):
+        end = min(start + rows_per_block, n_users)
+        block = user_factors[start:end] @ work_factors.T
+        # Já avaliadas não são candidatas
+        lo, hi = ratings.indptr[start], ratings.indptr[end]
+        counts = np.diff(ratings.indptr[start : end + 1])
+        block[np.repeat(np.arange(end - start), counts), ratings.indices[lo:hi]] = -np.inf
+        part = np.argpartition(-block, k - 1, axis=1)[:, :k] if k < n_works else (
+            np.broadcast_to(np.arange(n_works), (end - start, n_works))
+        )
+        part_scores = np.take_along_axis(block, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        cols[start:end] = np.take_along_axis(part, order, axis=1)
+        scores[start:end] = np.take_along_axis(part_scores, order, axis=1)
+
+    # Compacta: descarta as posições -inf (usuário já avaliou quase tudo)
+    valid = np.isfinite(scores)
+    indptr = np.concatenate([[0], np.cumsum(valid.sum(axis=1))]).astype(np.int64)
+    return indptr, cols[valid], scores[valid]
+
+
+def default_candidates_path() -> Path:
+    from .recommendation_rf import model_dir
+
+    return model_dir() / CANDIDATES_FILE
+
+
+def write_candidates(
+    path: Path,
+    matrix: RatingMatrix,
+    indptr: np.ndarray,
+    cols: np.ndarray,
+    scores: np.ndarray,
+):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp.npz")
+    np.savez_compressed(
+        tmp_path,
+        users=matrix.users,
+        indptr=indptr,
+        works=matrix.works[cols],
+        scores=scores,
+    )
+    tmp_path.replace(path)
+
+
+def run_batch(
+    rows: Iterable[tuple],
+    output: Optional[Path] = None,
+    factors: int = FACTORS,
+    iterations: int = ITERATIONS,
+    reg: float = REGULARIZATION,
+    alpha: float = ALPHA,
+    top_n: int = TOP_N,
+    workers: Optional[int] = None,
+) -> dict:
+    """Job completo: notas → matriz → ALS → candidatos no disco."""
+    started = time.perf_counter()
+    matrix = build_rating_matrix(rows)
+    n_users, n_works = matrix.ratings.shape
+    summary = {"users": n_users, "works": n_works, "ratings": int(matrix.ratings.nnz)}
+    if not n_users or not n_works:
+        summary["skipped"] = "sem obras em comum entre usuários"
+        return summary
+
+    user_factors, work_factors = train_als(
+        matrix.ratings, factors, iterations, reg, alpha, MIN_RATING, workers
+    )
+    indptr, cols, scores = top_candidates(
+        matrix.ratings, user_factors, work_factors, top_n
+    )
+    path = Path(output) if output else default_candidates_path()
+    write_candidates(path, matrix, indptr, cols, scores)
+    summary.update(
+        candidates=int(len(cols)),
+        path=str(path),
+        seconds=round(time.perf_counter() - started, 1),
+    )
+    return summary
+
+
+# ── Leitura dos candidatos (API) ──────────────────────────────────────────────
+class CFCandidateStore:
+    """Candidatos do último job, recarregados quando o arquivo muda."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._data: Optional[dict] = None
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Optional[dict]:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            if self._mtime != mtime:
+                try:
+                    with np.load(self.path) as npz:
+                        self._data = {key: npz[key] for key in npz.files}
+                    self._mtime = mtime
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"CF: falha ao carregar {self.path.name}: {e}")
+                    return None
+            return self._data
+
+    def get(self, user_id: str) -> dict[int, float]:
+        """{work_id: score normalizado 0–1} do usuário (vazio se não há job/usuário)."""
+        data = self._load()
+        if data is None:
+            return {}
+        users = data["users"]
+        row = int(np.searchsorted(users, user_id))
+        if row >= len(users) or users[row] != user_id:
+            return {}
+        lo, hi = data["indptr"][row], data["indptr"][row + 1]
+        scores = data["scores"][lo:hi]
+        if not len(scores) or scores[0] <= 0:
+            return {}
+        scaled = np.clip(scores / scores[0], 0.0, 1.0)  # o primeiro é o maior
+        return dict(zip(data["works"][lo:hi].tolist(), scaled.tolist()))
+
+
+cf_candidates = CFCandidateStore(default_candidates_path())
+
+
+def get_cf_candidates(user_id: str) -> dict[int, float]:
+    return cf_candidates.get(user_id)
+
+
+def main(argv: Optional[list] = None):
+    from sqlmodel import Session, select
+
+    from app.core.database import engine
+    from app.models.book import Book
+
+    parser = argparse.ArgumentParser(description="Filtragem colaborativa (ALS)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_cmd = sub.add_parser("train", help="Treina o ALS e grava os candidatos")
+    train_cmd.add_argument("--factors", type=int, default=FACTORS)
+    train_cmd.add_argument("--iterations", type=int, default=ITERATIONS)
+    train_cmd.add_argument("--reg", type=float, default=REGULARIZATION)
+    train_cmd.add_argument("--alpha", type=float, default=ALPHA)
+    train_cmd.add_argument("--top-n", type=int, default=TOP_N)
+    train_cmd.add_argument("--workers", type=int, default=None)
+    train_cmd.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        with Session(engine) as session:
+            rows = session.exec(
+                select(Book.user_id, Book.title, Book.rating)
+                .where(Book.rating > 0)
+                .execution_options(yield_per=50_000)
+            )
+            summary = run_batch(
+                rows,
+                args.output,
+                args.factors,
+                args.iterations,
+                args.reg,
+                args.alpha,
+                args.top_n,
+                args.workers,
+            )
+        print(summary)
+
+
+if __name__ == "__main__":
+    main()
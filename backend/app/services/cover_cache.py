@@ -0,0 +1,193 @@
+"""
+cover_cache.py — Cache em disco das capas servidas por /proxy/image.
+
+- Arquivos em diretórios particionados (`ab/cd/<sha256>`), nunca num
+  diretório plano.
+- Índice SQLite (`index.db`) com content type, tamanho, ETag, data de
+  criação e último acesso de cada objeto — nada de adivinhar o tipo pela URL.
+- Escrita atômica: o conteúdo vai para um temporário no mesmo diretório e
+  só é publicado com `os.replace` + registro no índice.
+- Descarte LRU (por último acesso) quando o total passa de `max_bytes`.
+
+Os métodos são síncronos (I/O de disco); no event loop, chame via threadpool.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+
+EVICT_TARGET_RATIO = 0.9  # ao estourar, libera até 90% do orçamento
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    path: Path
+    content_type: str
+    size: int
+    etag: str
+    created_at: float
+    last_access: float
+
+
+def cache_key(*parts: str) -> str:
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class CoverCache:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            str(self.root / "index.db"), check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                content_type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)"
+        )
+        row = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        self._total_bytes = row[0]
+
+    # ── Caminhos ──────────────────────────────────────────────────────────
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:4] / key
+
+    def temp_path(self, key: str) -> Path:
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+
+    # ── Leitura ───────────────────────────────────────────────────────────
+    def lookup(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_type, size, etag, created_at FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+            path = self.path_for(key)
+            if row is None or not path.exists():
+                if row is not None:
+                    self._drop(key, row[1])
+                self.misses += 1
+                return None
+
+            now = time.time()
+            self._db.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+            return CacheEntry(key, path, row[0], row[1], row[2], row[3], now)
+
+    # ── Escrita ───────────────────────────────────────────────────────────
+    def commit(
+        self, key: str, tmp_path: Path, content_type: str, etag: Optional[str] = None
+    ) -> CacheEntry:
+        """Publica `tmp_path` como o objeto `key` (rename atômico + índice)."""
+        size = tmp_path.stat().st_size
+        if etag is None:
+            etag = _file_digest(tmp_path)
+        path = self.path_for(key)
+        now = time.time()
+
+        with self._lock:
+            old = self._db.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            os.replace(tmp_path, path)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, content_type, size, etag, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, content_type, size, etag, now, now),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict_locked(keep=key)
+
+        return CacheEntry(key, path, content_type, size, etag, now, now)
+
+    # ── Descarte ──────────────────────────────────────────────────────────
+    def _drop(self, key: str, size: int):
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._total_bytes -= size
+        try:
+            self.path_for(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _evict_locked(self, keep: Optional[str] = None):
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        rows = self._db.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall()
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            if key == keep:
+                continue
+            self._drop(key, size)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return {
+                "entries": count,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+_cover_cache: Optional[CoverCache] = None
+_cover_cache_lock = threading.Lock()
+
+
+def get_cover_cache() -> CoverCache:
+    global _cover_cache
+    with _cover_cache_lock:
+        if _cover_cache is None:
+            root = settings.IMAGE_CACHE_DIR or str(
+                Path(tempfile.gettempdir()) / "image_cache"
+            )
+            _cover_cache = CoverCache(Path(root), settings.IMAGE_CACHE_MAX_BYTES)
+        return _cover_cache
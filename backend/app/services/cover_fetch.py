@@ -0,0 +1,148 @@
+"""
+cover_fetch.py — Busca de capas remotas para o `cover_cache`.
+
+Usado por /proxy/image, pelo atlas de capas e pela imagem da estante, que
+assim compartilham o mesmo cache, o mesmo cliente HTTP e a mesma
+deduplicação de downloads em andamento:
+
+- `get_original(url)`: capa original (baixada em streaming se faltar).
+- `get_variant(url, variant)`: derivado redimensionado/convertido.
+- `fetch_cover_paths(urls)`: várias originais em paralelo, sem levantar erro
+  (capa que falhou vira None).
+
+Tudo async e no event loop da aplicação; código síncrono rodando no
+threadpool do FastAPI chama via `anyio.from_thread.run`.
+"""
+
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from .cover_cache import CacheEntry, cache_key, get_cover_cache
+from .image_variants import UnsupportedImageError, render_variant, variant_suffix
+from .singleflight import AsyncSingleFlight
+
+CHUNK_SIZE = 64 * 1024
+FETCH_CONCURRENCY = 8
+
+_http_client: Optional[httpx.AsyncClient] = None
+# Downloads/renders em andamento por chave de cache
+fetch_flight = AsyncSingleFlight()
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=10, follow_redirects=True)
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _guess_content_type(url: str) -> str:
+    if url.lower().endswith(".png"):
+        return "image/png"
+    if url.lower().endswith(".webp"):
+        return "image/webp"
+    return "image/jpeg"
+
+
+async def _download_to_cache(url: str, key: str) -> CacheEntry:
+    """Baixa a imagem em streaming para um temporário e publica no cache."""
+    cache = get_cover_cache()
+    tmp_path = await run_in_threadpool(cache.temp_path, key)
+    client = _get_http_client()
+    digest = hashlib.sha256()
+    try:
+        async with client.stream("GET", url) as response:
+            if response.status_code != 200:
+                raise ImageFetchError(f"Upstream returned {response.status_code}")
+            content_type = response.headers.get("Content-Type", "")
+            if not content_type.startswith("image/"):
+                content_type = _guess_content_type(url)
+
+            fh = await run_in_threadpool(open, tmp_path, "wb")
+            try:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    digest.update(chunk)
+                    await run_in_threadpool(fh.write, chunk)
+            finally:
+                await run_in_threadpool(fh.close)
+
+        return await run_in_threadpool(
+            cache.commit, key, tmp_path, content_type, digest.hexdigest()[:32]
+        )
+    except httpx.HTTPError as e:
+        raise ImageFetchError(str(e)) from e
+    finally:
+        if await run_in_threadpool(tmp_path.exists):
+            await run_in_threadpool(tmp_path.unlink)
+
+
+async def _render_to_cache(source: CacheEntry, variant: tuple, key: str) -> CacheEntry:
+    """Gera o derivado (Pillow, fora do event loop) e publica no cache."""
+    cache = get_cover_cache()
+    tmp_path = await run_in_threadpool(cache.temp_path, key)
+    try:
+        content_type = await run_in_threadpool(
+            render_variant, source.path, tmp_path, variant
+        )
+        return await run_in_threadpool(cache.commit, key, tmp_path, content_type)
+    except (FileNotFoundError, UnsupportedImageError):
+        # FileNotFoundError: original descartado pelo LRU, quem chamou busca
+        # de novo; UnsupportedImageError vira 415
+        raise
+    except (OSError, ValueError) as e:
+        raise ImageFetchError(f"Could not render image: {e}") from e
+    finally:
+        if await run_in_threadpool(tmp_path.exists):
+            await run_in_threadpool(tmp_path.unlink)
+
+
+async def get_original(url: str) -> CacheEntry:
+    key = cache_key(url)
+    entry = await run_in_threadpool(get_cover_cache().lookup, key)
+    if entry is None:
+        entry = await fetch_flight.do(key, lambda: _download_to_cache(url, key))
+    return entry
+
+
+async def get_variant(url: str, variant: tuple) -> CacheEntry:
+    key = cache_key(url, variant_suffix(variant))
+    entry = await run_in_threadpool(get_cover_cache().lookup, key)
+    if entry is None:
+        source = await get_original(url)
+        entry = await fetch_flight.do(
+            key, lambda: _render_to_cache(source, variant, key)
+        )
+    return entry
+
+
+async def fetch_cover_paths(
+    urls: list[str], concurrency: int = FETCH_CONCURRENCY
+) -> dict[str, Optional[Path]]:
+    """Caminho no cache de cada capa original; None para as que falharam."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _fetch(url: str) -> tuple:
+        async with semaphore:
+            try:
+                return url, (await get_original(url)).path
+            except (ImageFetchError, OSError) as e:
+                print(f"Falha ao baixar capa {url}: {e}")
+                return url, None
+
+    return dict(await asyncio.gather(*(_fetch(url) for url in urls)))
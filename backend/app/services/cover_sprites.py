@@ -0,0 +1,223 @@
+"""
+cover_sprites.py — Atlas (sprite) de capas da estante de um usuário.
+
+Uma única imagem WebP com todas as capas lado a lado em miniatura + um mapa
+JSON `book_id → {x, y, w, h}`. O Mural/estante carrega 1 arquivo em vez de
+uma requisição por capa.
+
+- Versão = hash de (tamanho, [(id do livro, url da capa)]): se nada mudou,
+  devolve o manifesto salvo sem tocar em imagens. Um manifesto por
+  (usuário, tamanho, filtro de status), já que o filtro muda os livros.
+- Reconstrução incremental: capas que já estavam no atlas anterior são
+  copiadas de lá (sem download nem decodificação); só capas novas ou
+  trocadas são buscadas, por `cover_fetch` (mesmo cache, cliente HTTP e
+  deduplicação do /proxy/image).
+- Capas que falharam ficam de fora com `missing`; o atlas parcial é servido
+  até `retry_at` e só então reconstruído para tentar baixá-las de novo.
+- Atlas e manifesto ficam no `cover_cache` (descartados por LRU como o resto).
+
+Síncrono e CPU/IO-bound: chame de uma rota `def` ou via threadpool.
+"""
+
+import hashlib
+import io
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .cover_cache import cache_key, get_cover_cache
+from .cover_fetch import fetch_cover_paths
+from .singleflight import SingleFlight
+
+MIN_TILE_WIDTH = 40
+MAX_TILE_WIDTH = 300
+TILE_STEP = 20
+TILE_ASPECT = 1.5  # capas 2:3
+MAX_SPRITE_BOOKS = 1000
+FETCH_WORKERS = 8
+MISSING_RETRY_SECONDS = 300
+WEBP_QUALITY = 80
+BACKGROUND = (241, 245, 249)
+
+sprite_flight = SingleFlight()
+
+
+def normalize_tile_width(size: int) -> int:
+    size = max(MIN_TILE_WIDTH, min(size, MAX_TILE_WIDTH))
+    return -(-size // TILE_STEP) * TILE_STEP
+
+
+def sprite_version(tile_width: int, entries: list[tuple]) -> str:
+    payload = json.dumps([tile_width, entries], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def sprite_image_key(version: str) -> str:
+    return cache_key("sprite", version)
+
+
+def _manifest_key(user_id: str, tile_width: int, status: Optional[str]) -> str:
+    return cache_key("sprite-manifest", user_id, str(tile_width), status or "")
+
+
+# ── Capas (via cover_fetch) ───────────────────────────────────────────────────
+def load_cover_tiles(urls: list[str], tile_size: tuple) -> dict:
+    """
+    Busca as capas no event loop (precisa rodar numa thread do threadpool do
+    FastAPI) e recorta no tamanho do tile, em paralelo. {url: Image}.
+    """
+    from anyio import from_thread
+    from PIL import Image, ImageOps
+
+    paths = from_thread.run(fetch_cover_paths, urls)
+
+    def _load(url: str):
+        path = paths.get(url)
+        if path is None:
+            return url, None
+        try:
+            with Image.open(path) as img:
+                img = ImageOps.exif_transpose(img).convert("RGB")
+                return url, ImageOps.fit(img, tile_size, Image.LANCZOS)
+        except (OSError, Image.DecompressionBombError) as e:
+            print(f"Sprite: capa inválida {url}: {e}")
+            return url, None
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        return dict(pool.map(_load, urls))
+
+
+# ── Atlas ─────────────────────────────────────────────────────────────────────
+def _load_manifest(
+    user_id: str, tile_width: int, status: Optional[str]
+) -> Optional[dict]:
+    entry = get_cover_cache().lookup(_manifest_key(user_id, tile_width, status))
+    if entry is None:
+        return None
+    try:
+        return json.loads(entry.path.read_text("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _load_sprite_image(version: str):
+    from PIL import Image
+
+    entry = get_cover_cache().lookup(sprite_image_key(version))
+    if entry is None:
+        return None
+    try:
+        with Image.open(entry.path) as img:
+            return img.convert("RGB")
+    except (OSError, Image.DecompressionBombError):
+        return None
+
+
+def _store(key: str, content: bytes, content_type: str):
+    cache = get_cover_cache()
+    tmp_path = cache.temp_path(key)
+    try:
+        tmp_path.write_bytes(content)
+        cache.commit(key, tmp_path, content_type)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _build_sprite(
+    user_id: str, tile_width: int, entries: list[tuple], status: Optional[str]
+) -> dict:
+    from PIL import Image
+
+    version = sprite_version(tile_width, entries)
+    previous = _load_manifest(user_id, tile_width, status)
+    if (
+        previous
+        and previous.get("content_version") == version
+        and get_cover_cache().lookup(sprite_image_key(previous["version"])) is not None
+    ):
+        # Atlas parcial: serve o salvo até a hora de tentar as capas de novo
+        retry_at = previous.get("retry_at")
+        if retry_at is None or time.time() < retry_at:
+            return previous
+    previous_img = _load_sprite_image(previous["version"]) if previous else None
+
+    tile_w, tile_h = tile_width, round(tile_width * TILE_ASPECT)
+    columns = max(1, math.ceil(math.sqrt(len(entries) * tile_h / tile_w)))
+    rows = max(1, math.ceil(len(entries) / columns))
+    atlas = Image.new("RGB", (columns * tile_w, rows * tile_h), BACKGROUND)
+
+    # Tiles reaproveitáveis: mesma capa, já presente no atlas anterior
+    reusable = {}
+    if previous and previous_img is not None:
+        for item in previous.get("items", {}).values():
+            if not item.get("missing"):
+                reusable[item["cover"]] = (item["x"], item["y"])
+
+    to_fetch = sorted({cover for _, cover in entries if cover not in reusable})
+    fetched = load_cover_tiles(to_fetch, (tile_w, tile_h)) if to_fetch else {}
+
+    items = {}
+    for index, (book_id, cover) in enumerate(entries):
+        x, y = (index % columns) * tile_w, (index // columns) * tile_h
+        item = {"x": x, "y": y, "w": tile_w, "h": tile_h, "cover": cover}
+        if cover in reusable:
+            px, py = reusable[cover]
+            atlas.paste(previous_img.crop((px, py, px + tile_w, py + tile_h)), (x, y))
+        elif fetched.get(cover) is not None:
+            atlas.paste(fetched[cover], (x, y))
+        else:
+            item["missing"] = True
+        items[str(book_id)] = item
+
+    buf = io.BytesIO()
+    atlas.save(buf, format="WEBP", quality=WEBP_QUALITY, method=4)
+    content = buf.getvalue()
+
+    # A imagem é servida como imutável: atlas parcial ganha versão própria
+    # (pelo conteúdo) e um prazo para nova tentativa das capas que faltaram
+    image_version, retry_at = version, None
+    if any(item.get("missing") for item in items.values()):
+        image_version = f"{version}-{hashlib.sha256(content).hexdigest()[:8]}"
+        retry_at = time.time() + MISSING_RETRY_SECONDS
+
+    manifest = {
+        "version": image_version,
+        "content_version": version,
+        "retry_at": retry_at,
+        "width": atlas.width,
+        "height": atlas.height,
+        "tile": {"w": tile_w, "h": tile_h},
+        "items": items,
+        "reused": sum(1 for _, c in entries if c in reusable),
+        "fetched": len(to_fetch),
+    }
+
+    _store(sprite_image_key(image_version), content, "image/webp")
+    _store(
+        _manifest_key(user_id, tile_width, status),
+        json.dumps(manifest).encode("utf-8"),
+        "application/json",
+    )
+    return manifest
+
+
+def get_cover_sprite(
+    user_id: str, size: int, books: list, status: Optional[str] = None
+) -> dict:
+    """
+    Manifesto do atlas da estante (livros com capa, na ordem recebida).
+    `status` é o filtro usado para selecionar `books` (separa os manifestos).
+    """
+    tile_width = normalize_tile_width(size)
+    entries = [(b.id, b.cover_image) for b in books if b.cover_image][:MAX_SPRITE_BOOKS]
+    return sprite_flight.do(
+        f"{user_id}|{tile_width}|{status or ''}",
+        _build_sprite,
+        user_id,
+        tile_width,
+        entries,
+        status,
+    )
@@ -0,0 +1,217 @@
+"""
+cover_store.py — Capas endereçadas por conteúdo (deduplicação + GC).
+
+Cada upload é identificado pelo SHA-256 dos bytes enviados:
+- se já existe um `CoverBlob` com esse hash (reenvio, ou a mesma capa
+  popular enviada por outro usuário), o livro só ganha a referência —
+  sem normalizar nem falar com o Storage;
+- senão, gera os tamanhos WebP e sobe em `blobs/<aa>/<hash>_<tamanho>.webp`.
+
+A tabela `book_covers` liga livro → blob. `collect_garbage` (job em lote)
+remove referências de livros apagados ou que trocaram de capa e depois os
+blobs sem nenhuma referência criados (ou reaproveitados) há mais de
+`grace_hours`.
+
+Upload e GC não disputam o mesmo blob: o reaproveitamento renova
+`created_at` com um UPDATE (que espera o lock do GC), e o GC trava a linha
+com a condição de órfão reavaliada antes de apagar Storage e registro.
+
+Uso:
+    python -m app.services.cover_store gc [--grace-hours 24] [--dry-run]
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import UploadFile
+from sqlalchemy import exists, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from app.core.storage import storage_client
+from app.models.book import Book
+from app.models.cover import BookCover, CoverBlob
+from .cover_upload import (
+    COVER_BUCKET,
+    COVER_SIZES,
+    normalize_cover,
+    hash_upload,
+    upload_cover_variants,
+    variant_path,
+)
+
+GC_GRACE_HOURS = 24
+
+
+def blob_base_path(digest: str) -> str:
+    return f"blobs/{digest[:2]}/{digest}"
+
+
+def _touch_blob(session: Session, digest: str) -> bool:
+    """
+    Renova `created_at` do blob reaproveitado (fica fora da carência do GC).
+    False se o GC apagou o blob nesse meio-tempo: o conteúdo é enviado de novo.
+    """
+    result = session.exec(
+        update(CoverBlob)
+        .where(CoverBlob.digest == digest)
+        .values(created_at=datetime.utcnow())
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def _reuse_blob(session: Session, digest: str) -> Optional[CoverBlob]:
+    if session.get(CoverBlob, digest) is not None and _touch_blob(session, digest):
+        return session.get(CoverBlob, digest)
+    return None
+
+
+def _register_blob(
+    session: Session, digest: str, urls: dict, size_bytes: int
+) -> CoverBlob:
+    blob = CoverBlob(digest=digest, urls=urls, size_bytes=size_bytes)
+    session.add(blob)
+    try:
+        session.commit()
+    except IntegrityError:
+        # Outra requisição registrou o mesmo hash primeiro
+        session.rollback()
+        return session.get(CoverBlob, digest)
+    session.refresh(blob)
+    return blob
+
+
+async def store_cover_upload(session: Session, file: UploadFile) -> CoverBlob:
+    """
+    Devolve o blob do arquivo enviado, criando-o só se o conteúdo é novo.
+    As consultas (Session síncrona) rodam no threadpool, fora do event loop.
+    """
+    fileobj, digest = await hash_upload(file)
+    blob = await run_in_threadpool(_reuse_blob, session, digest)
+    if blob is not None:
+        return blob
+
+    variants = await run_in_threadpool(normalize_cover, fileobj)
+    size_bytes = fileobj.seek(0, 2)
+
+    # upsert: dois uploads simultâneos do mesmo conteúdo gravam o mesmo objeto
+    urls = await upload_cover_variants(blob_base_path(digest), variants, upsert=True)
+    return await run_in_threadpool(_register_blob, session, digest, urls, size_bytes)
+
+
+def attach_cover(session: Session, book: Book, blob: CoverBlob):
+    """Aponta o livro para o blob (capa = tamanho grande) e grava a referência."""
+    ref = session.get(BookCover, book.id)
+    if ref is None:
+        ref = BookCover(book_id=book.id, blob_digest=blob.digest, user_id=book.user_id)
+    else:
+        ref.blob_digest = blob.digest
+        ref.updated_at = datetime.utcnow()
+    book.cover_image = blob.urls.get("l")
+    session.add(ref)
+    session.add(book)
+
+
+def detach_cover(session: Session, book_id: int):
+    ref = session.get(BookCover, book_id)
+    if ref is not None:
+        session.delete(ref)
+
+
+def _prune_stale_refs(session: Session) -> int:
+    """Remove referências de livros apagados ou cuja capa não é mais o blob."""
+    rows = session.exec(
+        select(BookCover, CoverBlob, Book)
+        .join(CoverBlob, CoverBlob.digest == BookCover.blob_digest, isouter=True)
+        .join(Book, Book.id == BookCover.book_id, isouter=True)
+    ).all()
+    removed = 0
+    for ref, blob, book in rows:
+        if (
+            book is None
+            or blob is None
+            or book.cover_image not in (blob.urls or {}).values()
+        ):
+            session.delete(ref)
+            removed += 1
+    return removed
+
+
+def _orphan_conditions(cutoff: datetime) -> tuple:
+    """Sem nenhuma referência e fora da carência."""
+    return (
+        ~exists().where(BookCover.blob_digest == CoverBlob.digest),
+        CoverBlob.created_at < cutoff,
+    )
+
+
+def collect_garbage(
+    session: Session, grace_hours: float = GC_GRACE_HOURS, dry_run: bool = False
+) -> dict:
+    """Apaga do Storage e do banco os blobs sem referência (mais antigos que a carência)."""
+    stale_refs = _prune_stale_refs(session)
+    if dry_run:
+        session.rollback()
+    else:
+        session.commit()
+
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    orphans = session.exec(
+        select(CoverBlob.digest).where(*_orphan_conditions(cutoff))
+    ).all()
+
+    deleted, failed = 0, 0
+    for digest in orphans:
+        if dry_run:
+            continue
+        # Trava a linha e reavalia: um upload pode ter reaproveitado o blob
+        # (created_at renovado) ou ligado um livro a ele desde a listagem
+        blob = session.exec(
+            select(CoverBlob)
+            .where(CoverBlob.digest == digest, *_orphan_conditions(cutoff))
+            .with_for_update()
+        ).first()
+        if blob is None:
+            session.rollback()
+            continue
+        paths = [variant_path(blob_base_path(digest), name) for name in COVER_SIZES]
+        try:
+            storage_client.delete(COVER_BUCKET, paths)
+        except Exception as e:
+            session.rollback()
+            print(f"GC de capas: falha ao apagar {digest}: {e}")
+            failed += 1
+            continue
+        session.delete(blob)
+        session.commit()
+        deleted += 1
+
+    return {
+        "stale_refs": stale_refs,
+        "orphans": len(orphans),
+        "deleted": deleted,
+        "failed": failed,
+        "dry_run": dry_run,
+    }
+
+
+def main(argv: Optional[list] = None):
+    from app.core.database import engine
+
+    parser = argparse.ArgumentParser(description="Armazenamento de capas")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gc_cmd = sub.add_parser("gc", help="Remove blobs de capa sem referência")
+    gc_cmd.add_argument("--grace-hours", type=float, default=GC_GRACE_HOURS)
+    gc_cmd.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "gc":
+        with Session(engine) as session:
+            print(collect_garbage(session, args.grace_hours, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
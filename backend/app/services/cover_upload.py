@@ -0,0 +1,123 @@
+"""
+cover_upload.py — Pipeline de upload de capas enviadas pelo usuário.
+
+1. `hash_upload`: o Starlette já gravou o multipart num temporário
+   (memória até 1 MB, depois disco) antes do endpoint rodar; aqui ele só é
+   lido em blocos numa thread para checar o limite de tamanho e calcular o
+   SHA-256, sem cópia extra.
+2. `normalize_cover`: numa thread — corrige a orientação, descarta EXIF,
+   limita as dimensões e gera todos os tamanhos em WebP numa única
+   decodificação.
+3. `upload_cover_variants`: envia os tamanhos ao Storage em paralelo, sem
+   bloquear o event loop.
+
+A deduplicação por conteúdo (pular 2 e 3 se o hash já existe) fica em
+`cover_store.py`.
+"""
+
+import asyncio
+import hashlib
+import io
+from typing import IO, Tuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from app.core.storage import upload_file_to_bucket_async
+
+COVER_BUCKET = "book-covers"
+MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+MAX_PIXELS = 40_000_000  # rejeita "bombas" de descompressão
+
+# Maior lado de cada tamanho, do maior para o menor (cada um sai do anterior)
+COVER_SIZES = {"l": 1200, "m": 600, "s": 240}
+WEBP_QUALITY = 82
+
+
+class CoverUploadError(ValueError):
+    pass
+
+
+class CoverTooLargeError(CoverUploadError):
+    pass
+
+
+def _hash_fileobj(fileobj: IO[bytes], max_bytes: int) -> str:
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    total = 0
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        total += len(chunk)
+        if total > max_bytes:
+            raise CoverTooLargeError(
+                f"Arquivo maior que {max_bytes // (1024 * 1024)} MB"
+            )
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+async def hash_upload(
+    file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES
+) -> Tuple[IO[bytes], str]:
+    """
+    Valida o tamanho e calcula o hash do arquivo que o Starlette já guardou.
+    Retorna (arquivo posicionado no início, sha256 hex do conteúdo).
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise CoverTooLargeError(f"Arquivo maior que {max_bytes // (1024 * 1024)} MB")
+    digest = await run_in_threadpool(_hash_fileobj, file.file, max_bytes)
+    return file.file, digest
+
+
+def normalize_cover(fileobj: IO[bytes]) -> dict[str, bytes]:
+    """Decodifica uma vez e devolve {tamanho: bytes WebP} sem metadados."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(fileobj) as img:
+            if img.width * img.height > MAX_PIXELS:
+                raise CoverUploadError("Imagem com resolução grande demais")
+            img = ImageOps.exif_transpose(img)
+            img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+    except Image.DecompressionBombError as e:
+        raise CoverUploadError("Imagem com resolução grande demais") from e
+    except (UnidentifiedImageError, OSError) as e:
+        raise CoverUploadError(f"Arquivo de imagem inválido: {e}") from e
+
+    variants = {}
+    current = img
+    for name, max_side in COVER_SIZES.items():
+        if max(current.size) > max_side:
+            current = current.copy()
+            current.thumbnail((max_side, max_side), Image.LANCZOS)
+        buf = io.BytesIO()
+        # Sem `exif=`/`icc_profile=`: o arquivo final não carrega metadados
+        current.save(buf, format="WEBP", quality=WEBP_QUALITY, method=4)
+        variants[name] = buf.getvalue()
+    return variants
+
+
+async def upload_cover_variants(
+    base_path: str, variants: dict[str, bytes], upsert: bool = False
+) -> dict:
+    """Envia `{base_path}_{tamanho}.webp` em paralelo. Retorna {tamanho: url}."""
+    names = list(variants)
+    urls = await asyncio.gather(
+        *(
+            upload_file_to_bucket_async(
+                COVER_BUCKET,
+                variant_path(base_path, name),
+                variants[name],
+                "image/webp",
+                upsert=upsert,
+            )
+            for name in names
+        )
+    )
+    return dict(zip(names, urls))
+
+
+def variant_path(base_path: str, name: str) -> str:
+    return f"{base_path}_{name}.webp"
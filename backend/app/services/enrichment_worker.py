@@ -0,0 +1,159 @@
+"""
+enrichment_worker.py — Enriquecimento de livros fora do caminho da requisição.
+
+`POST /books/` salva o livro imediatamente com `enrichment_status="pending"`
+e agenda `enrich_book` como background task. O worker abre a própria sessão,
+busca os metadados (Google Books + Open Library + IA), preenche apenas os
+campos vazios, recalcula o score e marca o livro como "done" ou "failed".
+Clientes acompanham via `GET /books/{id}/enrichment` ou pelo `updated_at`.
+
+O pipeline roda sem sessão aberta; no fim a linha é relida com lock, então
+edições feitas nesse meio-tempo (capa enviada logo após o 202, por exemplo)
+não são sobrescritas. BackgroundTasks não são garantidas (Vercel congela a
+função após a resposta): livros "pending" parados são retomados na
+inicialização e na própria leitura do status, com reivindicação atômica.
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from app.core.database import engine
+from app.models.book import Book
+from app.models.user import UserPreference
+from .book_enrichment import (
+    apply_enrichment,
+    get_book_details_hybrid,
+    get_user_ai_params,
+)
+from .scoring import calculate_book_score
+
+ENRICHMENT_PENDING = "pending"
+ENRICHMENT_DONE = "done"
+ENRICHMENT_FAILED = "failed"
+
+# "pending" sem progresso há mais que isso = background task perdida
+# (processo reciclado, função serverless congelada depois da resposta)
+PENDING_STALE_SECONDS = 300
+STALE_SWEEP_LIMIT = 200
+
+
+def needs_enrichment(book: Book) -> bool:
+    return bool(book.title and (not book.book_class or not book.category))
+
+
+def enrich_book(book_id: int, user_id: str) -> None:
+    """Preenche os campos faltantes de um livro já salvo."""
+    # 1. Leitura curta: só o necessário para o pipeline, sem segurar a linha
+    with Session(engine) as session:
+        book = session.get(Book, book_id)
+        if not book or book.user_id != user_id:
+            return
+        title, author = book.title, book.author
+        api_keys, custom_prompts, class_categories = get_user_ai_params(
+            session, user_id
+        )
+
+    # 2. Pipeline lento (Google Books + Open Library + IA) fora de transação
+    try:
+        enrichment = get_book_details_hybrid(
+            title, api_keys, custom_prompts, class_categories, author=author
+        )
+    except Exception as e:
+        enrichment = {"error": str(e)}
+
+    # 3. Relê e trava a linha: edições e upload de capa feitos durante o
+    # pipeline prevalecem (apply_enrichment só preenche campos ainda vazios)
+    with Session(engine) as session:
+        book = session.exec(
+            select(Book).where(Book.id == book_id).with_for_update()
+        ).first()
+        if not book or book.user_id != user_id:
+            return  # apagado enquanto o pipeline rodava
+
+        if enrichment and enrichment.get("error"):
+            print(f"Enriquecimento do livro {book_id} falhou: {enrichment['error']}")
+            apply_enrichment(book, enrichment.get("partial_result"))
+            book.enrichment_status = ENRICHMENT_FAILED
+        else:
+            apply_enrichment(book, enrichment)
+            book.enrichment_status = ENRICHMENT_DONE
+
+        pref = session.get(UserPreference, user_id)
+        config = pref.formula_config if pref else None
+        book.score = calculate_book_score(book, config)
+        book.updated_at = datetime.utcnow()
+        session.add(book)
+        session.commit()
+
+
+# ── Recuperação de "pending" presos ───────────────────────────────────────────
+def claim_stale_enrichment(session: Session, book_id: int) -> bool:
+    """
+    Reivindica um livro "pending" parado há PENDING_STALE_SECONDS. O UPDATE
+    condicional é atômico: entre várias instâncias, só uma recebe rowcount 1.
+    """
+    now = datetime.utcnow()
+    result = session.exec(
+        update(Book)
+        .where(
+            Book.id == book_id,
+            Book.enrichment_status == ENRICHMENT_PENDING,
+            Book.updated_at < now - timedelta(seconds=PENDING_STALE_SECONDS),
+        )
+        .values(updated_at=now)
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def retry_if_stale(session: Session, book: Book) -> bool:
+    """
+    Chamado na leitura do status: se a background task se perdeu, roda o
+    enriquecimento aqui mesmo (síncrono — em serverless é o único lugar
+    garantido). Retorna True se rodou.
+    """
+    if book.enrichment_status != ENRICHMENT_PENDING:
+        return False
+    if not claim_stale_enrichment(session, book.id):
+        return False
+    enrich_book(book.id, book.user_id)
+    session.refresh(book)
+    return True
+
+
+def resume_stale_enrichments() -> None:
+    """Na inicialização: reivindica os "pending" parados e processa numa thread."""
+    cutoff = datetime.utcnow() - timedelta(seconds=PENDING_STALE_SECONDS)
+    try:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(Book.id, Book.user_id)
+                .where(
+                    Book.enrichment_status == ENRICHMENT_PENDING,
+                    Book.updated_at < cutoff,
+                )
+                .limit(STALE_SWEEP_LIMIT)
+            ).all()
+            claimed = [
+                (book_id, user_id)
+                for book_id, user_id in rows
+                if claim_stale_enrichment(session, book_id)
+            ]
+    except Exception as e:
+        print(f"Aviso: Falha ao varrer enriquecimentos pendentes: {e}")
+        return
+    if not claimed:
+        return
+
+    def _run():
+        for book_id, user_id in claimed:
+            try:
+                enrich_book(book_id, user_id)
+            except Exception as e:
+                print(f"Enriquecimento do livro {book_id} falhou: {e}")
+
+    print(f"Retomando {len(claimed)} enriquecimentos pendentes")
+    threading.Thread(target=_run, daemon=True, name="enrich-sweep").start()
@@ -0,0 +1,88 @@
+"""
+image_variants.py — Derivados redimensionados/convertidos das capas do proxy.
+
+`/proxy/image?url=...&w=200&fmt=webp` gera (uma vez) uma versão menor da capa
+original já cacheada e guarda no mesmo `cover_cache` com chave própria.
+A renderização usa Pillow e é CPU-bound: chame via threadpool.
+"""
+
+from pathlib import Path
+from typing import Optional
+
+MAX_DIMENSION = 1600
+# Arredonda larguras/alturas pedidas para não multiplicar derivados quase iguais
+DIMENSION_STEP = 20
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+QUALITY = {"WEBP": 80, "JPEG": 85}
+
+
+class InvalidVariantError(ValueError):
+    pass
+
+
+class UnsupportedImageError(ValueError):
+    """Imagem que não vamos decodificar (ex.: bomba de descompressão)."""
+
+
+def normalize_variant(
+    w: Optional[int], h: Optional[int], fmt: Optional[str]
+) -> Optional[tuple]:
+    """Valida e normaliza (w, h, fmt). None = servir o original."""
+    if w is None and h is None and fmt is None:
+        return None
+    if fmt is not None:
+        fmt = fmt.lower()
+        if fmt == "jpg":
+            fmt = "jpeg"
+        if fmt not in FORMATS:
+            raise InvalidVariantError(f"Unsupported format: {fmt}")
+
+    def _snap(value: Optional[int]) -> Optional[int]:
+        if value is None:
+            return None
+        if value <= 0:
+            raise InvalidVariantError("Width/height must be positive")
+        value = min(value, MAX_DIMENSION)
+        return max(DIMENSION_STEP, -(-value // DIMENSION_STEP) * DIMENSION_STEP)
+
+    return _snap(w), _snap(h), fmt or "webp"
+
+
+def variant_suffix(variant: tuple) -> str:
+    w, h, fmt = variant
+    return f"w={w or ''}&h={h or ''}&fmt={fmt}"
+
+
+def render_variant(src: Path, dst: Path, variant: tuple) -> str:
+    """Redimensiona (mantendo proporção, sem ampliar) e grava em `dst`."""
+    from PIL import Image, ImageOps
+
+    w, h, fmt = variant
+    pil_format, content_type = FORMATS[fmt]
+
+    try:
+        with Image.open(src) as img:
+            img = ImageOps.exif_transpose(img)
+            if w or h:
+                img.thumbnail((w or MAX_DIMENSION, h or MAX_DIMENSION), Image.LANCZOS)
+
+            if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+                img = img.convert("RGBA")
+
+            save_kwargs = {"optimize": True}
+            if pil_format in QUALITY:
+                save_kwargs["quality"] = QUALITY[pil_format]
+            if pil_format == "WEBP":
+                save_kwargs["method"] = 4
+            img.save(dst, format=pil_format, **save_kwargs)
+    except Image.DecompressionBombError as e:
+        raise UnsupportedImageError(str(e)) from e
+
+    return content_type
@@ -0,0 +1,126 @@
+"""
+llm_cache.py — Cache em memória para respostas de LLM.
+
+A chave combina título normalizado, hash do resumo, hash da taxonomia
+(`class_categories`), hash dos prompts customizados e o modelo/provedor.
+Assim, o mesmo livro classificado com a mesma configuração (inclusive por
+outro usuário com a taxonomia padrão) é servido sem nova chamada à IA.
+
+Entradas expiram após `ttl_seconds` e o total é limitado a `max_entries`
+(descarte LRU). Respostas com erro nunca são armazenadas.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.core.config import settings
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados."""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(value))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.lower().split())
+
+
+def hash_payload(payload: Any) -> str:
+    """Hash estável (sha256 curto) de qualquer estrutura serializável em JSON."""
+    if not payload:
+        return "-"
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class LLMResponseCache:
+    """Cache LRU com TTL, seguro para uso entre threads."""
+
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        kind: str,
+        title: str,
+        abstract: Optional[str] = None,
+        class_categories: Optional[dict] = None,
+        custom_prompts: Optional[dict] = None,
+        model: Optional[str] = None,
+    ) -> str:
+        return "|".join(
+            [
+                kind,
+                normalize_text(title),
+                hash_payload(normalize_text(abstract)),
+                hash_payload(class_categories),
+                hash_payload(custom_prompts),
+                model or "-",
+            ]
+        )
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def set(self, key: str, value: dict) -> None:
+        if not value or not isinstance(value, dict) or "error" in value:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+llm_cache = LLMResponseCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+)
+
+
+def is_cache_enabled(api_keys: Optional[dict]) -> bool:
+    """Respeita o opt-out do usuário (`ai_cache` em api_keys) e o desligamento global."""
+    if settings.LLM_CACHE_MAX_ENTRIES <= 0:
+        return False
+    return (api_keys or {}).get("ai_cache", True) is not False
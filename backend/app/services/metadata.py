@@ -1,6 +1,61 @@
 import os
+import threading
+from collections import OrderedDict
 import requests
 from app.core.config import settings
+from app.core.rate_limit import rate_limiter
+from app.core.circuit_breaker import breakers, CircuitOpenError
+from app.services.catalog import lookup_local_catalog
+
+GOOGLE_BOOKS = "google_books"
+OPEN_LIBRARY = "open_library"
+
+# Últimas respostas boas por consulta: servidas quando o circuito está aberto
+_STALE_MAX_ENTRIES = 1000
+_stale_responses: "OrderedDict[tuple, dict]" = OrderedDict()
+_stale_lock = threading.Lock()
+
+
+def _remember(key: tuple, data: dict):
+    with _stale_lock:
+        _stale_responses[key] = data
+        _stale_responses.move_to_end(key)
+        while len(_stale_responses) > _STALE_MAX_ENTRIES:
+            _stale_responses.popitem(last=False)
+
+
+def _get_json(dependency: str, url: str, params: dict, timeout: float) -> dict:
+    """
+    GET com rate limit por host e circuit breaker por dependência.
+    Com o circuito aberto, devolve a última resposta boa da mesma consulta
+    ou levanta CircuitOpenError (sem esperar o timeout).
+    """
+    key = (url, tuple(sorted((k, v) for k, v in params.items() if k != "key")))
+    breaker = breakers.get(dependency)
+    if not breaker.allow():
+        with _stale_lock:
+            stale = _stale_responses.get(key)
+        if stale is not None:
+            return stale
+        raise CircuitOpenError(f"Circuito aberto para {dependency}")
+
+    try:
+        rate_limiter.acquire(url)
+        response = requests.get(url, params=params, timeout=timeout)
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        raise
+
+    # 5xx/429 indicam dependência degradada; demais 4xx são erro da consulta
+    if response.status_code >= 500 or response.status_code == 429:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    response.raise_for_status()
+
+    data = response.json()
+    _remember(key, data)
+    return data
 
 
 def _score_google_item(item: dict) -> int:
@@ -63,20 +118,39 @@ def _extract_book_result(book_info: dict) -> dict:
 def _search_google_books(query: str, api_key: str = None) -> list:
     """Run a single query against Google Books API and return items list."""
     try:
-        url = "https://www.googleapis.com/books/v1/volumes"
         params = {"q": query, "maxResults": 5, "printType": "books"}
         if api_key:
             params["key"] = api_key
-        response = requests.get(url, params=params, timeout=8)
-        response.raise_for_status()
-        return response.json().get("items", [])
+        data = _get_json(GOOGLE_BOOKS, settings.GOOGLE_BOOKS_API_URL, params, 8)
+        return data.get("items", [])
     except Exception as e:
         print(f"Google Books query failed for '{query}': {e}")
         return []
 
 
-def get_google_books_data(title: str, author: str = None):
-    """Busca dados do livro na Google Books API com estratégia de fallback."""
+# Campos que o catálogo local também tem; descrição e subtítulo só no Google
+CATALOG_FIELDS = (
+    "author",
+    "year",
+    "cover_image",
+    "original_title",
+    "average_rating",
+    "ratings_count",
+)
+# Do catálogo têm prioridade sobre o Google (ano da 1ª publicação, obra original)
+CATALOG_PREFERRED = ("year", "cover_image", "original_title")
+GOOGLE_FIELDS = CATALOG_FIELDS + ("description", "subtitle")
+
+
+def _from_catalog(local: dict) -> dict:
+    """Resultado do catálogo no formato de `_extract_book_result`."""
+    result = {"description": "", "subtitle": ""}
+    result.update({f: local.get(f) for f in CATALOG_FIELDS})
+    result["source"] = local.get("source")
+    return result
+
+
+def _fetch_google_books(title: str, author: str = None):
     api_key = getattr(settings, "GOOGLE_BOOKS_API_KEY", None) or os.getenv(
         "GOOGLE_BOOKS_API_KEY"
     )
@@ -97,19 +171,40 @@ def get_google_books_data(title: str, author: str = None):
     return _extract_book_result(best["volumeInfo"])
 
 
+def get_google_books_data(title: str, author: str = None, fields: tuple = None):
+    """
+    Busca dados do livro: catálogo local primeiro, Google Books só se faltar
+    algum dos `fields` pedidos (padrão: todos — a descrição só o Google tem).
+    Ano, capa e título original do catálogo prevalecem; o catálogo completa
+    o que o Google não trouxe.
+    """
+    local = lookup_local_catalog(title, author) or {}
+    if local and all(local.get(f) for f in fields or GOOGLE_FIELDS):
+        return _from_catalog(local)
+
+    result = _fetch_google_books(title, author)
+    if result is None:
+        return _from_catalog(local) if local else None
+    for field in CATALOG_FIELDS:
+        if local.get(field) and (field in CATALOG_PREFERRED or not result.get(field)):
+            result[field] = local[field]
+    return result
+
+
 def get_openlibrary_data(title: str, author: str = None):
     """Busca dados adicionais (ano da primeira publicação, título original, rating) na Open Library API."""
+    # Catálogo local primeiro; a API só é chamada em caso de miss
+    local = lookup_local_catalog(title, author)
+    if local:
+        return local
+
     try:
         search_query = title
         if author:
             search_query = f"{title} {author}"
 
-        url = "https://openlibrary.org/search.json"
         params = {"q": search_query, "limit": 1}
-
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
+        data = _get_json(OPEN_LIBRARY, settings.OPENLIBRARY_API_URL, params, 5)
 
         if data.get("numFound", 0) > 0:
             book = data["docs"][0]
@@ -142,8 +237,12 @@ def get_openlibrary_data(title: str, author: str = None):
 
 def get_hybrid_rating(title: str, author: str = None, original_title: str = None):
     """Busca rating de forma híbrida."""
+    local = lookup_local_catalog(title, author)
+    if local and local.get("average_rating"):
+        return local
+
     # Tenta Google Books com título em português
-    google_data = get_google_books_data(title)
+    google_data = get_google_books_data(title, fields=("average_rating",))
     if google_data and google_data.get("average_rating"):
         return {
             "average_rating": google_data["average_rating"],
@@ -153,7 +252,9 @@ def get_hybrid_rating(title: str, author: str = None, original_title: str = None
 
     # Tenta Google Books com título original
     if original_title:
-        google_data_original = get_google_books_data(original_title)
+        google_data_original = get_google_books_data(
+            original_title, fields=("average_rating",)
+        )
         if google_data_original and google_data_original.get("average_rating"):
             return {
                 "average_rating": google_data_original["average_rating"],
@@ -0,0 +1,312 @@
+"""
+provider_router.py — Roteamento de provedores de IA com hedging.
+
+Mantém uma janela deslizante de latências e falhas por provedor e chave de API
+(identificada por um hash curto, nunca pela chave) e ordena os candidatos por saúde (o preferido do usuário vai primeiro, a menos que esteja
+degradado). Se o primeiro provedor demorar mais que o percentil configurado
+da sua latência histórica, dispara uma requisição "hedge" no próximo e fica
+com a primeira resposta válida.
+
+Um provedor é qualquer callable `(prompt, system_prompt, api_keys) -> dict`
+que sinaliza falha com a chave "error" — o mesmo contrato das funções
+`get_*_classification` em ai.py, o que permite usar provedores falsos.
+
+O circuit breaker de cada provedor é por chave de API (`provider_keys`): só
+timeouts, erros de conexão e 5xx contam como falha; 401/403/429 são problema
+daquela chave e não abrem o circuito.
+
+Threads não podem ser interrompidas: a chamada perdedora é cancelada se ainda
+não começou; se já estiver rodando, o resultado é descartado e só entra nas
+estatísticas. Por isso cada provedor tem seu próprio pool, limitado a
+`max_inflight_per_provider` chamadas: um provedor travado (até o timeout do
+SDK) esgota só as próprias vagas, e com elas cheias o router pula direto para
+o próximo em vez de enfileirar.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+from app.core.circuit_breaker import breakers, is_transient_error, key_fingerprint
+
+ProviderFunc = Callable[[str, str, Optional[dict]], dict]
+
+
+def is_error(res) -> bool:
+    """Resposta vazia ou dict com a chave "error" conta como falha."""
+    return not res or (isinstance(res, dict) and "error" in res)
+
+
+@dataclass
+class RouteResult:
+    result: Optional[Any]
+    provider: Optional[str]
+    reason: str
+    errors: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.result is not None
+
+
+class ProviderStats:
+    """Janela deslizante de latência (s) e sucesso/falha de um provedor."""
+
+    def __init__(self, window: int):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+
+    def record(self, latency: float, success: bool) -> None:
+        self.outcomes.append(success)
+        if success:
+            self.latencies.append(latency)
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[idx]
+
+    def snapshot(self) -> dict:
+        p50 = self.percentile(0.5)
+        p90 = self.percentile(0.9)
+        return {
+            "calls": len(self.outcomes),
+            "error_rate": round(self.error_rate(), 3),
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p90_ms": round(p90 * 1000) if p90 is not None else None,
+        }
+
+
+class ProviderRouter:
+    def __init__(
+        self,
+        window: int = 50,
+        hedge_enabled: bool = True,
+        hedge_percentile: float = 0.9,
+        hedge_min_delay: float = 1.5,
+        unhealthy_error_rate: float = 0.5,
+        max_inflight_per_provider: int = 4,
+    ):
+        self.window = window
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.unhealthy_error_rate = unhealthy_error_rate
+        self.max_inflight_per_provider = max_inflight_per_provider
+        self._stats: dict[str, ProviderStats] = {}
+        self._lock = threading.Lock()
+        # Provedor → (pool, vagas); criados no primeiro uso
+        self._slots: dict[str, tuple[ThreadPoolExecutor, threading.Semaphore]] = {}
+
+    # ── Estatísticas ──────────────────────────────────────────────────────
+    @staticmethod
+    def scope(name: str, key: Optional[str] = None) -> str:
+        """Balde de estatísticas: provedor + hash da chave usada."""
+        return f"{name}:{key_fingerprint(key)}"
+
+    def _get_stats(self, name: str) -> ProviderStats:
+        with self._lock:
+            if name not in self._stats:
+                self._stats[name] = ProviderStats(self.window)
+            return self._stats[name]
+
+    def record(self, name: str, latency: float, success: bool) -> None:
+        stats = self._get_stats(name)
+        with self._lock:
+            stats.record(latency, success)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: s.snapshot() for name, s in self._stats.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    # ── Ordenação por saúde ───────────────────────────────────────────────
+    def _health_key(self, name: str) -> tuple:
+        stats = self._get_stats(name)
+        with self._lock:
+            p50 = stats.percentile(0.5)
+            return (stats.error_rate(), p50 if p50 is not None else float("inf"))
+
+    def order(
+        self, names: list[str], provider_keys: Optional[dict] = None
+    ) -> list[str]:
+        """Mantém o preferido (primeiro da lista) se saudável; demais por saúde."""
+        if not names:
+            return []
+        provider_keys = provider_keys or {}
+
+        def health(name: str) -> tuple:
+            return self._health_key(self.scope(name, provider_keys.get(name)))
+
+        preferred, rest = names[0], names[1:]
+        ordered_rest = sorted(rest, key=health)
+        if health(preferred)[0] >= self.unhealthy_error_rate:
+            return sorted(names, key=health)
+        return [preferred] + ordered_rest
+
+    def hedge_delay(self, name: str) -> float:
+        stats = self._get_stats(name)
+        with self._lock:
+            pct = stats.percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, pct or 0.0)
+
+    # ── Execução ──────────────────────────────────────────────────────────
+    def _provider_slots(
+        self, name: str
+    ) -> tuple[ThreadPoolExecutor, threading.Semaphore]:
+        with self._lock:
+            if name not in self._slots:
+                self._slots[name] = (
+                    ThreadPoolExecutor(
+                        max_workers=self.max_inflight_per_provider,
+                        thread_name_prefix=f"ai-{name}",
+                    ),
+                    threading.BoundedSemaphore(self.max_inflight_per_provider),
+                )
+            return self._slots[name]
+
+    def _call_in_slot(self, slots: threading.Semaphore, *call_args) -> dict:
+        try:
+            return self._call(*call_args)
+        finally:
+            slots.release()
+
+    def _call(
+        self, name: str, func: ProviderFunc, args: tuple, key: Optional[str] = None
+    ) -> dict:
+        breaker = breakers.for_key(f"llm_{name}", key)
+        if not breaker.allow():
+            return {"error": "Circuito aberto (provedor instável)"}
+
+        scope = self.scope(name, key)
+        started = time.perf_counter()
+        try:
+            res = func(*args)
+        except Exception as e:
+            res = {"error": str(e), "transient": is_transient_error(e)}
+        if not res:
+            res = {"error": "Retorno vazio"}
+
+        success = not is_error(res)
+        self.record(scope, time.perf_counter() - started, success)
+        if success:
+            breaker.record_success()
+        elif isinstance(res, dict) and res.get("transient"):
+            breaker.record_failure()
+        else:
+            breaker.release()
+        return res
+
+    def route(
+        self,
+        providers: list[tuple[str, ProviderFunc]],
+        prompt: str,
+        system_prompt: str,
+        api_keys: Optional[dict] = None,
+        provider_keys: Optional[dict] = None,
+    ) -> RouteResult:
+        """
+        Executa os provedores na ordem de saúde, com hedge opcional, e retorna
+        o vencedor e o motivo ("preferred", "health-order", "fallback", "hedge").
+        `provider_keys` ({nome: chave}) escolhe o circuit breaker de cada chave.
+        """
+        provider_keys = provider_keys or {}
+        funcs = dict(providers)
+        names = [name for name, _ in providers]
+        ordered = self.order(names, provider_keys)
+        args = (prompt, system_prompt, api_keys)
+
+        errors: list[str] = []
+        pending: dict[Future, str] = {}
+        queue = list(ordered)
+        hedged = False
+
+        def launch() -> None:
+            """Dispara o próximo provedor com vaga; os lotados viram erro."""
+            while queue:
+                name = queue.pop(0)
+                executor, slots = self._provider_slots(name)
+                if not slots.acquire(blocking=False):
+                    errors.append(f"{name}: chamadas demais em andamento")
+                    continue
+                future = executor.submit(
+                    self._call_in_slot,
+                    slots,
+                    name,
+                    funcs[name],
+                    args,
+                    provider_keys.get(name),
+                )
+                pending[future] = name
+                return
+
+        launch()
+        while pending:
+            timeout = None
+            if self.hedge_enabled and queue and len(pending) == 1:
+                first = next(iter(pending.values()))
+                timeout = self.hedge_delay(self.scope(first, provider_keys.get(first)))
+
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # Primeiro provedor está lento: dispara o hedge no próximo
+                hedged = True
+                launch()
+                continue
+
+            for fut in done:
+                name = pending.pop(fut)
+                res = fut.result()
+                if not is_error(res):
+                    for loser, loser_name in pending.items():
+                        # Cancelada antes de começar: a vaga não é liberada
+                        # por _call_in_slot
+                        if loser.cancel():
+                            self._provider_slots(loser_name)[1].release()
+                    if hedged and name != ordered[0]:
+                        reason = "hedge"
+                    elif name == names[0]:
+                        reason = "preferred"
+                    elif name == ordered[0]:
+                        reason = "health-order"
+                    else:
+                        reason = "fallback"
+                    return RouteResult(res, name, reason, errors)
+                errors.append(f"{name}: {res.get('error')}")
+
+            if not pending and queue:
+                launch()
+
+        return RouteResult(None, None, "all-failed", errors)
+
+
+provider_router = ProviderRouter(
+    hedge_enabled=settings.AI_HEDGE_ENABLED,
+    hedge_percentile=settings.AI_HEDGE_PERCENTILE,
+    hedge_min_delay=settings.AI_HEDGE_MIN_DELAY,
+    max_inflight_per_provider=settings.AI_MAX_INFLIGHT_PER_PROVIDER,
+)
+
+# Lotes levam muito mais que uma chamada única: sem hedge (duplicaria toda
+# chamada) e com estatísticas próprias, para não distorcer as do router principal.
+batch_router = ProviderRouter(
+    hedge_enabled=False,
+    max_inflight_per_provider=settings.AI_MAX_INFLIGHT_PER_PROVIDER,
+)
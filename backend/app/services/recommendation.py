@@ -1,5 +1,5 @@
 """
-recommendation.py — Serviço de recomendação KNN para o bookstack-ai.
+recommendation.py — Serviço de recomendação (centroides + distância) para o bookstack-ai.
 
 Algoritmo (Content-Based Filtering com Negative Feedback):
 1. Filtra livros lidos:
@@ -11,34 +11,39 @@ Algoritmo (Content-Based Filtering com Negative Feedback):
 3. Codifica features categóricas (book_class, category, type) + numéricas
    (score, year) — no mesmo espaço combinado (lidos + fila).
 4. Calcula centroide ponderado positivo (gosto) e negativo (desgosto).
-5. Treina KNN na FILA e mede:
+5. Mede (vetorizado, NumPy puro) as distâncias da FILA aos perfis:
    - dist_pos: distância ao perfil positivo (menor = melhor)
    - dist_neg: distância ao perfil negativo (menor = pior)
 6. Score final = similaridade_positiva - β × similaridade_negativa
    com β = 0.35 (penalização moderada)
+7. Texto (opcional): cosseno TF-IDF de título + motivação da fila com os
+   perfis de texto (mesmos pesos), misturado com peso TEXT_WEIGHT nos livros
+   que têm texto (ver text_vectors.py).
+8. Colaborativo (opcional): livros da fila cuja obra está entre os candidatos
+   do job ALS entre usuários (collaborative.py) recebem o score normalizado
+   com peso CF_WEIGHT.
+
+Os passos 1–4 ficam em `build_recommendation_state` (cacheado por usuário em
+recommendation_state.py); os passos 5–8 em `score_queue`.
 """
 
 from __future__ import annotations
 
 import math
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import numpy as np
 
-# sklearn é opcional — se não instalado, o endpoint retorna 503
-try:
-    from sklearn.neighbors import NearestNeighbors
-    from sklearn.preprocessing import LabelEncoder
-
-    _SKLEARN_AVAILABLE = True
-except ImportError:
-    _SKLEARN_AVAILABLE = False
-
+if TYPE_CHECKING:
+    from .text_vectors import TextIndex
 
 # ── Constantes ────────────────────────────────────────────────────────────────
 LAMBDA = 0.4  # decaimento temporal (meia-vida ≈ 1.7 anos)
 NEG_BETA = 0.35  # peso da penalização negativa (0 = ignorar dislikes)
+TEXT_WEIGHT = 0.3  # peso do cosseno de texto no score final
+CF_WEIGHT = 0.25  # peso do score colaborativo (ALS) no score final
 MIN_LIDOS = 2  # mínimo de lidos top para gerar recomendações
 CAT_COLS = ["book_class", "category", "type"]
 NUM_COLS = ["score", "year"]
@@ -63,36 +68,42 @@ def _temporal_weight(date_read: str | None, rating: int, positive: bool) -> floa
     return rating_w * math.exp(-LAMBDA * years_ago)
 
 
-def _encode(combined_dicts: list[dict], col: str) -> np.ndarray:
-    vals = [str(d.get(col) or "?") for d in combined_dicts]
-    return LabelEncoder().fit_transform(vals).astype(float)
+def _encode(combined_dicts: list[dict], col: str) -> tuple[np.ndarray, np.ndarray]:
+    """Label encoding (classes ordenadas, como o LabelEncoder). Retorna (códigos, classes)."""
+    vals = np.array([str(d.get(col) or "?") for d in combined_dicts])
+    classes, codes = np.unique(vals, return_inverse=True)
+    return codes.astype(np.float32), classes
 
 
-def _encode_num(combined_dicts: list[dict], col: str) -> np.ndarray | None:
+def _encode_num(combined_dicts: list[dict], col: str) -> tuple | None:
     vals = np.array([float(d.get(col) or 0) for d in combined_dicts])
     std = vals.std()
     if std == 0:
         return None
-    return (vals - vals.mean()) / std
+    mean = vals.mean()
+    return ((vals - mean) / std).astype(np.float32), (float(mean), float(std))
 
 
-def _build_feature_matrix(combined: list[dict]) -> np.ndarray:
+def _build_feature_matrix(combined: list[dict]) -> tuple[np.ndarray, dict, dict]:
+    """Matriz de features + encoders (classes por coluna) e média/desvio numéricos."""
     parts: list[np.ndarray] = []
+    encoders: dict[str, np.ndarray] = {}
+    num_stats: dict[str, tuple] = {}
     for col in CAT_COLS:
-        parts.append(_encode(combined, col))
+        codes, encoders[col] = _encode(combined, col)
+        parts.append(codes)
     for col in NUM_COLS:
-        arr = _encode_num(combined, col)
-        if arr is not None:
-            parts.append(arr)
+        encoded = _encode_num(combined, col)
+        if encoded is not None:
+            parts.append(encoded[0])
+            num_stats[col] = encoded[1]
     if not parts:
-        return np.empty((len(combined), 0))
-    return np.column_stack(parts)
+        return np.empty((len(combined), 0), dtype=np.float32), encoders, num_stats
+    return np.column_stack(parts), encoders, num_stats
 
 
-def _weighted_centroid(
-    X: np.ndarray, books: list[dict], positive: bool
-) -> np.ndarray | None:
-    """Calcula centroide ponderado (perfil positivo ou negativo)."""
+def _profile_weights(books: list[dict], positive: bool) -> np.ndarray | None:
+    """Pesos normalizados (nota × decaimento temporal) dos livros do perfil."""
     weights = np.array(
         [
             _temporal_weight(b.get("date_read"), b.get("rating") or 4, positive)
@@ -102,33 +113,48 @@ def _weighted_centroid(
     w_sum = weights.sum()
     if w_sum == 0:
         return None
-    weights /= w_sum
-    return (X * weights[:, np.newaxis]).sum(axis=0).reshape(1, -1)
+    return weights / w_sum
 
 
-def get_recommendations(
-    books: list[dict[str, Any]],
-    top_n: int = 10,
-    min_rating: int = 4,
-) -> list[dict[str, Any]]:
-    """
-    Recebe a lista completa de livros do usuário e retorna até `top_n`
-    recomendações da fila ordenadas por score ajustado (KNN + negative feedback).
+def _weighted_centroid(X: np.ndarray, weights: np.ndarray | None) -> np.ndarray | None:
+    """Calcula centroide ponderado (perfil positivo ou negativo)."""
+    if weights is None:
+        return None
+    return (X * weights[:, np.newaxis]).sum(axis=0).reshape(1, -1).astype(X.dtype)
 
-    Parâmetros
-    ----------
-    books     : lista de dicts com campos do modelo Book
-    top_n     : número de recomendações a retornar
-    min_rating: nota mínima para perfil positivo (padrão: 4)
 
-    Retorno
-    -------
-    Lista de dicts (livros da fila) com campo extra `match_score` (0–100).
+@dataclass
+class RecommendationState:
     """
-    if not _SKLEARN_AVAILABLE:
-        raise RuntimeError(
-            "scikit-learn não está instalado. Execute: pip install scikit-learn"
-        )
+    Tudo que a recomendação precisa, pré-calculado para um usuário/min_rating:
+    encoders, matriz da fila normalizada (float32) e perfis. Vale enquanto
+    `version` (carimbo da biblioteca) não mudar.
+    """
+
+    version: str
+    min_rating: int
+    fila: list[dict] = field(default_factory=list)
+    X_fila: np.ndarray | None = None
+    profile_pos: np.ndarray | None = None
+    profile_neg: np.ndarray | None = None
+    encoders: dict[str, np.ndarray] = field(default_factory=dict)
+    num_stats: dict[str, tuple] = field(default_factory=dict)
+    # Ids e pesos dos lidos de cada perfil (para montar os perfis de texto)
+    pos_ids: list[int] = field(default_factory=list)
+    pos_weights: np.ndarray | None = None
+    neg_ids: list[int] = field(default_factory=list)
+    neg_weights: np.ndarray | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.profile_pos is not None and bool(self.fila)
+
+
+def build_recommendation_state(
+    books: list[dict[str, Any]], min_rating: int = 4, version: str = ""
+) -> RecommendationState:
+    """Separa lidos/fila, codifica features e calcula os perfis ponderados."""
+    state = RecommendationState(version=version, min_rating=min_rating)
 
     lidos_pos = [
         b
@@ -145,69 +171,204 @@ def get_recommendations(
     fila = [b for b in books if b.get("status") == "A Ler"]
 
     if len(lidos_pos) < MIN_LIDOS or not fila:
-        return []
+        return state
 
     # ── Feature matrix no espaço combinado ────────────────────────────────
     combined = lidos_pos + lidos_neg + fila
-    X = _build_feature_matrix(combined)
+    X, state.encoders, state.num_stats = _build_feature_matrix(combined)
 
     if X.shape[1] == 0:
-        return []
+        return state
 
     n_pos = len(lidos_pos)
     n_neg = len(lidos_neg)
     X_pos = X[:n_pos]
     X_neg = X[n_pos : n_pos + n_neg] if n_neg > 0 else None
-    X_fila = X[n_pos + n_neg :]
 
     # ── Perfis (centroides ponderados) ─────────────────────────────────────
-    profile_pos = _weighted_centroid(X_pos, lidos_pos, positive=True)
-    profile_neg = (
-        _weighted_centroid(X_neg, lidos_neg, positive=False)
-        if X_neg is not None and len(lidos_neg) >= 1
-        else None
+    state.fila = fila
+    state.X_fila = np.ascontiguousarray(X[n_pos + n_neg :])
+    state.pos_ids = [b.get("id") for b in lidos_pos]
+    state.pos_weights = _profile_weights(lidos_pos, positive=True)
+    state.profile_pos = _weighted_centroid(X_pos, state.pos_weights)
+    if X_neg is not None and len(lidos_neg) >= 1:
+        state.neg_ids = [b.get("id") for b in lidos_neg]
+        state.neg_weights = _profile_weights(lidos_neg, positive=False)
+        state.profile_neg = _weighted_centroid(X_neg, state.neg_weights)
+    return state
+
+
+def queue_text_scores(
+    state: RecommendationState, text_index: TextIndex
+) -> np.ndarray | None:
+    """
+    Cosseno de texto da fila com os perfis: sim_pos - β × sim_neg por livro
+    (NaN para quem não tem título/motivação indexados). None se os lidos do
+    perfil positivo não têm texto nenhum.
+    """
+    if not state.ready or state.pos_weights is None:
+        return None
+    profile_pos = text_index.profile(state.pos_ids, state.pos_weights)
+    if profile_pos is None:
+        return None
+    fila_ids = [b.get("id") for b in state.fila]
+    scores = text_index.similarities_for(profile_pos, fila_ids)
+    if state.neg_weights is not None:
+        profile_neg = text_index.profile(state.neg_ids, state.neg_weights)
+        if profile_neg is not None:
+            scores = scores - NEG_BETA * text_index.similarities_for(profile_neg, fila_ids)
+    return scores
+
+
+def queue_cf_scores(
+    state: RecommendationState, cf_candidates: dict[int, float]
+) -> np.ndarray | None:
+    """
+    Score colaborativo (0–1) de cada livro da fila pela obra (`work_id` do
+    título); NaN para obras fora da lista do usuário. None se nenhuma bate.
+    """
+    if not state.ready or not cf_candidates:
+        return None
+    from .collaborative import work_id
+
+    scores = np.array(
+        [cf_candidates.get(work_id(b.get("title")), np.nan) for b in state.fila],
+        dtype=np.float32,
     )
+    return None if np.isnan(scores).all() else scores
+
+
+def score_queue(
+    X_fila: np.ndarray,
+    profile_pos: np.ndarray,
+    profile_neg: np.ndarray | None,
+    top_n: int,
+    text_scores: np.ndarray | None = None,
+    cf_scores: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Ranqueamento vetorizado da fila (NumPy puro).
 
-    # ── KNN na fila — distâncias ao perfil positivo ────────────────────────
-    k = min(len(fila), max(top_n * 2, 20))  # candidatos extras antes de filtrar
-    nn_pos = NearestNeighbors(n_neighbors=k, metric="euclidean")
-    nn_pos.fit(X_fila)
-    dist_pos_all, idx_pos_all = nn_pos.kneighbors(profile_pos)
-    dist_pos_all = dist_pos_all[0]
-    idx_pos_all = idx_pos_all[0]
+    Distâncias euclidianas de todas as linhas aos perfis num único
+    `np.linalg.norm`; os k candidatos mais próximos do perfil positivo saem de
+    um `argpartition` (O(n)) e só eles são ordenados.
+
+    Com `text_scores` (ver `queue_text_scores`) e/ou `cf_scores` (ver
+    `queue_cf_scores`), os k melhores por cada um também viram candidatos e o
+    score mistura cada sinal com seu peso (TEXT_WEIGHT, CF_WEIGHT) nos livros
+    em que ele existe (não-NaN).
+
+    Retorna (índices na fila, match_score, sim_pos, sim_neg), já na ordem final.
+    """
+    n = X_fila.shape[0]
+    k = min(n, max(top_n * 2, 20))  # candidatos extras antes de filtrar
+
+    blends = [
+        (scores, weight)
+        for scores, weight in ((text_scores, TEXT_WEIGHT), (cf_scores, CF_WEIGHT))
+        if scores is not None
+    ]
+
+    dist_pos = np.linalg.norm(X_fila - profile_pos.reshape(1, -1), axis=1)
+    if k < n:
+        cand = np.argpartition(dist_pos, k - 1)[:k]
+        for scores, _ in blends:
+            ranked = np.nan_to_num(scores, nan=-np.inf)
+            cand = np.union1d(cand, np.argpartition(-ranked, k - 1)[:k])
+    else:
+        cand = np.arange(n)
+    cand = cand[np.argsort(dist_pos[cand], kind="stable")]
+    d_pos = dist_pos[cand]
+
+    max_pos = d_pos.max() if d_pos.max() > 0 else 1.0
+    sim_pos = 1.0 - d_pos / (max_pos * 1.25)  # 0–1, maior = melhor
 
-    # ── Distâncias ao perfil negativo (se houver) ──────────────────────────
-    neg_dist_map: dict[int, float] = {}
     if profile_neg is not None:
-        nn_neg = NearestNeighbors(n_neighbors=len(fila), metric="euclidean")
-        nn_neg.fit(X_fila)
-        dist_neg_full, idx_neg_full = nn_neg.kneighbors(profile_neg)
-        for di, ii in zip(dist_neg_full[0], idx_neg_full[0]):
-            neg_dist_map[int(ii)] = float(di)
+        dist_neg = np.linalg.norm(X_fila - profile_neg.reshape(1, -1), axis=1)
+        max_neg = dist_neg.max() if dist_neg.max() > 0 else 1.0
+        # 0–1, maior = mais parecido com algo não gostado
+        sim_neg = 1.0 - dist_neg[cand] / (max_neg * 1.25)
+    else:
+        sim_neg = np.zeros_like(sim_pos)
+
+    adjusted = sim_pos - NEG_BETA * sim_neg
+    for scores, weight in blends:
+        extra = scores[cand]
+        adjusted = np.where(
+            np.isnan(extra), adjusted, (1 - weight) * adjusted + weight * extra
+        )
+    match = np.clip(np.round(adjusted * 100), 1, 100).astype(int)
+
+    order = np.argsort(-match, kind="stable")[:top_n]
+    return cand[order], match[order], sim_pos[order], sim_neg[order]
+
+
+def recommend_from_state(
+    state: RecommendationState,
+    top_n: int = 10,
+    text_index: TextIndex | None = None,
+    cf_candidates: dict[int, float] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Ranqueia a fila a partir de um estado pré-calculado (+ texto, se houver
+    índice, e candidatos colaborativos, se houver job).
+    """
+    if not state.ready:
+        return []
 
-    # ── Score ajustado ─────────────────────────────────────────────────────
-    max_pos = dist_pos_all.max() if dist_pos_all.max() > 0 else 1.0
-    max_neg = max(neg_dist_map.values()) if neg_dist_map else 1.0
+    text_scores = queue_text_scores(state, text_index) if text_index else None
+    cf_scores = queue_cf_scores(state, cf_candidates) if cf_candidates else None
+    idx, match, sim_pos, sim_neg = score_queue(
+        state.X_fila,
+        state.profile_pos,
+        state.profile_neg,
+        top_n,
+        text_scores,
+        cf_scores,
+    )
 
     results = []
-    for dist, idx in zip(dist_pos_all, idx_pos_all):
-        sim_pos = 1.0 - dist / (max_pos * 1.25)  # 0–1, maior = melhor
-        sim_neg = 0.0
-        if idx in neg_dist_map:
-            d_neg = neg_dist_map[idx]
-            sim_neg = 1.0 - d_neg / (
-                max_neg * 1.25
-            )  # 0–1, maior = mais parecido com algo não gostado
-
-        adjusted = sim_pos - NEG_BETA * sim_neg
-        match_score = max(1, min(100, round(adjusted * 100)))
-
-        book = dict(fila[int(idx)])
-        book["match_score"] = match_score
-        book["_sim_pos"] = round(sim_pos * 100)
-        book["_sim_neg"] = round(sim_neg * 100)
+    for i, score, s_pos, s_neg in zip(idx, match, sim_pos, sim_neg):
+        book = dict(state.fila[int(i)])
+        book["match_score"] = int(score)
+        book["_sim_pos"] = round(float(s_pos) * 100)
+        book["_sim_neg"] = round(float(s_neg) * 100)
+        if text_scores is not None and not np.isnan(text_scores[i]):
+            book["_sim_text"] = round(float(text_scores[i]) * 100)
+        if cf_scores is not None and not np.isnan(cf_scores[i]):
+            book["_cf_score"] = round(float(cf_scores[i]) * 100)
         results.append(book)
+    return results
+
+
+def get_recommendations(
+    books: list[dict[str, Any]],
+    top_n: int = 10,
+    min_rating: int = 4,
+    use_text: bool = True,
+    cf_candidates: dict[int, float] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Recebe a lista completa de livros do usuário e retorna até `top_n`
+    recomendações da fila ordenadas por score ajustado (distância + negative feedback).
+
+    Parâmetros
+    ----------
+    books     : lista de dicts com campos do modelo Book
+    top_n     : número de recomendações a retornar
+    min_rating: nota mínima para perfil positivo (padrão: 4)
+    use_text  : mistura o cosseno TF-IDF de título + motivação (padrão: sim)
+    cf_candidates: {work_id: score 0–1} do job colaborativo
+                   (`collaborative.get_cf_candidates`), misturado se informado
+
+    Retorno
+    -------
+    Lista de dicts (livros da fila) com campo extra `match_score` (0–100).
+    """
+    state = build_recommendation_state(books, min_rating)
+    text_index = None
+    if use_text and state.ready and all(b.get("id") is not None for b in books):
+        from .text_vectors import build_text_index
 
-    # Ordena por score ajustado e retorna top_n
-    results.sort(key=lambda b: b["match_score"], reverse=True)
-    return results[:top_n]
+        text_index = build_text_index(books)
+    return recommend_from_state(state, top_n, text_index, cf_candidates)
@@ -0,0 +1,90 @@
+"""
+recommendation_bench.py — Benchmark do ranqueamento da fila em filas sintéticas.
+
+Compara `score_queue` (NumPy puro) com a implementação antiga baseada em
+`sklearn.neighbors.NearestNeighbors` (só se scikit-learn estiver instalado).
+
+Uso:
+    python -m app.services.recommendation_bench [--n 100000] [--dims 5] [--repeat 20]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from .recommendation import NEG_BETA, score_queue
+
+
+def _sklearn_reference(X_fila, profile_pos, profile_neg, top_n):
+    """Caminho anterior: dois NearestNeighbors + laço em Python com dict."""
+    from sklearn.neighbors import NearestNeighbors
+
+    k = min(len(X_fila), max(top_n * 2, 20))
+    nn_pos = NearestNeighbors(n_neighbors=k, metric="euclidean").fit(X_fila)
+    dist_pos_all, idx_pos_all = nn_pos.kneighbors(profile_pos.reshape(1, -1))
+    dist_pos_all, idx_pos_all = dist_pos_all[0], idx_pos_all[0]
+
+    neg_dist_map = {}
+    nn_neg = NearestNeighbors(n_neighbors=len(X_fila), metric="euclidean").fit(X_fila)
+    dist_neg_full, idx_neg_full = nn_neg.kneighbors(profile_neg.reshape(1, -1))
+    for di, ii in zip(dist_neg_full[0], idx_neg_full[0]):
+        neg_dist_map[int(ii)] = float(di)
+
+    max_pos = dist_pos_all.max() if dist_pos_all.max() > 0 else 1.0
+    max_neg = max(neg_dist_map.values())
+    results = []
+    for dist, idx in zip(dist_pos_all, idx_pos_all):
+        sim_pos = 1.0 - dist / (max_pos * 1.25)
+        sim_neg = 1.0 - neg_dist_map[idx] / (max_neg * 1.25)
+        results.append((max(1, min(100, round((sim_pos - NEG_BETA * sim_neg) * 100))), idx))
+    results.sort(key=lambda r: r[0], reverse=True)
+    return results[:top_n]
+
+
+def _timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run(n: int, dims: int, repeat: int, top_n: int = 10, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    X_fila = rng.standard_normal((n, dims)).astype(np.float32)
+    profile_pos = rng.standard_normal(dims).astype(np.float32)
+    profile_neg = rng.standard_normal(dims).astype(np.float32)
+
+    numpy_ms = _timeit(
+        lambda: score_queue(X_fila, profile_pos, profile_neg, top_n), repeat
+    )
+    print(f"Fila sintética: {n} livros × {dims} features (top {top_n})")
+    print(f"  NumPy (norm + argpartition): {numpy_ms:8.2f} ms")
+
+    try:
+        import sklearn  # noqa: F401
+    except ImportError:
+        print("  scikit-learn não instalado: referência antiga não medida")
+        return
+
+    sklearn_ms = _timeit(
+        lambda: _sklearn_reference(X_fila, profile_pos, profile_neg, top_n),
+        max(1, repeat // 5),
+    )
+    print(f"  sklearn NearestNeighbors:    {sklearn_ms:8.2f} ms")
+    print(f"  Ganho: {sklearn_ms / numpy_ms:.1f}×")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do ranqueamento da fila")
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dims", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+    run(args.n, args.dims, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+recommendation_rf.py — Recomendador Random Forest (algoritmo C da análise).
+
+Mesma ideia de `analysis/analyze_recommendations.py::_run_algo_c`:
+1. Treina um RandomForest nos livros lidos com nota (positivo = nota >=
+   min_rating), com pesos de nota × decaimento temporal.
+2. Features: classe, categoria, tipo (códigos), score, ano e anos desde a
+   leitura (recência).
+3. `predict_proba` na fila → escala 10–95% → diversidade (máx. 3 por classe
+   entre os 40 primeiros).
+
+O modelo é guardado (memória + disco) pela versão dos lidos com nota: só
+retreina quando eles mudam. O treino roda sempre numa thread em background:
+o modelo anterior continua servindo e, sem nenhum, o chamador cai no
+recomendador padrão. No startup os modelos mais recentes do disco já são
+carregados.
+
+`joblib.load` executa pickle: o diretório de modelos (RECOMMENDER_MODEL_DIR,
+ou um diretório 0700 por usuário do sistema no tmp) só é usado se pertence
+ao processo e ninguém mais pode gravar nele; caso contrário os modelos
+ficam só em memória.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from .recommendation import MIN_LIDOS, _temporal_weight
+
+# sklearn é opcional — se não instalado, algo=rf retorna 503
+try:
+    import joblib
+    from sklearn.ensemble import RandomForestClassifier
+
+    _SKLEARN_AVAILABLE = True
+except ImportError:
+    _SKLEARN_AVAILABLE = False
+
+
+MIN_TRAIN = 4  # mínimo de lidos com nota para treinar
+CAT_COLS = ["book_class", "category", "type"]
+NUM_COLS = ["score", "year"]
+DIVERSITY_MAX_PER_CLASS = 3
+DIVERSITY_POOL = 40
+RF_PARAMS = dict(
+    n_estimators=300,
+    max_depth=5,
+    min_samples_leaf=2,
+    class_weight="balanced",
+    random_state=42,
+)
+# Sem RECOMMENDER_MODEL_DIR: diretório privado no tmp (um por usuário do sistema)
+DEFAULT_MODEL_DIR = Path(tempfile.gettempdir()) / f"rf_models-{os.getuid()}"
+
+
+@dataclass
+class RFModel:
+    version: str
+    min_rating: int
+    clf: Any
+    # Coluna categórica → {valor: código}; valores novos viram -1
+    encoders: dict[str, dict[str, int]]
+    n_samples: int
+    trained_at: float
+
+
+def _years_since_read(date_read) -> float:
+    if not date_read:
+        return 10.0  # valor alto = leitura antiga
+    try:
+        dt = datetime.fromisoformat(str(date_read)[:10]).replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - dt).days / 365.25
+    except (ValueError, TypeError):
+        return 10.0
+
+
+def split_rated(books: list[dict], min_rating: int) -> tuple[list, list, list]:
+    lidos = [
+        b for b in books if b.get("status") == "Lido" and (b.get("rating") or 0) > 0
+    ]
+    lidos_pos = [b for b in lidos if b["rating"] >= min_rating]
+    lidos_neg = [b for b in lidos if b["rating"] < min_rating]
+    fila = [b for b in books if b.get("status") == "A Ler"]
+    return lidos_pos, lidos_neg, fila
+
+
+def training_version(books: list[dict], min_rating: int) -> str:
+    """Hash só dos lidos com nota (o que o modelo aprende)."""
+    lidos_pos, lidos_neg, _ = split_rated(books, min_rating)
+    rows = sorted(
+        [
+            b.get("id"),
+            b.get("rating"),
+            str(b.get("date_read") or ""),
+            *(str(b.get(c) or "?") for c in CAT_COLS),
+            *(float(b.get(c) or 0) for c in NUM_COLS),
+        ]
+        for b in lidos_pos + lidos_neg
+    )
+    payload = json.dumps([min_rating, rows], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _fit_encoders(books: list[dict]) -> dict[str, dict[str, int]]:
+    encoders = {}
+    for col in CAT_COLS:
+        classes = sorted({str(b.get(col) or "?") for b in books})
+        encoders[col] = {value: code for code, value in enumerate(classes)}
+    return encoders
+
+
+def _features(books: list[dict], encoders: dict[str, dict[str, int]]) -> np.ndarray:
+    # Árvores não dependem de escala: as numéricas entram cruas
+    X = np.empty((len(books), len(CAT_COLS) + len(NUM_COLS) + 1), dtype=np.float32)
+    for i, b in enumerate(books):
+        row = [encoders[c].get(str(b.get(c) or "?"), -1) for c in CAT_COLS]
+        row += [float(b.get(c) or 0) for c in NUM_COLS]
+        row.append(_years_since_read(b.get("date_read")))
+        X[i] = row
+    return X
+
+
+def train_rf_model(
+    books: list[dict], min_rating: int, version: Optional[str] = None
+) -> Optional[RFModel]:
+    """Treina o modelo; None se não há dados suficientes (ou só uma classe)."""
+    lidos_pos, lidos_neg, _ = split_rated(books, min_rating)
+    lidos = lidos_pos + lidos_neg
+    if len(lidos) < MIN_TRAIN or len(lidos_pos) < MIN_LIDOS or not lidos_neg:
+        return None
+
+    encoders = _fit_encoders(lidos)
+    X = _features(lidos, encoders)
+    y = np.array([1] * len(lidos_pos) + [0] * len(lidos_neg))
+    # Leituras recentes e bem avaliadas pesam mais no treino
+    weights = np.array(
+        [_temporal_weight(b.get("date_read"), b["rating"], True) for b in lidos_pos]
+        + [_temporal_weight(b.get("date_read"), b["rating"], False) for b in lidos_neg]
+    )
+    weights /= weights.sum()
+
+    clf = RandomForestClassifier(**RF_PARAMS)
+    clf.fit(X, y, sample_weight=weights)
+    return RFModel(
+        version=version or training_version(books, min_rating),
+        min_rating=min_rating,
+        clf=clf,
+        encoders=encoders,
+        n_samples=len(lidos),
+        trained_at=time.time(),
+    )
+
+
+def _apply_diversity(fila_sorted: list[dict]) -> list[dict]:
+    """Máximo DIVERSITY_MAX_PER_CLASS livros por classe nos primeiros DIVERSITY_POOL."""
+    top_pool = fila_sorted[:DIVERSITY_POOL]
+    counts: dict[str, int] = {}
+    chosen, skipped = [], []
+    for b in top_pool:
+        cls = b.get("book_class") or "?"
+        if counts.get(cls, 0) < DIVERSITY_MAX_PER_CLASS:
+            chosen.append(b)
+            counts[cls] = counts.get(cls, 0) + 1
+        else:
+            skipped.append(b)
+    return chosen + skipped + fila_sorted[DIVERSITY_POOL:]
+
+
+def predict_rf(model: RFModel, fila: list[dict], top_n: int) -> list[dict]:
+    if not fila:
+        return []
+    probs = model.clf.predict_proba(_features(fila, model.encoders))[:, 1]
+
+    lo, hi = probs.min(), probs.max()
+    span = hi - lo if hi > lo else 1.0
+    scores = np.clip(np.round((probs - lo) / span * 85 + 10), 1, 100).astype(int)
+
+    results = []
+    for b, score, prob in zip(fila, scores, probs):
+        book = dict(b)
+        book["match_score"] = int(score)
+        book["_prob"] = round(float(prob) * 100)
+        results.append(book)
+    results.sort(key=lambda b: b["match_score"], reverse=True)
+    return _apply_diversity(results)[:top_n]
+
+
+# ── Modelos por usuário ───────────────────────────────────────────────────────
+def model_dir() -> Path:
+    return Path(settings.RECOMMENDER_MODEL_DIR or DEFAULT_MODEL_DIR)
+
+
+def _owned_by_us(st: os.stat_result) -> bool:
+    return st.st_uid == os.getuid()
+
+
+def ensure_private_dir(path: Path, private: bool) -> bool:
+    """
+    Cria o diretório (0700) se faltar e confere se é seguro ler pickles dele:
+    diretório de verdade (não symlink), do usuário do processo e sem escrita
+    para grupo/outros. `private` exige também sem leitura (diretório no tmp).
+    """
+    try:
+        path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = path.lstat()
+    except OSError as e:
+        print(f"RF: diretório de modelos indisponível ({path}): {e}")
+        return False
+    forbidden = 0o077 if private else 0o022
+    if not stat.S_ISDIR(st.st_mode) or not _owned_by_us(st):
+        print(f"RF: {path} não é um diretório do processo; modelos só em memória")
+        return False
+    if st.st_mode & forbidden:
+        print(f"RF: {path} tem permissões abertas demais; modelos só em memória")
+        return False
+    return True
+
+
+def _user_hash(user_id: str) -> str:
+    return hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:16]
+
+
+class RFModelStore:
+    """Modelo mais recente por (usuário, min_rating), em memória e em disco."""
+
+    def __init__(self, model_dir: Path, private: bool = True):
+        self.model_dir = Path(model_dir)
+        self.private = private
+        self._disk_ok: Optional[bool] = None
+        # Chave: (hash do usuário, min_rating), como no nome dos arquivos
+        self._models: dict[tuple, RFModel] = {}
+        self._training: set[tuple] = set()
+        self._lock = threading.Lock()
+
+    def _disk(self) -> bool:
+        """Disco liberado? (checado uma vez, na primeira leitura/escrita)"""
+        if self._disk_ok is None:
+            self._disk_ok = ensure_private_dir(self.model_dir, self.private)
+        return self._disk_ok
+
+    def _path(self, user_id: str, min_rating: int, version: str) -> Path:
+        return self.model_dir / f"{_user_hash(user_id)}_{min_rating}_{version}.joblib"
+
+    def _read(self, path: Path) -> Optional[RFModel]:
+        try:
+            st = path.lstat()
+            if not stat.S_ISREG(st.st_mode) or not _owned_by_us(st):
+                print(f"RF: ignorando {path.name} (não é um arquivo do processo)")
+                return None
+            return joblib.load(path)
+        except Exception as e:
+            print(f"RF: falha ao carregar modelo {path.name}: {e}")
+            return None
+
+    def latest(self, user_id: str, min_rating: int) -> Optional[RFModel]:
+        with self._lock:
+            return self._models.get((_user_hash(user_id), min_rating))
+
+    def load(self, user_id: str, min_rating: int, version: str) -> Optional[RFModel]:
+        """Modelo dessa versão (memória, depois disco) ou None."""
+        model = self.latest(user_id, min_rating)
+        if model is not None and model.version == version:
+            return model
+        if not self._disk():
+            return None
+        path = self._path(user_id, min_rating, version)
+        if not path.exists():
+            return None
+        model = self._read(path)
+        if model is None:
+            return None
+        with self._lock:
+            self._models[(_user_hash(user_id), min_rating)] = model
+        return model
+
+    def preload(self) -> int:
+        """Carrega do disco o modelo mais novo de cada (usuário, min_rating)."""
+        if not self._disk():
+            return 0
+        newest: dict[str, tuple[float, Path]] = {}
+        for path in self.model_dir.glob("*.joblib"):
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            prefix = path.name.rsplit("_", 1)[0]
+            if prefix not in newest or mtime > newest[prefix][0]:
+                newest[prefix] = (mtime, path)
+
+        loaded = 0
+        for prefix, (_, path) in newest.items():
+            user_hash, _, min_rating = prefix.rpartition("_")
+            model = self._read(path)
+            if model is None or not min_rating.isdigit():
+                continue
+            with self._lock:
+                self._models.setdefault((user_hash, int(min_rating)), model)
+            loaded += 1
+        return loaded
+
+    def save(self, user_id: str, model: RFModel):
+        with self._lock:
+            self._models[(_user_hash(user_id), model.min_rating)] = model
+        if not self._disk():
+            return
+        try:
+            path = self._path(user_id, model.min_rating, model.version)
+            tmp_path = path.with_suffix(".tmp")
+            joblib.dump(model, tmp_path)
+            tmp_path.replace(path)
+            # Versões antigas do mesmo usuário não servem mais
+            prefix = path.name.rsplit("_", 1)[0] + "_"
+            for old in self.model_dir.glob(f"{prefix}*.joblib"):
+                if old != path:
+                    old.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"RF: falha ao salvar modelo: {e}")
+
+    def retrain_async(
+        self, user_id: str, books: list[dict], min_rating: int, version: str
+    ):
+        """Retreina numa thread (uma por usuário/min_rating por vez)."""
+        key = (_user_hash(user_id), min_rating)
+        with self._lock:
+            if key in self._training:
+                return
+            self._training.add(key)
+
+        def _run():
+            try:
+                model = train_rf_model(books, min_rating, version)
+                if model is not None:
+                    self.save(user_id, model)
+            except Exception as e:
+                print(f"RF: erro no retreino de {user_id}: {e}")
+            finally:
+                with self._lock:
+                    self._training.discard(key)
+
+        threading.Thread(target=_run, daemon=True, name=f"rf-{user_id[:8]}").start()
+
+
+rf_models = RFModelStore(model_dir(), private=not settings.RECOMMENDER_MODEL_DIR)
+
+
+def preload_rf_models():
+    """Startup: sobe os modelos do disco numa thread (não atrasa o boot)."""
+    if not _SKLEARN_AVAILABLE:
+        return
+
+    def _run():
+        loaded = rf_models.preload()
+        if loaded:
+            print(f"RF: {loaded} modelo(s) carregado(s) do disco")
+
+    threading.Thread(target=_run, daemon=True, name="rf-preload").start()
+
+
+def get_rf_recommendations(
+    user_id: str, books: list[dict[str, Any]], top_n: int = 10, min_rating: int = 4
+) -> Optional[list[dict[str, Any]]]:
+    """
+    Recomendações pelo RF. Retorna None se ainda não há modelo (o primeiro
+    está treinando em background, ou não há dados para treinar — sem lidos
+    negativos, por exemplo): o chamador cai no recomendador padrão.
+    """
+    if not _SKLEARN_AVAILABLE:
+        raise RuntimeError(
+            "scikit-learn não está instalado. Execute: pip install scikit-learn"
+        )
+
+    _, _, fila = split_rated(books, min_rating)
+    version = training_version(books, min_rating)
+    model = rf_models.load(user_id, min_rating, version)
+
+    if model is None:
+        # Treino nunca no request: responde com o modelo anterior (se houver)
+        # e o novo fica pronto em background
+        rf_models.retrain_async(user_id, books, min_rating, version)
+        model = rf_models.latest(user_id, min_rating)
+        if model is None:
+            return None
+
+    return predict_rf(model, fila, top_n)
@@ -0,0 +1,111 @@
+"""
+recommendation_state.py — Cache em memória do estado de recomendação por usuário.
+
+O estado (encoders, matriz da fila em float32, perfis positivo/negativo) é
+caro de montar e só muda quando a biblioteca muda. O carimbo de versão é um
+hash das colunas que entram no modelo (+ `updated_at` e a data do dia, por
+causa do decaimento temporal), lido com uma consulta só dessas colunas —
+sem carregar nem serializar os livros. `order` e `cover_image` também
+entram: a fila guardada no estado é devolvida como resposta, e upload de
+capa e reordenação gravam essas colunas sem mexer em `updated_at`.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Optional
+
+from sqlmodel import Session, select
+
+from app.models.book import Book
+from .recommendation import RecommendationState, build_recommendation_state
+
+MAX_CACHED_STATES = 256
+
+VERSION_COLUMNS = (
+    Book.id,
+    Book.status,
+    Book.rating,
+    Book.date_read,
+    Book.book_class,
+    Book.category,
+    Book.type,
+    Book.score,
+    Book.year,
+    Book.updated_at,
+    # Vão na resposta (fila) e mudam sem tocar em updated_at
+    Book.order,
+    Book.cover_image,
+)
+
+
+def library_version(session: Session, user_id: str) -> str:
+    rows = session.exec(
+        select(*VERSION_COLUMNS).where(Book.user_id == user_id).order_by(Book.id)
+    ).all()
+    digest = hashlib.sha256(date.today().isoformat().encode())
+    for row in rows:
+        digest.update(repr(tuple(row)).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+class RecommendationStateCache:
+    """LRU de estados por (usuário, min_rating)."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_STATES):
+        self.max_entries = max_entries
+        self._states: OrderedDict[tuple, RecommendationState] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self, user_id: str, min_rating: int, version: str
+    ) -> Optional[RecommendationState]:
+        key = (user_id, min_rating)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None or state.version != version:
+                self.misses += 1
+                return None
+            self._states.move_to_end(key)
+            self.hits += 1
+            return state
+
+    def put(self, user_id: str, state: RecommendationState):
+        key = (user_id, state.min_rating)
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            for key in [k for k in self._states if k[0] == user_id]:
+                del self._states[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._states), "hits": self.hits, "misses": self.misses}
+
+
+recommendation_states = RecommendationStateCache()
+
+
+def get_recommendation_state(
+    session: Session, user_id: str, min_rating: int = 4
+) -> RecommendationState:
+    """Estado do cache se a biblioteca não mudou; senão reconstrói e guarda."""
+    version = library_version(session, user_id)
+    state = recommendation_states.get(user_id, min_rating, version)
+    if state is not None:
+        return state
+
+    books = session.exec(select(Book).where(Book.user_id == user_id)).all()
+    state = build_recommendation_state(
+        [b.model_dump() for b in books], min_rating, version
+    )
+    recommendation_states.put(user_id, state)
+    return state
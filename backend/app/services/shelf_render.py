@@ -0,0 +1,281 @@
+"""
+shelf_render.py — Imagem compartilhável da estante gerada no servidor.
+
+Mesmo layout do `BookshelfExporter.jsx` (1200px, cabeçalho, grade
+adaptativa de capas, rodapé), desenhado com Pillow:
+
+1. As capas vêm do `cover_cache` (baixadas em paralelo por `cover_fetch`,
+   como no /proxy/image, se faltarem).
+2. O desenho roda num ProcessPoolExecutor (CPU-bound, fora dos workers da API)
+   com processos "spawn": fork de um processo com threads (threadpool,
+   cliente HTTP, conexões) pode herdar locks travados.
+3. O resultado é memorizado no `cover_cache` pela hash do conteúdo da estante
+   + opções de layout: a mesma estante no mesmo dia não é redesenhada.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from .cover_cache import CacheEntry, cache_key, get_cover_cache
+from .cover_fetch import fetch_cover_paths
+from .singleflight import AsyncSingleFlight
+
+CANVAS_WIDTH = 1200
+OUTER_PADDING = 40
+INNER_PADDING = 32
+HEADER_HEIGHT = 90
+FOOTER_HEIGHT = 70
+MIN_HEIGHT = 800
+MAX_SHELF_BOOKS = 600
+
+FORMATS = {"png": ("PNG", "image/png"), "webp": ("WEBP", "image/webp")}
+
+# (mínimo de livros, largura mínima da capa, espaçamento) — igual ao exportador
+GRID_STEPS = [(61, 55, 4), (43, 65, 5), (33, 75, 6), (21, 90, 8), (13, 120, 10)]
+DEFAULT_GRID = (150, 16)
+
+COLORS = {
+    "background": (255, 255, 255),
+    "title": (30, 41, 59),
+    "muted": (148, 163, 184),
+    "rule": (226, 232, 240),
+    "placeholder": (243, 232, 255),
+    "placeholder_text": (88, 28, 135),
+    "footer": (51, 65, 85),
+}
+
+# Renderizações em andamento por chave (deduplicação)
+render_flight = AsyncSingleFlight()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.SHELF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def filter_summary(years: list[int], book_class: Optional[str]) -> str:
+    parts = []
+    if years:
+        years = sorted(years)
+        if len(years) > 3:
+            parts.append(f"{years[0]} - {years[-1]}")
+        else:
+            parts.append(", ".join(str(y) for y in years))
+    if book_class and book_class != "all":
+        parts.append(book_class)
+    return " • ".join(parts) if parts else "Todos os livros lidos"
+
+
+def grid_layout(count: int, width: int) -> tuple:
+    """(colunas, largura da capa, espaçamento), como o `auto-fill` do CSS."""
+    min_width, gap = DEFAULT_GRID
+    for threshold, step_width, step_gap in GRID_STEPS:
+        if count >= threshold:
+            min_width, gap = step_width, step_gap
+            break
+    columns = max(1, (width + gap) // (min_width + gap))
+    tile_width = (width - gap * (columns - 1)) / columns
+    return columns, tile_width, gap
+
+
+# ── Desenho (roda em outro processo: só recebe dados simples) ────────────────
+def _font(size: int, bold: bool = False):
+    from PIL import ImageFont
+
+    name = "DejaVuSans-Bold.ttf" if bold else "DejaVuSans.ttf"
+    try:
+        return ImageFont.truetype(name, size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:  # Pillow < 10.1
+            return ImageFont.load_default()
+
+
+def render_shelf(spec: dict) -> bytes:
+    from PIL import Image, ImageDraw, ImageOps
+
+    scale = spec["scale"]
+    covers = spec["covers"]
+
+    def s(value: float) -> int:
+        return round(value * scale)
+
+    content_width = CANVAS_WIDTH - 2 * (OUTER_PADDING + INNER_PADDING)
+    columns, tile_w, gap = grid_layout(len(covers), content_width)
+    tile_h = tile_w * 1.5
+    rows = -(-len(covers) // columns) if covers else 0
+    grid_height = rows * tile_h + max(0, rows - 1) * gap
+    height = max(
+        MIN_HEIGHT,
+        2 * (OUTER_PADDING + INNER_PADDING) + HEADER_HEIGHT + grid_height + FOOTER_HEIGHT,
+    )
+
+    canvas = Image.new("RGB", (s(CANVAS_WIDTH), s(height)), COLORS["background"])
+    draw = ImageDraw.Draw(canvas)
+    left = OUTER_PADDING + INNER_PADDING
+    right = CANVAS_WIDTH - left
+    top = OUTER_PADDING + INNER_PADDING
+
+    # Cabeçalho
+    title_font = _font(s(36), bold=True)
+    draw.text((s(left), s(top)), "Minha Estante", font=title_font, fill=COLORS["title"])
+    title_width = draw.textlength("Minha Estante", font=title_font) / scale
+    draw.text(
+        (s(left + title_width + 12), s(top + 10)),
+        spec["summary"],
+        font=_font(s(24)),
+        fill=COLORS["muted"],
+    )
+    count_text = f"{spec['total']} livros"
+    count_font = _font(s(22), bold=True)
+    count_width = draw.textlength(count_text, font=count_font) / scale
+    draw.text(
+        (s(right - count_width), s(top + 10)), count_text, font=count_font, fill=COLORS["title"]
+    )
+    rule_y = top + HEADER_HEIGHT - 24
+    draw.line([(s(left), s(rule_y)), (s(right), s(rule_y))], fill=COLORS["rule"], width=s(1))
+
+    # Grade de capas
+    grid_top = top + HEADER_HEIGHT
+    tile_size = (s(tile_w), s(tile_h))
+    label_font = _font(max(8, s(10)), bold=True)
+    for index, (title, path) in enumerate(covers):
+        x = left + (index % columns) * (tile_w + gap)
+        y = grid_top + (index // columns) * (tile_h + gap)
+        tile = None
+        if path:
+            try:
+                with Image.open(path) as img:
+                    img = ImageOps.exif_transpose(img).convert("RGB")
+                    tile = ImageOps.fit(img, tile_size, Image.LANCZOS)
+            except (OSError, Image.DecompressionBombError):
+                tile = None
+        if tile is None:
+            tile = Image.new("RGB", tile_size, COLORS["placeholder"])
+            ImageDraw.Draw(tile).text(
+                (s(6), s(6)), title[:40], font=label_font, fill=COLORS["placeholder_text"]
+            )
+        canvas.paste(tile, (s(x), s(y)))
+
+    # Rodapé
+    footer_y = height - OUTER_PADDING - INNER_PADDING - FOOTER_HEIGHT + 24
+    draw.line(
+        [(s(left), s(footer_y)), (s(right), s(footer_y))], fill=COLORS["rule"], width=s(1)
+    )
+    draw.text(
+        (s(left), s(footer_y + 16)), "bookstack-ai", font=_font(s(20), bold=True), fill=COLORS["footer"]
+    )
+    date_text = f"Gerado em {spec['date']}"
+    date_font = _font(s(14))
+    date_width = draw.textlength(date_text, font=date_font) / scale
+    draw.text(
+        (s(right - date_width), s(footer_y + 20)), date_text, font=date_font, fill=COLORS["muted"]
+    )
+
+    pil_format, _ = FORMATS[spec["fmt"]]
+    buf = io.BytesIO()
+    if pil_format == "WEBP":
+        canvas.save(buf, format="WEBP", quality=85, method=4)
+    else:
+        canvas.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+# ── Orquestração ──────────────────────────────────────────────────────────────
+def shelf_render_key(books: list, options: dict) -> str:
+    payload = json.dumps(
+        [[(b.id, b.title, b.cover_image) for b in books], options],
+        separators=(",", ":"),
+        sort_keys=True,
+        default=str,
+    )
+    return cache_key("shelf", hashlib.sha256(payload.encode("utf-8")).hexdigest())
+
+
+async def _fetch_covers(books: list) -> list[tuple]:
+    """[(título, caminho da capa ou None)] na ordem dos livros."""
+    urls = sorted(
+        {b.cover_image for b in books if (b.cover_image or "").startswith("http")}
+    )
+    paths = await fetch_cover_paths(urls)
+    return [
+        (b.title, str(paths[b.cover_image]) if paths.get(b.cover_image) else None)
+        for b in books
+    ]
+
+
+def _store_render(key: str, content: bytes, content_type: str) -> CacheEntry:
+    cache = get_cover_cache()
+    tmp_path = cache.temp_path(key)
+    try:
+        tmp_path.write_bytes(content)
+        return cache.commit(key, tmp_path, content_type)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+async def _render(key: str, books: list, options: dict) -> CacheEntry:
+    covers = await _fetch_covers(books)
+    loop = asyncio.get_running_loop()
+    content = await loop.run_in_executor(
+        _get_pool(), render_shelf, {**options, "covers": covers}
+    )
+    return await run_in_threadpool(
+        _store_render, key, content, FORMATS[options["fmt"]][1]
+    )
+
+
+async def get_shelf_image(
+    books: list,
+    fmt: str,
+    scale: int = 2,
+    years: Optional[list[int]] = None,
+    book_class: Optional[str] = None,
+) -> CacheEntry:
+    """Imagem da estante no cache (renderizando em processo separado se preciso)."""
+    total = len(books)
+    books = [b for b in books if b.cover_image][:MAX_SHELF_BOOKS]
+    options = {
+        "fmt": fmt,
+        "scale": scale,
+        "summary": filter_summary(years or [], book_class),
+        "total": total,
+        "date": date.today().strftime("%d/%m/%Y"),
+    }
+    key = shelf_render_key(books, options)
+    cache = get_cover_cache()
+
+    entry = await run_in_threadpool(cache.lookup, key)
+    if entry is not None:
+        return entry
+
+    # Duas abas pedindo a mesma estante esperam uma única renderização
+    return await render_flight.do(key, lambda: _render(key, books, options))
@@ -0,0 +1,389 @@
+"""
+similar_books.py — Índice kNN por usuário para "livros parecidos".
+
+Mesmo espaço de features da recomendação: classe, categoria e tipo como
+códigos + score e ano padronizados. Para cada livro o índice guarda os
+K_INDEX vizinhos mais próximos (ids em int32, distâncias em float32), então
+`GET /books/{id}/similar` só lê uma linha — O(k), sem varrer a biblioteca.
+
+Atualização incremental: encoders e média/desvio ficam congelados na última
+reconstrução completa. Quando a biblioteca muda, só as linhas novas ou
+alteradas são recodificadas e só as listas afetadas são recalculadas
+(O(m·n) em vez de O(n²)). Depois de muitas mudanças acumuladas (ou se o
+índice sumiu do cache) reconstrói tudo e reajusta os encoders.
+
+Com o índice de texto (text_vectors.py), `rank_similar` mistura o cosseno
+TF-IDF de título + motivação: os vizinhos pelo texto também entram como
+candidatos (um produto esparso da linha do livro com a matriz do usuário).
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app.core.database import engine
+from app.models.book import Book
+from .recommendation import CAT_COLS, NUM_COLS, TEXT_WEIGHT
+from .recommendation_state import library_version
+
+if TYPE_CHECKING:
+    from .text_vectors import TextIndex
+
+K_INDEX = 20  # vizinhos guardados por livro (teto do `k` da consulta)
+CHUNK_ROWS = 1024  # linhas por bloco no cálculo das distâncias
+REBUILD_MIN_CHANGES = 32
+REBUILD_FRACTION = 0.2  # reconstrói tudo após mudar 20% das linhas
+MAX_CACHED_INDEXES = 256
+
+FEATURE_COLUMNS = (Book.id, *(getattr(Book, c) for c in CAT_COLS + NUM_COLS))
+
+
+@dataclass
+class SimilarityIndex:
+    version: str
+    ids: np.ndarray  # int32 (n,)
+    X: np.ndarray  # float32 (n, d)
+    neighbors: np.ndarray  # int32 (n, K_INDEX) — ids dos vizinhos, -1 = vazio
+    distances: np.ndarray  # float32 (n, K_INDEX) — inf = vazio
+    fingerprints: dict[int, tuple] = field(default_factory=dict)
+    # Coluna categórica → {valor: código}; valores novos ganham o próximo código
+    encoders: dict[str, dict[str, int]] = field(default_factory=dict)
+    num_stats: dict[str, tuple] = field(default_factory=dict)
+    changes: int = 0  # linhas mexidas desde a última reconstrução
+
+    def __post_init__(self):
+        self.row_of = {int(book_id): row for row, book_id in enumerate(self.ids)}
+
+    def lookup(self, book_id: int, k: int) -> list[tuple[int, float]]:
+        """[(id do vizinho, distância)] mais próximos primeiro."""
+        row = self.row_of.get(book_id)
+        if row is None:
+            return []
+        ids, dists = self.neighbors[row, :k], self.distances[row, :k]
+        return [(int(i), float(d)) for i, d in zip(ids, dists) if i >= 0]
+
+
+# ── Features ──────────────────────────────────────────────────────────────────
+def _fingerprint(book: dict) -> tuple:
+    return tuple(str(book.get(c) or "?") for c in CAT_COLS) + tuple(
+        float(book.get(c) or 0) for c in NUM_COLS
+    )
+
+
+def _fit(books: list[dict]) -> tuple[dict, dict]:
+    encoders = {}
+    for col in CAT_COLS:
+        classes = sorted({str(b.get(col) or "?") for b in books})
+        encoders[col] = {value: code for code, value in enumerate(classes)}
+    num_stats = {}
+    for col in NUM_COLS:
+        vals = np.array([float(b.get(col) or 0) for b in books])
+        std = float(vals.std()) if len(vals) else 0.0
+        num_stats[col] = (float(vals.mean()) if len(vals) else 0.0, std or 1.0)
+    return encoders, num_stats
+
+
+def _encode_rows(books: list[dict], encoders: dict, num_stats: dict) -> np.ndarray:
+    X = np.empty((len(books), len(CAT_COLS) + len(NUM_COLS)), dtype=np.float32)
+    for i, b in enumerate(books):
+        row = []
+        for col in CAT_COLS:
+            enc = encoders[col]
+            row.append(enc.setdefault(str(b.get(col) or "?"), len(enc)))
+        for col in NUM_COLS:
+            mean, std = num_stats[col]
+            row.append((float(b.get(col) or 0) - mean) / std)
+        X[i] = row
+    return X
+
+
+# ── Vizinhos ──────────────────────────────────────────────────────────────────
+def _pairwise(Xq: np.ndarray, X: np.ndarray) -> np.ndarray:
+    """Distâncias euclidianas (float32) de cada linha de Xq a cada linha de X."""
+    sq = (
+        (Xq * Xq).sum(axis=1)[:, None]
+        + (X * X).sum(axis=1)[None, :]
+        - 2.0 * (Xq @ X.T)
+    )
+    return np.sqrt(np.maximum(sq, 0.0, out=sq))
+
+
+def _top_k(dists: np.ndarray, cand_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Os K_INDEX menores por linha (argpartition + sort só do recorte)."""
+    n_rows, n_cand = dists.shape
+    neighbors = np.full((n_rows, K_INDEX), -1, dtype=np.int32)
+    distances = np.full((n_rows, K_INDEX), np.inf, dtype=np.float32)
+    k = min(K_INDEX, n_cand)
+    if k == 0:
+        return neighbors, distances
+    part = np.argpartition(dists, k - 1, axis=1)[:, :k] if k < n_cand else (
+        np.broadcast_to(np.arange(n_cand), (n_rows, n_cand))
+    )
+    part_d = np.take_along_axis(dists, part, axis=1)
+    order = np.argsort(part_d, axis=1, kind="stable")
+    top = np.take_along_axis(part, order, axis=1)
+    top_d = np.take_along_axis(part_d, order, axis=1)
+    neighbors[:, :k] = np.where(np.isfinite(top_d), cand_ids[top], -1)
+    distances[:, :k] = top_d
+    return neighbors, distances
+
+
+def _knn_rows(
+    rows: np.ndarray, X: np.ndarray, ids: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Lista completa de vizinhos das linhas `rows` (em blocos de CHUNK_ROWS)."""
+    neighbors = np.empty((len(rows), K_INDEX), dtype=np.int32)
+    distances = np.empty((len(rows), K_INDEX), dtype=np.float32)
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows[start : start + CHUNK_ROWS]
+        dists = _pairwise(X[chunk], X)
+        dists[np.arange(len(chunk)), chunk] = np.inf  # o próprio livro não conta
+        neighbors[start : start + len(chunk)], distances[start : start + len(chunk)] = (
+            _top_k(dists, ids)
+        )
+    return neighbors, distances
+
+
+def build_similarity_index(books: list[dict], version: str = "") -> SimilarityIndex:
+    """Reconstrução completa: ajusta encoders e calcula todas as listas."""
+    encoders, num_stats = _fit(books)
+    X = _encode_rows(books, encoders, num_stats)
+    ids = np.array([b["id"] for b in books], dtype=np.int32)
+    neighbors, distances = _knn_rows(np.arange(len(books)), X, ids)
+    return SimilarityIndex(
+        version=version,
+        ids=ids,
+        X=X,
+        neighbors=neighbors,
+        distances=distances,
+        fingerprints={b["id"]: _fingerprint(b) for b in books},
+        encoders=encoders,
+        num_stats=num_stats,
+    )
+
+
+def update_similarity_index(
+    index: SimilarityIndex, books: list[dict], version: str = ""
+) -> SimilarityIndex:
+    """
+    Novo índice a partir do anterior, recalculando só o que a mudança afeta.
+    O anterior não é alterado (pode estar sendo lido por outra requisição).
+    """
+    current = {b["id"]: b for b in books}
+    removed = [i for i in index.fingerprints if i not in current]
+    added = [b for i, b in current.items() if i not in index.fingerprints]
+    changed = [
+        b
+        for i, b in current.items()
+        if i in index.fingerprints and index.fingerprints[i] != _fingerprint(b)
+    ]
+    n_changes = len(removed) + len(added) + len(changed)
+    if n_changes == 0:
+        return SimilarityIndex(
+            version=version,
+            ids=index.ids,
+            X=index.X,
+            neighbors=index.neighbors,
+            distances=index.distances,
+            fingerprints=index.fingerprints,
+            encoders=index.encoders,
+            num_stats=index.num_stats,
+            changes=index.changes,
+        )
+    total = index.changes + n_changes
+    if total > max(REBUILD_MIN_CHANGES, REBUILD_FRACTION * len(books)):
+        return build_similarity_index(books, version)
+
+    encoders = {col: dict(enc) for col, enc in index.encoders.items()}
+    removed_set = set(removed)
+    keep = np.array(
+        [row for row, i in enumerate(index.ids) if int(i) not in removed_set],
+        dtype=np.int64,
+    )
+    ids = np.concatenate(
+        [index.ids[keep], np.array([b["id"] for b in added], dtype=np.int32)]
+    )
+    X = np.concatenate(
+        [index.X[keep], _encode_rows(added, encoders, index.num_stats)]
+    )
+    neighbors = np.concatenate(
+        [index.neighbors[keep], np.full((len(added), K_INDEX), -1, dtype=np.int32)]
+    )
+    distances = np.concatenate(
+        [index.distances[keep], np.full((len(added), K_INDEX), np.inf, dtype=np.float32)]
+    )
+    row_of = {int(i): row for row, i in enumerate(ids)}
+    if changed:
+        changed_rows = np.array([row_of[b["id"]] for b in changed])
+        X[changed_rows] = _encode_rows(changed, encoders, index.num_stats)
+
+    # Linhas mexidas: as alteradas/novas e as que apontavam para algo que
+    # saiu ou mudou de posição no espaço — essas têm a lista refeita inteira
+    touched_ids = np.array([b["id"] for b in added + changed], dtype=np.int32)
+    touched = np.array([row_of[int(i)] for i in touched_ids], dtype=np.int64)
+    stale_ids = np.array(removed + [b["id"] for b in changed], dtype=np.int32)
+    dirty = np.zeros(len(ids), dtype=bool)
+    dirty[touched] = True
+    if len(stale_ids):
+        dirty |= np.isin(neighbors, stale_ids).any(axis=1)
+
+    dirty_rows = np.flatnonzero(dirty)
+    if len(dirty_rows):
+        neighbors[dirty_rows], distances[dirty_rows] = _knn_rows(dirty_rows, X, ids)
+
+    # Demais linhas: só comparam com as tocadas e mesclam na lista atual
+    clean_rows = np.flatnonzero(~dirty)
+    if len(clean_rows) and len(touched):
+        for start in range(0, len(clean_rows), CHUNK_ROWS):
+            chunk = clean_rows[start : start + CHUNK_ROWS]
+            merged_d = np.concatenate(
+                [distances[chunk], _pairwise(X[chunk], X[touched])], axis=1
+            )
+            merged_ids = np.concatenate(
+                [neighbors[chunk], np.broadcast_to(touched_ids, (len(chunk), len(touched)))],
+                axis=1,
+            )
+            order = np.argsort(merged_d, axis=1, kind="stable")[:, :K_INDEX]
+            neighbors[chunk] = np.take_along_axis(merged_ids, order, axis=1)
+            distances[chunk] = np.take_along_axis(merged_d, order, axis=1)
+
+    fingerprints = {i: fp for i, fp in index.fingerprints.items() if i not in removed_set}
+    for b in added + changed:
+        fingerprints[b["id"]] = _fingerprint(b)
+    return SimilarityIndex(
+        version=version,
+        ids=ids,
+        X=X,
+        neighbors=neighbors,
+        distances=distances,
+        fingerprints=fingerprints,
+        encoders=encoders,
+        num_stats=index.num_stats,
+        changes=total,
+    )
+
+
+def rank_similar(
+    index: SimilarityIndex,
+    book_id: int,
+    k: int,
+    text_index: Optional[TextIndex] = None,
+) -> list[tuple[int, float, float, Optional[float]]]:
+    """
+    [(id, similaridade 0–1, distância, cosseno de texto ou None)], melhores
+    primeiro. Similaridade estrutural = 1 / (1 + distância); com texto dos
+    dois lados, mistura com o cosseno com peso TEXT_WEIGHT.
+    """
+    row = index.row_of.get(book_id)
+    if row is None:
+        return []
+    candidates = dict(index.lookup(book_id, K_INDEX))
+
+    query = text_index.vector(book_id) if text_index is not None else None
+    text_sims: dict[int, float] = {}
+    if query is not None:
+        sims = text_index.similarities(query)
+        sims[text_index.row_of[book_id]] = 0.0
+        top = np.argpartition(-sims, min(K_INDEX, len(sims)) - 1)[:K_INDEX]
+        for i in top:
+            if sims[i] > 0:
+                candidates.setdefault(int(text_index.ids[i]), None)
+        for cand_id in candidates:
+            if text_index.vector(cand_id) is not None:
+                text_sims[cand_id] = float(sims[text_index.row_of[cand_id]])
+
+    # Candidatos que vieram só do texto: distância calculada direto
+    missing = [i for i, d in candidates.items() if d is None and i in index.row_of]
+    if missing:
+        rows = np.array([index.row_of[i] for i in missing])
+        dists = np.linalg.norm(index.X[rows] - index.X[row], axis=1)
+        candidates.update(zip(missing, dists.astype(float)))
+
+    ranked = []
+    for cand_id, dist in candidates.items():
+        if dist is None:
+            continue
+        similarity = 1.0 / (1.0 + dist)
+        text_sim = text_sims.get(cand_id)
+        if text_sim is not None:
+            similarity = (1 - TEXT_WEIGHT) * similarity + TEXT_WEIGHT * text_sim
+        ranked.append((cand_id, similarity, dist, text_sim))
+    ranked.sort(key=lambda r: r[1], reverse=True)
+    return ranked[:k]
+
+
+# ── Índices por usuário ───────────────────────────────────────────────────────
+class SimilarityIndexCache:
+    """LRU de índices por usuário."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_INDEXES):
+        self.max_entries = max_entries
+        self._indexes: OrderedDict[str, SimilarityIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        self.full_builds = 0
+        self.incremental_updates = 0
+
+    def get(self, user_id: str) -> Optional[SimilarityIndex]:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+            return index
+
+    def put(self, user_id: str, index: SimilarityIndex):
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._indexes),
+                "full_builds": self.full_builds,
+                "incremental_updates": self.incremental_updates,
+            }
+
+
+similarity_indexes = SimilarityIndexCache()
+
+
+def _load_feature_rows(session: Session, user_id: str) -> list[dict]:
+    rows = session.exec(
+        select(*FEATURE_COLUMNS).where(Book.user_id == user_id).order_by(Book.id)
+    ).all()
+    keys = ["id", *CAT_COLS, *NUM_COLS]
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def get_similarity_index(session: Session, user_id: str) -> SimilarityIndex:
+    """Índice em dia com a biblioteca (atualizado incrementalmente se mudou)."""
+    version = library_version(session, user_id)
+    index = similarity_indexes.get(user_id)
+    if index is not None and index.version == version:
+        return index
+
+    books = _load_feature_rows(session, user_id)
+    if index is None:
+        index = build_similarity_index(books, version)
+        similarity_indexes.full_builds += 1
+    else:
+        index = update_similarity_index(index, books, version)
+        similarity_indexes.incremental_updates += 1
+    similarity_indexes.put(user_id, index)
+    return index
+
+
+def refresh_similarity_index(user_id: str) -> None:
+    """Background task das escritas: deixa o índice pronto antes da consulta."""
+    if similarity_indexes.get(user_id) is None:
+        return  # ninguém consultou ainda: monta sob demanda
+    with Session(engine) as session:
+        get_similarity_index(session, user_id)
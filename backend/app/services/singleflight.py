@@ -0,0 +1,156 @@
+"""
+singleflight.py — Deduplicação de chamadas idênticas em andamento.
+
+Se uma chamada com a mesma chave já está rodando (duplo clique em "sugerir",
+vários usuários adicionando o mesmo best-seller), as demais esperam o
+resultado dela em vez de repetir Google Books + Open Library + IA.
+Exceções também são repassadas a quem estava esperando.
+
+`SingleFlight` é para código síncrono (threads esperam num Event);
+`AsyncSingleFlight` faz o mesmo no event loop com uma Task compartilhada.
+
+Só compartilham uma chamada pedidos que a fariam com a mesma chave de API
+(uma chamada cobrada da chave de outro usuário, ou o erro dessa chave, não
+vaza); quem desligou o cache de IA (`ai_cache`) não compartilha nada.
+"""
+
+import asyncio
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+from app.core.circuit_breaker import key_fingerprint
+from .llm_cache import hash_payload, is_cache_enabled, normalize_text
+
+PROVIDER_KEY_FIELDS = ("groq_key", "gemini_key", "openai_key")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Optional[str], fn: Callable, *args, **kwargs) -> Any:
+        """Sem chave (None), executa direto, sem coalescer."""
+        if key is None:
+            with self._lock:
+                self.calls += 1
+                self.executions += 1
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if leader:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        # Cada chamador recebe sua cópia: ninguém altera o resultado do outro
+        return copy.deepcopy(call.result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+class AsyncSingleFlight:
+    """
+    Versão async: a primeira chamada cria a Task e as demais aguardam a mesma.
+    O resultado não é copiado (objetos imutáveis como CacheEntry).
+    """
+
+    def __init__(self):
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._tasks.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.create_task(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _t: self._tasks.pop(key, None))
+        # shield: se um cliente desconectar, o trabalho continua para os demais
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "in_flight": len(self._tasks),
+        }
+
+
+enrichment_flight = SingleFlight()
+
+
+def enrichment_key(
+    kind: str,
+    title: str,
+    author: Optional[str] = None,
+    class_categories: Optional[dict] = None,
+    custom_prompts: Optional[dict] = None,
+    api_keys: Optional[dict] = None,
+) -> Optional[str]:
+    """
+    Chave por (título, autor, taxonomia, prompts) normalizados + provedor
+    preferido e hash de cada chave de API do usuário: só coalescem pedidos que
+    usariam as mesmas chaves (quem usa as chaves do servidor compartilha).
+    None (não coalescer) se o usuário desligou o cache de IA.
+    """
+    if not is_cache_enabled(api_keys):
+        return None
+    api_keys = api_keys or {}
+    key_profile = [api_keys.get("ai_provider")] + [
+        f"{k}:{key_fingerprint(api_keys[k])}"
+        for k in PROVIDER_KEY_FIELDS
+        if api_keys.get(k)
+    ]
+    return "|".join(
+        [
+            kind,
+            normalize_text(title),
+            normalize_text(author),
+            hash_payload(class_categories),
+            hash_payload(custom_prompts),
+            hash_payload(key_profile),
+        ]
+    )
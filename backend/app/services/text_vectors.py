@@ -0,0 +1,213 @@
+"""
+text_vectors.py — Vetores TF-IDF (hashing) de título + motivação, por usuário.
+
+Tudo local, sem rede nem GPU:
+1. Tokenização simples (minúsculas, sem acentos, sem stopwords PT/EN),
+   unigramas + bigramas.
+2. Hashing trick: cada termo vira uma coluna em N_FEATURES (blake2b) — não há
+   vocabulário para guardar nem atualizar.
+3. TF sublinear (1 + log tf) × IDF da biblioteca do usuário; linhas
+   normalizadas (L2), então o produto escalar entre duas linhas é o cosseno.
+
+A matriz fica em CSR (scipy.sparse, float32) num LRU por usuário, com versão =
+hash de (id, título, motivação). Recomendações e livros parecidos misturam
+esse cosseno (produto esparso vetorizado) com a distância das features
+estruturadas.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sqlmodel import Session, select
+
+from app.models.book import Book
+from .llm_cache import normalize_text
+
+N_FEATURES = 1 << 18
+TEXT_COLS = ["title", "motivation"]
+MIN_TOKEN_LEN = 2
+MAX_CACHED_INDEXES = 256
+
+STOPWORDS = frozenset(
+    """
+    a ao aos as com como da das de do dos e em entre essa esse esta este eu
+    ja la mais mas me mesmo muito na nas nem no nos o os ou para pela pelas
+    pelo pelos por qual que se sem ser seu seus sua suas tambem te tem um uma
+    umas uns livro livros
+    an and are as at be by for from has in is it its of on or that the this
+    to was were with book books
+    """.split()
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    """Unigramas + bigramas (só entre palavras que sobraram do filtro)."""
+    words = [
+        w
+        for w in _TOKEN_RE.findall(normalize_text(text))
+        if len(w) >= MIN_TOKEN_LEN and w not in STOPWORDS
+    ]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+@lru_cache(maxsize=65536)
+def _feature(term: str) -> int:
+    digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % N_FEATURES
+
+
+def book_text(book: dict) -> str:
+    return " ".join(str(book.get(c) or "") for c in TEXT_COLS)
+
+
+def build_text_matrix(texts: list[str]) -> csr_matrix:
+    """TF-IDF (hashing) das linhas, normalizado em L2. Linhas sem termos ficam vazias."""
+    rows, cols, tfs = [], [], []
+    for row, text in enumerate(texts):
+        counts = Counter(_feature(t) for t in tokenize(text))
+        rows.extend([row] * len(counts))
+        cols.extend(counts.keys())
+        tfs.extend(counts.values())
+
+    n = len(texts)
+    if not cols:
+        return csr_matrix((n, N_FEATURES), dtype=np.float32)
+
+    cols = np.array(cols, dtype=np.int64)
+    uniq, inverse, df = np.unique(cols, return_inverse=True, return_counts=True)
+    idf = np.log((1 + n) / (1 + df)) + 1.0
+    data = (1.0 + np.log(np.array(tfs, dtype=np.float64))) * idf[inverse]
+    matrix = csr_matrix(
+        (data.astype(np.float32), (np.array(rows), cols)),
+        shape=(n, N_FEATURES),
+        dtype=np.float32,
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    # Divide cada valor pela norma da sua linha (direto no vetor `data`)
+    matrix.data /= np.repeat(norms, np.diff(matrix.indptr)).astype(np.float32)
+    return matrix
+
+
+@dataclass
+class TextIndex:
+    version: str
+    ids: np.ndarray  # int32 (n,)
+    matrix: csr_matrix  # float32 (n, N_FEATURES), linhas com norma 1 (ou vazias)
+
+    def __post_init__(self):
+        self.row_of = {int(book_id): row for row, book_id in enumerate(self.ids)}
+
+    def _rows(self, book_ids) -> np.ndarray:
+        return np.array(
+            [self.row_of.get(int(i), -1) for i in book_ids], dtype=np.int64
+        )
+
+    def vector(self, book_id: int) -> Optional[csr_matrix]:
+        row = self.row_of.get(book_id)
+        if row is None or self.matrix.indptr[row] == self.matrix.indptr[row + 1]:
+            return None
+        return self.matrix[row]
+
+    def profile(self, book_ids, weights) -> Optional[csr_matrix]:
+        """Média ponderada (normalizada) das linhas dos livros; None se não há texto."""
+        rows = self._rows(book_ids)
+        mask = rows >= 0
+        if not mask.any():
+            return None
+        w = np.asarray(weights, dtype=np.float32)[mask]
+        vec = csr_matrix(w.reshape(1, -1)) @ self.matrix[rows[mask]]
+        norm = math.sqrt(float(vec.multiply(vec).sum()))
+        if norm == 0:
+            return None
+        return vec / norm
+
+    def similarities(self, query: csr_matrix) -> np.ndarray:
+        """Cosseno de `query` (1 × N_FEATURES) com todas as linhas."""
+        return np.asarray((self.matrix @ query.T).todense()).ravel()
+
+    def similarities_for(self, query: csr_matrix, book_ids) -> np.ndarray:
+        """Cosseno com os livros pedidos; NaN para quem não tem texto."""
+        rows = self._rows(book_ids)
+        sims = np.full(len(rows), np.nan, dtype=np.float32)
+        has_row = rows >= 0
+        if has_row.any():
+            sub = self.matrix[rows[has_row]]
+            values = np.asarray((sub @ query.T).todense()).ravel()
+            values[np.diff(sub.indptr) == 0] = np.nan
+            sims[has_row] = values
+        return sims
+
+
+def build_text_index(books: list[dict], version: str = "") -> TextIndex:
+    return TextIndex(
+        version=version,
+        ids=np.array([b["id"] for b in books], dtype=np.int32),
+        matrix=build_text_matrix([book_text(b) for b in books]),
+    )
+
+
+# ── Índices por usuário ───────────────────────────────────────────────────────
+class TextIndexCache:
+    """LRU de índices de texto por usuário."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_INDEXES):
+        self.max_entries = max_entries
+        self._indexes: OrderedDict[str, TextIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, user_id: str, version: str) -> Optional[TextIndex]:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None or index.version != version:
+                return None
+            self._indexes.move_to_end(user_id)
+            return index
+
+    def put(self, user_id: str, index: TextIndex):
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            self.builds += 1
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._indexes), "builds": self.builds}
+
+
+text_indexes = TextIndexCache()
+
+
+def get_text_index(session: Session, user_id: str) -> TextIndex:
+    """Índice de texto do usuário (reconstruído só se título/motivação mudaram)."""
+    rows = session.exec(
+        select(Book.id, *(getattr(Book, c) for c in TEXT_COLS))
+        .where(Book.user_id == user_id)
+        .order_by(Book.id)
+    ).all()
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(repr(tuple(row)).encode("utf-8"))
+    version = digest.hexdigest()[:32]
+
+    index = text_indexes.get(user_id, version)
+    if index is None:
+        books = [dict(zip(["id", *TEXT_COLS], row)) for row in rows]
+        index = build_text_index(books, version)
+        text_indexes.put(user_id, index)
+    return index
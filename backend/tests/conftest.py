@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Os módulos da aplicação leem o ambiente no import: banco e caches locais
+_tmp = Path(tempfile.mkdtemp(prefix="bookstack-tests-"))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp / 'test.db'}")
+os.environ.setdefault("IMAGE_CACHE_DIR", str(_tmp / "images"))
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,71 @@
+import json
+
+from app.services.ai_batch import get_ai_batch_classification
+
+MAPPING = {"Ficção": ["Romance", "Fantasia"], "Tecnologia": ["Programação"]}
+NO_CACHE = {"ai_cache": False}
+
+
+def _prompt_ids(prompt: str) -> list[int]:
+    return [
+        json.loads(line)["id"]
+        for line in prompt.splitlines()
+        if line.startswith('{"id"')
+    ]
+
+
+def test_batch_with_fake_provider():
+    prompts = []
+
+    def fake(prompt, system_prompt, api_keys=None):
+        prompts.append(prompt)
+        return {
+            "results": [
+                {"id": i, "book_class": "Ficção", "category": "Romance"}
+                for i in _prompt_ids(prompt)
+            ]
+        }
+
+    books = [{"title": "Dom Casmurro"}, {"title": "O Cortiço", "author": "Aluísio"}]
+    results = get_ai_batch_classification(
+        books, NO_CACHE, MAPPING, providers=[("fake", fake)]
+    )
+
+    assert len(prompts) == 1
+    assert (
+        results
+        == [{"book_class": "Ficção", "category": "Romance", "type": "Não Técnico"}] * 2
+    )
+
+
+def test_batch_retries_only_invalid_entries():
+    rounds = []
+
+    def fake(prompt, system_prompt, api_keys=None):
+        ids = _prompt_ids(prompt)
+        rounds.append(ids)
+        # Primeira rodada: categoria inválida para o id 1
+        category = "Fantasia" if len(rounds) > 1 else "Inexistente"
+        return {
+            "results": [
+                {
+                    "id": i,
+                    "book_class": "Tecnologia" if i == 0 else "Ficção",
+                    "category": "Programação" if i == 0 else category,
+                    "type": "Técnico",
+                }
+                for i in ids
+            ]
+        }
+
+    results = get_ai_batch_classification(
+        [{"title": "SICP"}, {"title": "O Hobbit"}, {"description": "sem título"}],
+        NO_CACHE,
+        MAPPING,
+        providers=[("fake", fake)],
+    )
+
+    assert rounds == [[0, 1], [1]]
+    assert results[0]["category"] == "Programação"
+    assert results[1]["category"] == "Fantasia"
+    assert "error" in results[2]
@@ -0,0 +1,83 @@
+from app.core import circuit_breaker
+from app.core.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BreakerRegistry,
+    CircuitBreaker,
+    key_fingerprint,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_open_half_open_close(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    breaker = CircuitBreaker("dep", failure_threshold=2, recovery_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # só uma chamada de teste por vez
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_failure_reopens(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    breaker = CircuitBreaker("dep", failure_threshold=1, recovery_timeout=5)
+    breaker.record_failure()
+    clock.now += 5
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_release_frees_half_open_probe(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    breaker = CircuitBreaker("dep", failure_threshold=1, recovery_timeout=5)
+    breaker.record_failure()
+    clock.now += 5
+    assert breaker.allow()
+    breaker.release()  # erro da chave (ex.: 401): não conta, libera a vaga
+    assert breaker.allow()
+
+
+def test_registry_is_bounded_and_keeps_open_breakers():
+    registry = BreakerRegistry(failure_threshold=1, max_breakers=2)
+    bad = registry.for_key("llm_groq", "bad-key")
+    bad.record_failure()
+    registry.for_key("llm_groq", "key-1")
+    registry.for_key("llm_groq", "key-2")
+
+    assert registry.for_key("llm_groq", "bad-key") is bad
+    assert registry.snapshot()["llm_groq"]["breakers"] == 2
+
+
+def test_snapshot_is_per_dependency_without_fingerprints():
+    registry = BreakerRegistry(failure_threshold=1)
+    registry.for_key("llm_groq", "key-1").record_failure()
+    registry.for_key("llm_groq", "key-2")
+    registry.get("google_books")
+
+    snapshot = registry.snapshot()
+    assert set(snapshot) == {"llm_groq", "google_books"}
+    assert snapshot["llm_groq"]["state"] == OPEN
+    assert snapshot["llm_groq"]["open"] == 1
+    assert snapshot["google_books"]["state"] == CLOSED
+    assert key_fingerprint("key-1") not in repr(snapshot)
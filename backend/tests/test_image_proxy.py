@@ -0,0 +1,86 @@
+import io
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api.v1.endpoints import system
+from app.services import cover_fetch
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Servidor de capas falso; conta as requisições por URL."""
+    buf = io.BytesIO()
+    Image.new("RGB", (60, 90), "red").save(buf, "JPEG")
+    hits = []
+
+    def handler(request):
+        hits.append(str(request.url))
+        return httpx.Response(
+            200, content=buf.getvalue(), headers={"Content-Type": "image/jpeg"}
+        )
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(
+        cover_fetch, "_get_http_client", lambda: httpx.AsyncClient(transport=transport)
+    )
+    return hits
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(system.router)
+    return TestClient(app)
+
+
+def test_etag_revalidation_returns_304(client, upstream):
+    url = "http://covers.test/etag.jpg"
+    first = client.get("/proxy/image", params={"url": url})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    second = client.get(
+        "/proxy/image", params={"url": url}, headers={"If-None-Match": etag}
+    )
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+    assert upstream == [url]  # a revalidação não vai ao upstream
+
+
+def test_weak_and_listed_etags_match(client, upstream):
+    url = "http://covers.test/weak.jpg"
+    params = {"url": url, "w": 40}
+    etag = client.get("/proxy/image", params=params).headers["etag"]
+
+    listed = f'"outro", W/{etag}'
+    r = client.get("/proxy/image", params=params, headers={"If-None-Match": listed})
+    assert r.status_code == 304
+    assert "immutable" in r.headers["cache-control"]
+
+
+def test_stale_etag_gets_full_response(client, upstream):
+    url = "http://covers.test/stale.jpg"
+    r = client.get(
+        "/proxy/image", params={"url": url}, headers={"If-None-Match": '"velho"'}
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "image/jpeg"
+    assert r.content
+
+
+def test_if_modified_since(client, upstream):
+    url = "http://covers.test/ims.jpg"
+    last_modified = client.get("/proxy/image", params={"url": url}).headers[
+        "last-modified"
+    ]
+    r = client.get(
+        "/proxy/image",
+        params={"url": url},
+        headers={"If-Modified-Since": last_modified},
+    )
+    assert r.status_code == 304
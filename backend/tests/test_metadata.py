@@ -0,0 +1,57 @@
+from app.services import metadata
+
+LOCAL = {
+    "source": "Catálogo local",
+    "author": "Machado de Assis",
+    "year": 1899,
+    "cover_image": "https://covers.openlibrary.org/b/id/1-L.jpg",
+    "original_title": "Dom Casmurro",
+    "average_rating": 4.1,
+    "ratings_count": 30,
+}
+GOOGLE = {
+    "author": "Machado de Assis",
+    "year": 2016,
+    "description": "Bentinho e Capitu.",
+    "subtitle": "",
+    "cover_image": None,
+    "average_rating": None,
+    "ratings_count": None,
+}
+
+
+def _patch(monkeypatch, local, google):
+    calls = []
+    monkeypatch.setattr(metadata, "lookup_local_catalog", lambda t, a=None: local)
+
+    def fetch(title, author=None):
+        calls.append(title)
+        return dict(google) if google else None
+
+    monkeypatch.setattr(metadata, "_fetch_google_books", fetch)
+    return calls
+
+
+def test_catalog_hit_skips_google(monkeypatch):
+    calls = _patch(monkeypatch, LOCAL, GOOGLE)
+    data = metadata.get_google_books_data(
+        "Dom Casmurro", fields=("year", "cover_image")
+    )
+    assert calls == []
+    assert data["year"] == 1899 and data["description"] == ""
+
+
+def test_description_goes_remote_and_merges_catalog(monkeypatch):
+    calls = _patch(monkeypatch, LOCAL, GOOGLE)
+    data = metadata.get_google_books_data("Dom Casmurro")
+    assert calls == ["Dom Casmurro"]
+    assert data["description"] == "Bentinho e Capitu."
+    # Ano da 1ª publicação e capa vêm do catálogo; rating completa o Google
+    assert data["year"] == 1899
+    assert data["cover_image"] == LOCAL["cover_image"]
+    assert data["average_rating"] == 4.1
+
+
+def test_catalog_miss_uses_google_only(monkeypatch):
+    _patch(monkeypatch, None, GOOGLE)
+    assert metadata.get_google_books_data("Dom Casmurro")["year"] == 2016
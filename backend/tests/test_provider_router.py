@@ -0,0 +1,67 @@
+import threading
+import time
+
+from app.services.provider_router import ProviderRouter
+
+
+def ok(label):
+    return lambda prompt, system_prompt, api_keys=None: {"answer": label}
+
+
+def fail(prompt, system_prompt, api_keys=None):
+    return {"error": "quota"}
+
+
+def slow(label, seconds, release=None):
+    def _call(prompt, system_prompt, api_keys=None):
+        if release is not None:
+            release.wait(seconds)
+        else:
+            time.sleep(seconds)
+        return {"answer": label}
+
+    return _call
+
+
+def test_preferred_answers_first():
+    router = ProviderRouter(hedge_enabled=False)
+    routed = router.route([("r1_a", ok("a")), ("r1_b", ok("b"))], "p", "s")
+    assert (routed.provider, routed.reason) == ("r1_a", "preferred")
+
+
+def test_falls_back_in_order():
+    router = ProviderRouter(hedge_enabled=False)
+    routed = router.route([("r2_a", fail), ("r2_b", fail), ("r2_c", ok("c"))], "p", "s")
+    assert (routed.provider, routed.reason) == ("r2_c", "fallback")
+    assert [e.split(":")[0] for e in routed.errors] == ["r2_a", "r2_b"]
+
+
+def test_unhealthy_preferred_goes_last():
+    router = ProviderRouter(hedge_enabled=False)
+    for _ in range(5):
+        router.record(router.scope("r3_a"), 0.1, False)
+    assert router.order(["r3_a", "r3_b"]) == ["r3_b", "r3_a"]
+
+
+def test_hedge_wins_over_slow_primary():
+    router = ProviderRouter(hedge_min_delay=0.05)
+    release = threading.Event()
+    try:
+        routed = router.route(
+            [("r4_a", slow("a", 5, release)), ("r4_b", ok("b"))], "p", "s"
+        )
+    finally:
+        release.set()
+    assert (routed.provider, routed.reason) == ("r4_b", "hedge")
+
+
+def test_saturated_provider_is_skipped():
+    router = ProviderRouter(hedge_enabled=False, max_inflight_per_provider=1)
+    _, slots = router._provider_slots("r5_a")
+    slots.acquire()  # uma chamada travada ocupando a única vaga
+    try:
+        routed = router.route([("r5_a", ok("a")), ("r5_b", ok("b"))], "p", "s")
+    finally:
+        slots.release()
+    assert routed.provider == "r5_b"
+    assert routed.errors[0].startswith("r5_a:")
@@ -11,7 +11,7 @@ import {
 } from "lucide-react";
 import { useNavigate } from "react-router-dom";
 import { useToast } from "../../context/ToastContext";
-import { api } from "../../services/api";
+import { api, streamSuggestion } from "../../services/api";
 import {
   DEFAULT_CLASS_CATEGORIES,
   DEFAULT_AVAILABILITY_OPTIONS,
@@ -362,11 +362,40 @@ export default function BookForm({
     setAiLoading(true);
     setSuggestedCoverUrl(null);
     try {
-      const res = await api.post("/books/suggest", {
+      const payload = {
         title: formData.title,
         author: formData.author || null,
-      });
-      const suggestion = res.data;
+      };
+
+      // Progressive fill: each graph node streams its fields as soon as it finishes
+      const STREAMED_FIELDS = [
+        "author",
+        "year",
+        "cover_image",
+        "original_title",
+        "google_rating",
+        "book_class",
+        "type",
+        "category",
+        "motivation",
+      ];
+      let suggestion;
+      try {
+        suggestion = await streamSuggestion(payload, (_node, delta) => {
+          if (!delta || delta.error) return;
+          setFormData((prev) => {
+            const next = { ...prev };
+            STREAMED_FIELDS.forEach((field) => {
+              if (delta[field]) next[field] = delta[field];
+            });
+            return next;
+          });
+        });
+      } catch (streamErr) {
+        console.warn("Streaming indisponível, usando /books/suggest:", streamErr);
+        const res = await api.post("/books/suggest", payload);
+        suggestion = res.data;
+      }
 
       if (suggestion) {
         if (suggestion.error) {
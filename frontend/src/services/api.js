@@ -27,3 +27,58 @@ api.interceptors.response.use(
     return Promise.reject(error);
   }
 );
+
+// Streams /books/suggest/stream (Server-Sent Events over POST).
+// Calls onEvent(eventName, data) for each node delta and resolves with the
+// payload of the final "done" event.
+export async function streamSuggestion(payload, onEvent) {
+  const {
+    data: { session },
+  } = await supabase.auth.getSession();
+
+  const response = await fetch(`${API_URL}/books/suggest/stream`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      Accept: "text/event-stream",
+      ...(session?.access_token
+        ? { Authorization: `Bearer ${session.access_token}` }
+        : {}),
+    },
+    body: JSON.stringify(payload),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Streaming indisponível (${response.status})`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let finalResult = null;
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let eventName = "message";
+      let dataText = "";
+      for (const line of rawEvent.split("\n")) {
+        if (line.startsWith("event:")) eventName = line.slice(6).trim();
+        else if (line.startsWith("data:")) dataText += line.slice(5).trim();
+      }
+      const data = dataText ? JSON.parse(dataText) : {};
+
+      if (eventName === "done") finalResult = data;
+      else if (onEvent) onEvent(eventName, data);
+    }
+  }
+
+  return finalResult;
+}